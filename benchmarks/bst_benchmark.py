@@ -0,0 +1,59 @@
+"""Load sequential patient ids into PatientBST and time the core operations.
+
+Run from the repository root:
+
+    python -m benchmarks.bst_benchmark [count]
+"""
+import random
+import sys
+import time
+
+from ds.bst import PatientBST
+
+
+def make_patient(patient_id):
+    return {'id': patient_id, 'name': f"Patient {patient_id}", 'age': 30,
+            'gender': 'F', 'location': 'Nairobi', 'phone': '0700000000',
+            'time': '09:00', 'is_emergency': False}
+
+
+def timed(label, count, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed else float('inf')
+    print(f"{label:<24}{elapsed:>10.3f}s {rate:>14,.0f} ops/s")
+
+
+def main(count=1_000_000):
+    tree = PatientBST(load=False)
+    patients = [make_patient(i) for i in range(1, count + 1)]
+
+    def insert_all():
+        for patient in patients:
+            tree.insert(patient)
+
+    probes = random.Random(42).sample(range(1, count + 1), min(count, 100_000))
+
+    def search_all():
+        for patient_id in probes:
+            assert tree.search(patient_id) is not None
+
+    def delete_some():
+        for patient_id in probes[:len(probes) // 2]:
+            tree.delete(patient_id)
+
+    def bulk_load():
+        PatientBST(load=False).build_from_sorted(patients)
+
+    print(f"PatientBST with {count:,} sequential ids")
+    timed("bulk load (sorted)", count, bulk_load)
+    timed("insert (sequential)", count, insert_all)
+    print(f"{'height':<24}{tree.height():>10}")
+    timed("search (random)", len(probes), search_all)
+    timed("delete (random)", len(probes) // 2, delete_some)
+    print(f"{'height after deletes':<24}{tree.height():>10}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,93 @@
+"""Compare writer/reader throughput with SQLite's defaults and with the
+tuned settings from db.database.DB_SETTINGS.
+
+One writer thread inserts single-row appointments (one commit each, like
+AppointmentWindow) while reader threads poll the table the way the display
+window does. Run from the repository root:
+
+    python -m benchmarks.concurrency_benchmark [seconds] [readers]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from db import database
+from db.database import close_connection, configure_db, get_connection, init_db, set_engine
+from db.storage import FileEngine
+from db.importer import INSERT_APPOINTMENT
+
+PROFILES = {
+    'default': {'journal_mode': 'delete', 'synchronous': 'full', 'busy_timeout': 0,
+                'cache_size': None, 'mmap_size': None},
+    'tuned': dict(database.DB_SETTINGS),
+}
+
+
+def run_profile(settings, seconds, readers):
+    stop = threading.Event()
+    counts = {'writes': 0, 'reads': 0, 'locked': 0}
+    lock = threading.Lock()
+
+    def count(key):
+        with lock:
+            counts[key] += 1
+
+    def writer():
+        conn = get_connection()
+        while not stop.is_set():
+            try:
+                conn.execute(INSERT_APPOINTMENT,
+                             ('Bench', 30, 'F', 'Nairobi', '09:00', '0700000000', 0, None))
+                count('writes')
+            except sqlite3.OperationalError:
+                count('locked')
+        close_connection()
+
+    def reader():
+        conn = get_connection()
+        while not stop.is_set():
+            try:
+                conn.execute("SELECT COUNT(*) FROM appointments").fetchone()
+                conn.execute("SELECT * FROM appointments ORDER BY id DESC LIMIT 50").fetchall()
+                count('reads')
+            except sqlite3.OperationalError:
+                count('locked')
+        close_connection()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        set_engine(FileEngine(os.path.join(tmp, 'bench.db')))
+        init_db(**settings)
+        close_connection()
+
+        threads = [threading.Thread(target=writer)]
+        threads += [threading.Thread(target=reader) for _ in range(readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    return {key: value / seconds for key, value in counts.items()}
+
+
+def main(seconds=5.0, readers=2):
+    original_engine, original_settings = database.get_engine(), dict(database.DB_SETTINGS)
+    print(f"{seconds:g}s per profile, 1 writer, {readers} readers")
+    print(f"{'profile':<10}{'writes/s':>12}{'reads/s':>12}{'locked/s':>12}")
+    try:
+        for name, settings in PROFILES.items():
+            result = run_profile(settings, seconds, readers)
+            print(f"{name:<10}{result['writes']:>12,.0f}{result['reads']:>12,.0f}"
+                  f"{result['locked']:>12,.1f}")
+    finally:
+        set_engine(original_engine)
+        configure_db(**original_settings)
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 5.0,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 2)
@@ -0,0 +1,73 @@
+"""Measure memory held by PatientRepository with and without lazy loading.
+
+Imports synthetic patients into an in-memory database, then builds an
+eager repository (full PatientRecords) and a lazy one (records with only
+the id, name, phone, location and scheduled_at). Both include every
+index the repository keeps: hash table, AVL tree, name index, key index
+and time slots. For comparison, 'dicts' is the layout from before the
+repository: a hash table and a tree each holding an eight-key dict per
+row. Run from the repository root:
+
+    python -m benchmarks.memory_benchmark [count]
+"""
+import gc
+import sys
+import tracemalloc
+
+from benchmarks.data import generate_patients
+from db.database import PATIENT_COLUMNS, close_connection, fetch_query, get_engine, init_db, set_engine
+from db.importer import import_appointments
+from db.repository import PatientRepository
+from db.storage import MemoryEngine
+
+
+def as_dict(row):
+    return {'id': row[0], 'name': row[1], 'age': row[2], 'gender': row[3],
+            'location': row[4], 'phone': row[5], 'time': row[6],
+            'is_emergency': bool(row[7])}
+
+
+def build_dicts():
+    rows = fetch_query(f"SELECT {PATIENT_COLUMNS} FROM appointments ORDER BY id")
+    return ({row[0]: as_dict(row) for row in rows},
+            [as_dict(row) for row in rows])
+
+
+LAYOUTS = {
+    'dicts': build_dicts,
+    # snapshot_path='' reads the table; a snapshot would not change the
+    # memory held, only how it is loaded
+    'eager': lambda: PatientRepository(lazy=False, snapshot_path=''),
+    'lazy': lambda: PatientRepository(lazy=True, snapshot_path=''),
+}
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    held = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return current
+
+
+def main(count=200_000):
+    original = get_engine()
+    set_engine(MemoryEngine('memory_benchmark'))
+    try:
+        init_db()
+        import_appointments(generate_patients(count))
+        used = {name: measure(build) for name, build in LAYOUTS.items()}
+    finally:
+        close_connection()
+        set_engine(original)
+    print(f"{count:,} patients")
+    for name, size in used.items():
+        print(f"{name:<8}{size / 2**20:>10.1f} MiB   ({size / used['dicts']:.2f}x dicts, "
+              f"{size / used['eager']:.2f}x eager)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
@@ -0,0 +1,502 @@
+"""Benchmark suite for the ds package and the database layer.
+
+Run from the repository root:
+
+    python -m benchmarks.run [--size 10000] [--output results.json]
+                             [--baseline benchmarks/baseline.json] [--save-baseline]
+
+Every case is timed `--repeat` times on freshly built data and the best
+run is kept, with garbage collection off while timing. Results are
+written as JSON. Given a baseline, any case whose ops/s fell by more than
+`--tolerance` exits with status 1, so a regression fails loudly.
+Baselines depend on the machine: save one on the machine that compares.
+"""
+import argparse
+import fnmatch
+import gc
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from benchmarks.data import generate_patients, generate_records
+from db.cache import query_cache
+from db.database import (PATIENT_COLUMNS, close_connection, execute_query, fetch_query, get_engine, init_db,
+                         search_appointments, set_engine)
+from db.importer import INSERT_APPOINTMENT, import_appointments
+from db.repository import PatientRepository
+from db.storage import FileEngine, MemoryEngine
+from ds.bst import PatientBST
+from ds.hash_index import PatientKeyIndex
+from ds.hash_table import PatientHashTable
+from ds.queue import PatientQueue
+from ds.scheduler import AgingScheduler
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# Most operations a single case times, so large sizes stay quick to run
+MAX_OPS = 100_000
+
+# name -> (group, function). A case function gets the context and returns
+# (operation count, timed callable); everything before the callable runs
+# untimed.
+CASES = {}
+
+
+def case(name, group='ds'):
+    def register(func):
+        CASES[name] = (group, func)
+        return func
+    return register
+
+
+class Context:
+    def __init__(self, size, seed):
+        self.size = size
+        self.seed = seed
+        self._records = None
+        self.ops = min(size, MAX_OPS)
+        # Whole-table cases go over small tables several times, so that
+        # they run long enough to time reliably
+        self.passes = max(1, MAX_OPS // size)
+        # Scratch directory of the db cases
+        self.directory = None
+
+    @property
+    def records(self):
+        # Built on first use and kept for every ds case: about 0.4 KB per
+        # patient. The db cases stream their patients into the database,
+        # so running only those (--cases 'db.*') never builds the list.
+        if self._records is None:
+            self._records = generate_records(self.size, self.seed)
+        return self._records
+
+    def release(self):
+        self._records = None
+
+    def sample_ids(self, count, salt=0):
+        rng = random.Random(self.seed + salt)
+        return [rng.randint(1, self.size) for _ in range(count)]
+
+
+def _filled_tree(context):
+    tree = PatientBST(load=False)
+    tree.build_from_sorted(context.records)
+    return tree
+
+
+@case('bst.insert.sequential')
+def bst_insert_sequential(context):
+    tree = PatientBST(load=False)
+    records = context.records[:context.ops]
+
+    def run():
+        for record in records:
+            tree.insert(record)
+    return len(records), run
+
+
+@case('bst.insert.random')
+def bst_insert_random(context):
+    tree = PatientBST(load=False)
+    records = context.records[:context.ops]
+    random.Random(context.seed).shuffle(records)
+
+    def run():
+        for record in records:
+            tree.insert(record)
+    return len(records), run
+
+
+@case('bst.search.random')
+def bst_search_random(context):
+    tree = _filled_tree(context)
+    ids = context.sample_ids(context.ops)
+
+    def run():
+        for patient_id in ids:
+            tree.search(patient_id)
+    return len(ids), run
+
+
+@case('bst.select.random')
+def bst_select_random(context):
+    tree = _filled_tree(context)
+    positions = [patient_id - 1 for patient_id in context.sample_ids(context.ops)]
+
+    def run():
+        for index in positions:
+            tree.select(index)
+    return len(positions), run
+
+
+@case('bst.rank.random')
+def bst_rank_random(context):
+    tree = _filled_tree(context)
+    ids = context.sample_ids(context.ops)
+
+    def run():
+        for patient_id in ids:
+            tree.rank(patient_id)
+    return len(ids), run
+
+
+@case('bst.iter_from')
+def bst_iter_from(context):
+    # Pages of 100 from random starting ids
+    tree = _filled_tree(context)
+    starts = context.sample_ids(max(1, context.ops // 100))
+
+    def run():
+        for patient_id in starts:
+            for _, _ in zip(range(100), tree.iter_from(patient_id)):
+                pass
+    return len(starts) * 100, run
+
+
+@case('bst.delete.sequential')
+def bst_delete_sequential(context):
+    tree = _filled_tree(context)
+    ids = list(range(1, context.ops + 1))
+
+    def run():
+        for patient_id in ids:
+            tree.delete(patient_id)
+    return len(ids), run
+
+
+@case('bst.delete.random')
+def bst_delete_random(context):
+    tree = _filled_tree(context)
+    ids = random.Random(context.seed).sample(range(1, context.size + 1), context.ops)
+
+    def run():
+        for patient_id in ids:
+            tree.delete(patient_id)
+    return len(ids), run
+
+
+@case('bst.build_sorted')
+def bst_build_sorted(context):
+    records = context.records
+
+    def run():
+        PatientBST(load=False).build_from_sorted(records)
+    return len(records), run
+
+
+@case('hash.lookup')
+def hash_lookup(context):
+    table = PatientHashTable(load=False)
+    table.build_from_records(context.records)
+    ids = context.sample_ids(context.ops)
+
+    def run():
+        for patient_id in ids:
+            table.get_patient(patient_id)
+    return len(ids), run
+
+
+@case('keys.build')
+def keys_build(context):
+    records = context.records
+
+    def run():
+        PatientKeyIndex(records)
+    return len(records), run
+
+
+@case('keys.duplicates')
+def keys_duplicates(context):
+    index = PatientKeyIndex(context.records)
+    patients = [context.records[patient_id - 1] for patient_id in context.sample_ids(context.ops)]
+
+    def run():
+        for patient in patients:
+            index.duplicates(patient.name, patient.phone)
+    return len(patients), run
+
+
+def _queue_mix(context, scheduler):
+    # Two arrivals for every patient called, a tenth of them emergencies
+    queue = PatientQueue(scheduler=scheduler)
+    rng = random.Random(context.seed)
+    steps = [(rng.random() < 0.1, rng.random() < 1 / 3) for _ in range(context.ops)]
+
+    def run():
+        for patient_id, (emergency, call) in enumerate(steps, start=1):
+            if call:
+                queue.get_next_patient()
+            else:
+                queue.add_patient('Patient', emergency, patient_id)
+    return len(steps), run
+
+
+@case('queue.mixed.strict')
+def queue_mixed_strict(context):
+    return _queue_mix(context, None)
+
+
+@case('queue.mixed.aging')
+def queue_mixed_aging(context):
+    return _queue_mix(context, AgingScheduler(levels=2))
+
+
+@case('db.hash_load', group='db')
+def db_hash_load(context):
+    def run():
+        for _ in range(context.passes):
+            PatientHashTable()
+    return context.size * context.passes, run
+
+
+@case('db.repository_load.scan', group='db')
+def db_repository_load_scan(context):
+    def run():
+        PatientRepository(snapshot_path='')
+    return context.size, run
+
+
+@case('db.repository_load.snapshot', group='db')
+def db_repository_load_snapshot(context):
+    path = os.path.join(context.directory, 'bench.idx')
+    PatientRepository(snapshot_path=path).save_snapshot()
+
+    def run():
+        PatientRepository(snapshot_path=path)
+    return context.size, run
+
+
+@case('db.fetch_query.by_id', group='db')
+def db_fetch_by_id(context):
+    ids = _live_ids(context, min(context.ops, 20_000))
+
+    def run():
+        for patient_id in ids:
+            fetch_query(f"SELECT {PATIENT_COLUMNS} FROM appointments WHERE id = ?", (patient_id,))
+    return len(ids), run
+
+
+@case('db.fetch_query.page', group='db')
+def db_fetch_page(context):
+    # Keyset pages of 100 rows through the whole table
+    def run():
+        for _ in range(context.passes):
+            after = 0
+            while True:
+                rows = fetch_query(
+                    f"SELECT {PATIENT_COLUMNS} FROM appointments WHERE id > ? ORDER BY id LIMIT 100",
+                    (after,))
+                if not rows:
+                    break
+                after = rows[-1][0]
+    return context.size * context.passes, run
+
+
+def _search_terms(context, count):
+    # The first page of a search for a few dozen names, each looked up
+    # again and again, as in a busy management window
+    rng = random.Random(context.seed)
+    names = [p['name'].split()[0] for p in generate_patients(50, context.seed + 2)]
+    return [rng.choice(names) for _ in range(count)]
+
+
+@case('db.search.uncached', group='db')
+def db_search_uncached(context):
+    terms = _search_terms(context, min(context.ops, 2_000))
+
+    def run():
+        for term in terms:
+            query_cache.clear()
+            search_appointments(term, limit=50)
+    return len(terms), run
+
+
+@case('db.search.cached', group='db')
+def db_search_cached(context):
+    terms = _search_terms(context, min(context.ops, 2_000))
+
+    def run():
+        query_cache.clear()
+        for term in terms:
+            search_appointments(term, limit=50)
+    return len(terms), run
+
+
+@case('db.execute_query.update', group='db')
+def db_execute_update(context):
+    # Each update commits on its own, as the windows' writes do
+    ids = _live_ids(context, min(context.ops, 2_000))
+
+    def run():
+        for patient_id in ids:
+            execute_query("UPDATE appointments SET age = age + 1 WHERE id = ?", (patient_id,))
+    return len(ids), run
+
+
+@case('db.execute_query.insert', group='db')
+def db_execute_insert(context):
+    rows = [(p['name'], p['age'], p['gender'], p['location'], p['time'], p['phone'],
+             int(p['is_emergency']), None)
+            for p in generate_patients(min(context.ops, 2_000), context.seed + 1)]
+
+    def run():
+        for row in rows:
+            execute_query(INSERT_APPOINTMENT, row)
+    return len(rows), run
+
+
+@case('db.import', group='db')
+def db_import(context):
+    # Appends to the live table, as a real import would. Registered last
+    # so the other db cases see exactly `size` rows plus their own inserts.
+    patients = list(generate_patients(context.size, context.seed))
+
+    def run():
+        import_appointments(patients)
+    return len(patients), run
+
+
+def _live_ids(context, count):
+    ids = [row[0] for row in fetch_query("SELECT id FROM appointments ORDER BY id") or []]
+    rng = random.Random(context.seed)
+    return [rng.choice(ids) for _ in range(count)] if ids else []
+
+
+def measure(func, context, repeat):
+    best = None
+    ops = 0
+    for _ in range(repeat):
+        ops, run = func(context)
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return {'ops': ops, 'seconds': best, 'ops_per_sec': ops / best if best else float('inf')}
+
+
+def run_suite(size, seed=42, repeat=5, pattern='*', engine='file'):
+    context = Context(size, seed)
+    selected = [(name, group, func) for name, (group, func) in CASES.items()
+                if fnmatch.fnmatch(name, pattern)]
+    results = {}
+    for name, group, func in selected:
+        if group == 'ds':
+            results[name] = measure(func, context, repeat)
+            print(_row(name, results[name]), flush=True)
+    # Free the records before the db cases load their own copies
+    context.release()
+
+    db_cases = [(name, func) for name, group, func in selected if group == 'db']
+    if db_cases:
+        original = get_engine()
+        with tempfile.TemporaryDirectory() as tmp:
+            context.directory = tmp
+            set_engine(FileEngine(os.path.join(tmp, 'bench.db')) if engine == 'file'
+                       else MemoryEngine('benchmark'))
+            try:
+                init_db()
+                import_appointments(generate_patients(size, seed))
+                for name, func in db_cases:
+                    results[name] = measure(func, context, repeat)
+                    print(_row(name, results[name]), flush=True)
+            finally:
+                close_connection()
+                set_engine(original)
+
+    return {
+        'size': size, 'seed': seed, 'repeat': repeat, 'engine': engine,
+        'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+        'machine': platform.machine(), 'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+
+def _row(name, result):
+    return f"{name:<28}{result['ops']:>10,}{result['seconds']:>11.4f}s{result['ops_per_sec']:>15,.0f} ops/s"
+
+
+def compare(report, baseline, tolerance):
+    """Print ops/s against the baseline; return the cases slower than tolerance allows."""
+    if baseline.get('size') != report['size']:
+        print(f"Warning: baseline was run with --size {baseline.get('size')}, "
+              f"this run used {report['size']}")
+    regressions = []
+    print(f"\n{'case':<28}{'baseline':>15}{'now':>15}{'change':>10}")
+    for name, result in report['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            print(f"{name:<28}{'-':>15}{result['ops_per_sec']:>15,.0f}{'new':>10}")
+            continue
+        change = result['ops_per_sec'] / before['ops_per_sec'] - 1
+        flag = ''
+        if change < -tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<28}{before['ops_per_sec']:>15,.0f}{result['ops_per_sec']:>15,.0f}"
+              f"{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ds package and database layer.")
+    parser.add_argument('--size', type=int, default=10_000,
+                        help="patients to generate, e.g. 10000 to 10000000 (default 10000); "
+                             "the ds cases keep them all in memory, about 4 GB for 10000000")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=5, help="runs per case; the best is kept")
+    parser.add_argument('--cases', default='*', help="glob of case names, e.g. 'bst.*'")
+    parser.add_argument('--engine', choices=('file', 'memory'), default='file',
+                        help="storage engine for the db cases")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--baseline', default=None,
+                        help=f"compare against this results file (default {DEFAULT_BASELINE} "
+                             "if it exists)")
+    parser.add_argument('--tolerance', type=float, default=0.3,
+                        help="allowed drop in ops/s before a case fails (default 0.3)")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="store these results as the baseline instead of comparing")
+    args = parser.parse_args(argv)
+
+    print(f"{len(CASES)} cases, {args.size:,} patients, best of {args.repeat}")
+    report = run_suite(args.size, args.seed, args.repeat, args.cases, args.engine)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    baseline_path = args.baseline or DEFAULT_BASELINE
+    if args.save_baseline:
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved baseline to {baseline_path}")
+        return 0
+    if not os.path.exists(baseline_path):
+        if args.baseline:
+            print(f"Baseline {baseline_path} not found")
+            return 2
+        return 0
+
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.tolerance)
+    if regressions:
+        print(f"\nFAILED: {len(regressions)} case(s) more than {args.tolerance:.0%} slower "
+              f"than the baseline: {', '.join(regressions)}")
+        return 1
+    print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
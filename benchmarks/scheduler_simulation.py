@@ -0,0 +1,108 @@
+"""Simulate a busy triage queue and report wait-time percentiles.
+
+Patients arrive as a Poisson process; a share of them are emergencies and
+a share are booked for a later slot. Patients are seen at a fixed service
+rate. The same arrivals are run through each scheduler in ds.scheduler.
+Run from the repository root:
+
+    python -m benchmarks.scheduler_simulation --rate 3000 --minutes 60
+"""
+import argparse
+import random
+import time
+
+from ds.queue import EMERGENCY, REGULAR, PatientQueue
+from ds.scheduler import AgingScheduler, StrictPriorityScheduler
+
+
+def make_arrivals(rate, minutes, emergency_share, booked_share, seed):
+    rng = random.Random(seed)
+    arrivals = []
+    t = 0.0
+    end = minutes * 60.0
+    per_second = rate / 60.0
+    while True:
+        t += rng.expovariate(per_second)
+        if t >= end:
+            return arrivals
+        emergency = rng.random() < emergency_share
+        not_before = None
+        if not emergency and rng.random() < booked_share:
+            not_before = t + rng.uniform(0, 600)
+        arrivals.append((t, emergency, not_before))
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def simulate(scheduler, arrivals, service_rate, minutes):
+    clock = [0.0]
+    queue = PatientQueue(scheduler=scheduler, clock=lambda: clock[0])
+    interval = 60.0 / service_rate
+    waits = {EMERGENCY: [], REGULAR: []}
+    info = {}
+    next_arrival = 0
+    ops = 0
+    started = time.perf_counter()
+
+    # Keep serving after arrivals stop so that everyone is eventually seen
+    t = 0.0
+    while next_arrival < len(arrivals) or len(queue):
+        while next_arrival < len(arrivals) and arrivals[next_arrival][0] <= t:
+            arrived, emergency, not_before = arrivals[next_arrival]
+            clock[0] = arrived
+            queue.add_patient('', emergency, next_arrival, not_before=not_before)
+            info[next_arrival] = (emergency, not_before if not_before else arrived)
+            next_arrival += 1
+            ops += 1
+        clock[0] = t
+        patient = queue.get_next_patient()
+        ops += 1
+        if patient is not None:
+            emergency, due = info.pop(patient['id'])
+            waits[EMERGENCY if emergency else REGULAR].append(t - due)
+        t += interval
+        if t > minutes * 60 * 20:
+            break
+
+    elapsed = time.perf_counter() - started
+    return waits, len(info), ops / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rate', type=float, default=3000, help="arrivals per minute")
+    parser.add_argument('--minutes', type=float, default=30, help="simulated minutes of arrivals")
+    parser.add_argument('--capacity', type=float, default=0.95,
+                        help="service rate as a multiple of the arrival rate")
+    parser.add_argument('--emergency', type=float, default=0.5, help="share of emergencies")
+    parser.add_argument('--booked', type=float, default=0.1,
+                        help="share of regular patients booked up to 10 minutes ahead")
+    parser.add_argument('--aging', type=float, default=60, help="aging interval in seconds")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    arrivals = make_arrivals(args.rate, args.minutes, args.emergency, args.booked, args.seed)
+    schedulers = {
+        'strict': lambda: StrictPriorityScheduler(levels=2),
+        f'aging {args.aging:g}s': lambda: AgingScheduler(levels=2, aging_interval=args.aging),
+    }
+    print(f"{len(arrivals):,} arrivals over {args.minutes:g} min "
+          f"({args.rate:,.0f}/min), service at {args.capacity:g}x arrival rate")
+    print(f"{'scheduler':<12}{'level':<11}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}   (wait, s)")
+    for name, make in schedulers.items():
+        waits, unserved, ops_per_sec = simulate(make(), arrivals, args.rate * args.capacity,
+                                                args.minutes)
+        for level, label in ((EMERGENCY, 'emergency'), (REGULAR, 'regular')):
+            values = waits[level]
+            print(f"{name:<12}{label:<11}" + ''.join(
+                f"{percentile(values, p):>9.1f}" for p in (50, 90, 99, 100)))
+        print(f"{'':<12}{ops_per_sec:,.0f} queue ops/s, {unserved} never served")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Cache of query results for db.database.fetch_query(..., cache=True).
+
+Entries are keyed by the query, with whitespace collapsed, and its
+parameters. The least recently used entry is dropped once there are
+max_entries, and any entry is dropped after ttl seconds.
+
+execute_query() reports every write, and the entries it could have
+changed are dropped:
+
+- DELETE ... WHERE id = ? drops only results containing that row.
+- Other writes drop every result that reads the table, except lookups
+  of a single other id (queries ending in WHERE id = ?).
+
+Tables filled by triggers count as written along with their source
+table. Writes by other processes are seen when the change log is
+polled (see db.database.fetch_changes). The TTL bounds how stale a
+result can get from writes that neither path sees.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from db import metrics
+
+MAX_ENTRIES = 256
+TTL = 60.0
+
+# Tables that triggers write to when the key table is written
+TRIGGER_TABLES = {
+    'appointments': ('appointments_fts', 'appointment_changes', 'triage_queue'),
+}
+
+_READ_TABLES = re.compile(r'\b(?:FROM|JOIN)\s+(?:\w+\.)?(\w+)', re.IGNORECASE)
+_WRITE_TABLE = re.compile(
+    r'^\s*(INSERT|REPLACE|UPDATE|DELETE)\b(?:\s+OR\s+\w+)?(?:\s+INTO|\s+FROM)?\s+(?:\w+\.)?(\w+)',
+    re.IGNORECASE)
+_BY_ID = re.compile(r'\bWHERE\s+id\s*=\s*\?\s*$', re.IGNORECASE)
+_ID_FIRST = re.compile(r'^\s*SELECT\s+(?:\w+\.)?id\b', re.IGNORECASE)
+
+# More changed rows than this at once are treated as a change to the table
+ROW_INVALIDATION_LIMIT = 32
+
+
+def normalize_query(query):
+    return ' '.join(query.split())
+
+
+class _Entry:
+    __slots__ = ('rows', 'expires', 'tables', 'ids', 'row_id')
+
+    def __init__(self, rows, expires, tables, ids, row_id):
+        self.rows = rows
+        self.expires = expires
+        self.tables = tables
+        # Ids of the rows in the result when it selects id first, else None
+        self.ids = ids
+        # Set for single-row lookups by id
+        self.row_id = row_id
+
+
+class QueryCache:
+    """Bounded LRU cache of query results, with a time to live."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Bumped by every write, so a result read while a write was being
+        # made is not stored
+        self.generation = 0
+
+    def get(self, query, params):
+        """Return the cached rows for query and params, or None."""
+        key = (normalize_query(query), tuple(params))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if metrics.enabled:
+            metrics.count('query_cache_lookups_total', result='miss' if entry is None else 'hit')
+        return None if entry is None else list(entry.rows)
+
+    def put(self, query, params, rows, generation):
+        """Store rows read when self.generation was generation."""
+        query = normalize_query(query)
+        tables = {table.lower() for table in _READ_TABLES.findall(query)}
+        ids = {row[0] for row in rows} if _ID_FIRST.match(query) else None
+        row_id = params[-1] if params and _BY_ID.search(query) else None
+        entry = _Entry(list(rows), time.monotonic() + self.ttl, tables, ids, row_id)
+        key = (query, tuple(params))
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def written(self, query, params=(), lastrowid=None):
+        """Drop the entries a write statement could have changed.
+
+        Call once the write is committed.
+        """
+        if not self._entries:
+            with self._lock:
+                self.generation += 1
+            return
+        match = _WRITE_TABLE.match(query)
+        if match is None:
+            # Not a plain write of one table, so assume it touched anything
+            self.clear()
+            return
+        operation, table = match.group(1).upper(), match.group(2).lower()
+        row_id = params[-1] if params and _BY_ID.search(query) else None
+        if operation == 'INSERT' or operation == 'REPLACE':
+            row_id = lastrowid
+            operation = 'INSERT'
+        self.invalidate(table, row_id, deleted=operation == 'DELETE')
+
+    def invalidate(self, table, row_id=None, deleted=False):
+        """Drop the entries that a change to table could have affected.
+
+        With row_id, lookups of other ids are kept; if the row was
+        deleted, so is every result that did not contain it.
+        """
+        tables = {table.lower()} | set(TRIGGER_TABLES.get(table.lower(), ()))
+        with self._lock:
+            self.generation += 1
+            stale = []
+            for key, entry in self._entries.items():
+                if entry.tables.isdisjoint(tables):
+                    continue
+                if row_id is None:
+                    stale.append(key)
+                elif entry.row_id is not None:
+                    if entry.row_id == row_id:
+                        stale.append(key)
+                elif not deleted or entry.ids is None or row_id in entry.ids:
+                    stale.append(key)
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def changed(self, table, changes):
+        """Drop the entries affected by (row_id, row) pairs from a change log.
+
+        row is None for a deleted row.
+        """
+        if not changes:
+            return
+        if len(changes) > ROW_INVALIDATION_LIMIT:
+            self.invalidate(table)
+            return
+        for row_id, row in changes:
+            self.invalidate(table, row_id, deleted=row is None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {'entries': len(self._entries), 'max_entries': self.max_entries,
+                'ttl': self.ttl, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hit_rate(), 'evictions': self.evictions,
+                'invalidations': self.invalidations}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+query_cache = QueryCache()
+
+metrics.gauge('query_cache_entries', lambda: len(query_cache))
+metrics.gauge('query_cache_hit_rate', lambda: round(query_cache.hit_rate(), 4))
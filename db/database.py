@@ -1,50 +1,374 @@
+import re
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 
+from db import metrics
+from db.cache import query_cache
+from db.migrations import SCHEMA_VERSION, has_table, migrate
+from db.storage import FileEngine
 
-def init_db():
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
+# Columns read for a patient record, in the order ds.record expects them
+PATIENT_COLUMNS = ("id, name, age, gender, location, phone, scheduled_time, is_emergency, "
+                   "scheduled_at")
+
+# SQLite tuning applied by init_db and to every new connection. WAL lets the
+# display window keep reading while the other windows write, and NORMAL
+# synchronous is safe under WAL. Change these with configure_db().
+DB_SETTINGS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,                # milliseconds
+    'cache_size': -16000,                # negative means KiB, so 16 MB
+    'mmap_size': 256 * 1024 * 1024,      # bytes
+}
+
+# Settings that only last as long as the connection that set them
+_CONNECTION_PRAGMAS = ('synchronous', 'busy_timeout', 'cache_size', 'mmap_size')
+
+# Storage engine that opens connections; see db.storage and set_engine()
+_engine = FileEngine()
+
+# Each thread keeps one open connection per shard (None for the read
+# connection); sqlite3 connections cannot be shared between threads, and
+# reusing them keeps the statement cache warm
+_local = threading.local()
+
+# Whether init_db has migrated the current engine's databases
+_schema_ready = False
+_schema_lock = threading.Lock()
+# Whether the read connection has the full-text index, once checked
+_has_search_index = None
+
+
+def set_engine(engine):
+    """Switch storage engine, e.g. set_engine(MemoryEngine()) in a benchmark.
+
+    Call before other threads open connections: only this thread's
+    connections are closed here.
+    """
+    global _engine, _schema_ready, _has_search_index
+    close_connection()
+    _engine.close()
+    _engine = engine
+    _schema_ready = False
+    _has_search_index = None
+    query_cache.clear()
+
+
+def get_engine():
+    return _engine
+
+
+def shard_for_id(appointment_id):
+    """Shard holding an appointment, to pass as `shard` when writing it."""
+    return _engine.shard_for_id(appointment_id)
+
+
+def shard_for_appointment(location, scheduled_time):
+    """Shard a new appointment is written to."""
+    return _engine.shard_for_appointment(location, scheduled_time)
+
+
+def get_connection(shard=None):
+    """Return this thread's connection, opening it on first use.
+
+    The connection runs in autocommit mode: every statement outside a
+    `transaction()` block is committed as soon as it finishes. With a
+    sharded engine, reads use the default connection and writes must use
+    the connection of their shard.
+    """
+    conns = getattr(_local, 'conns', None)
+    if conns is None:
+        conns = _local.conns = {}
+        _local.depths = {}
+        # Writes made in an open transaction, reported to the query cache
+        # when it commits
+        _local.pending = {}
+    conn = conns.get(shard)
+    if conn is None:
+        conn = _engine.connect(shard)
+        _apply_pragmas(conn, _CONNECTION_PRAGMAS, _schemas(shard))
+        conns[shard] = conn
+        _local.depths[shard] = 0
+    return conn
+
+
+def _schemas(shard):
+    return _engine.schemas if shard is None else ('main',)
+
+
+def _apply_pragmas(conn, names, schemas=('main',)):
+    for name in names:
+        value = DB_SETTINGS.get(name)
+        if value is not None:
+            for schema in schemas:
+                conn.execute(f"PRAGMA {schema}.{name}={value}")
+
+
+def configure_db(**settings):
+    """Override entries of DB_SETTINGS, e.g. configure_db(journal_mode='delete').
+
+    Pass None to leave a setting at SQLite's default. Connections opened
+    afterwards pick up the new values; init_db() also applies them to the
+    calling thread's connection.
+    """
+    unknown = set(settings) - set(DB_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown database settings: {', '.join(sorted(unknown))}")
+    DB_SETTINGS.update(settings)
+
+
+def close_connection():
+    conns = getattr(_local, 'conns', None)
+    if conns:
+        for conn in conns.values():
+            conn.close()
+        conns.clear()
+
+
+@contextmanager
+def transaction(shard=None):
+    """Run the enclosed queries in a single transaction.
+
+    Commits on success and rolls back if the block raises. Nested blocks
+    join the outermost transaction.
+    """
+    conn = get_connection(shard)
+    depths = _local.depths
+    if depths[shard]:
+        depths[shard] += 1
+        try:
+            yield conn
+        finally:
+            depths[shard] -= 1
+        return
 
+    conn.execute("BEGIN")
+    depths[shard] = 1
     try:
-        c.execute('''CREATE TABLE IF NOT EXISTS appointments
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      name TEXT, age INTEGER, gender TEXT, 
-                      location TEXT, scheduled_time TEXT, 
-                      phone TEXT, is_emergency INTEGER DEFAULT 0)''')
-        conn.commit()
-    except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        try:
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            # e.g. SQLITE_BUSY: the transaction is still open, and would
+            # hold the write lock and swallow every later write
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        # Other threads could have cached what the writes replaced
+        for write in _local.pending.pop(shard, ()):
+            query_cache.written(*write)
+    finally:
+        depths[shard] = 0
+        _local.pending.pop(shard, None)
+
+
+def init_db(**settings):
+    """Apply settings and bring the schema up to date.
+
+    The migrations run once per process for each storage engine; later
+    calls only apply the settings. Raises sqlite3.DatabaseError if a
+    database could not be brought to SCHEMA_VERSION, and tries again on
+    the next call.
+    """
+    global _schema_ready, _has_search_index
+    configure_db(**settings)
+    with _schema_lock:
+        if not _schema_ready:
+            _engine.create_schema(_create_schema)
+            _schema_ready = True
+            # The migrations may just have created it
+            _has_search_index = None
+    # Settings may have changed since this thread's connections were opened
+    for shard, conn in getattr(_local, 'conns', {}).items():
         try:
-            c.execute("ALTER TABLE appointments ADD COLUMN is_emergency INTEGER DEFAULT 0")
-            conn.commit()
+            _apply_pragmas(conn, _CONNECTION_PRAGMAS, _schemas(shard))
         except sqlite3.Error as e:
-            print(f"Failed to alter table: {e}")
+            print(f"Failed to apply database settings: {e}")
 
-    conn.close()
 
+def _create_schema(conn):
+    try:
+        # journal_mode is stored in the database file, so it only needs to
+        # be set once
+        _apply_pragmas(conn, ('journal_mode',) + _CONNECTION_PRAGMAS)
+    except sqlite3.Error as e:
+        print(f"Failed to apply database settings: {e}")
+    version = migrate(conn)
+    if version != SCHEMA_VERSION:
+        # The code expects the tables and columns of SCHEMA_VERSION
+        raise sqlite3.DatabaseError(f"Database schema is at version {version}, "
+                                    f"this program needs version {SCHEMA_VERSION}")
 
-def execute_query(query, params=()):
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
+
+def search_appointments(term, after_id=None, limit=None):
+    """Return appointment rows whose name or location matches term, best first.
+
+    Each word in term matches words starting with it, so "jo ke" finds
+    "John Kamau" in "Kericho". Uses the full-text index when present.
+
+    With a limit, returns one page in id order instead: up to limit rows
+    with ids above after_id. Seeking by id keeps every page as cheap as
+    the first, however many rows match.
+    """
+    global _has_search_index
+    words = re.findall(r'\w+', term)
+    if not words:
+        return []
+    page = ''
+    params = ()
+    if limit is not None:
+        page = ' AND {id} > ? ORDER BY {id} LIMIT ?'
+        params = (after_id or 0, limit)
+    if _has_search_index is None:
+        _has_search_index = has_table(get_connection().cursor(), 'appointments_fts')
+    if _has_search_index:
+        match = ' '.join(f'"{word}"*' for word in words)
+        return fetch_query(f'''SELECT {_qualified_columns('a')} FROM appointments_fts f
+                              JOIN appointments a ON a.id = f.rowid
+                              WHERE appointments_fts MATCH ?'''
+                           + (page.format(id='f.rowid') or ' ORDER BY f.rank'),
+                           (match,) + params, cache=True)
+    return fetch_query(f"SELECT {PATIENT_COLUMNS} FROM appointments WHERE name LIKE ?"
+                       + page.format(id='id'), (f"%{term}%",) + params, cache=True)
+
+
+def _qualified_columns(alias):
+    return ', '.join(f"{alias}.{column.strip()}" for column in PATIENT_COLUMNS.split(','))
+
+
+def execute_query(query, params=(), shard=None):
+    """Run a write and return the cursor's lastrowid, or None on error.
+
+    shard is the shard the write belongs to, from shard_for_id() or
+    shard_for_appointment(); it is None unless the engine is sharded.
+    """
+    c = get_connection(shard).cursor()
+    start = time.perf_counter() if metrics.enabled else None
     try:
         c.execute(query, params)
-        conn.commit()
+        if _local.depths[shard]:
+            _local.pending.setdefault(shard, []).append((query, params, c.lastrowid))
+        else:
+            query_cache.written(query, params, c.lastrowid)
         return c.lastrowid
     except sqlite3.Error as e:
         print(f"Database error: {e}")
+        if start is not None:
+            metrics.count('sql_errors_total', query=metrics.query_label(query))
         return None
     finally:
-        conn.close()
+        c.close()
+        if start is not None:
+            _record_query(query, start)
+
 
+def fetch_query(query, params=(), cache=False):
+    """Run a read and return all rows, or None on error.
 
-def fetch_query(query, params=()):
-    conn = sqlite3.connect('database.db')
+    With cache=True the result may come from, and is kept in, the query
+    cache (see db.cache), except inside a transaction.
+    """
+    conn = get_connection()
+    cache = cache and not conn.in_transaction
+    if cache:
+        rows = query_cache.get(query, params)
+        if rows is not None:
+            return rows
+        generation = query_cache.generation
     c = conn.cursor()
+    start = time.perf_counter() if metrics.enabled else None
     try:
         c.execute(query, params)
-        return c.fetchall()
+        rows = c.fetchall()
+        if cache:
+            query_cache.put(query, params, rows, generation)
+        return rows
     except sqlite3.Error as e:
         print(f"Database error: {e}")
+        if start is not None:
+            metrics.count('sql_errors_total', query=metrics.query_label(query))
         return None
     finally:
-        conn.close()
\ No newline at end of file
+        c.close()
+        if start is not None:
+            _record_query(query, start)
+
+
+def _record_query(query, start):
+    elapsed = time.perf_counter() - start
+    label = metrics.query_label(query)
+    metrics.observe('sql_query_seconds', elapsed, query=label)
+    metrics.trace('sql', f"{elapsed * 1000:.2f} ms  {label}")
+
+
+def fetch_changes(since_version):
+    """Return (version, changes) for appointments changed after since_version.
+
+    Each change is (appointment_id, row), where row holds the appointment's
+    current PATIENT_COLUMNS or None if it has been deleted. Several changes
+    to the same appointment are collapsed into one.
+
+    A sharded engine keeps a change log per shard, and its versions are
+    tuples with one entry per shard; treat versions as opaque.
+
+    The log only keeps the newest CHANGE_LOG_LIMIT changes (see
+    db.migrations). If some changes after since_version are gone, changes
+    is None and the caller has to reload the table.
+    """
+    schemas = _engine.schemas
+    if len(schemas) == 1:
+        version, changes = _fetch_log_changes(schemas[0], since_version)
+    else:
+        if not since_version:
+            since_version = (0,) * len(schemas)
+        versions = []
+        changes = []
+        for schema, since in zip(schemas, since_version):
+            shard_version, shard_changes = _fetch_log_changes(schema, since)
+            if shard_changes is None:
+                changes = None
+                break
+            versions.append(shard_version)
+            changes.extend(shard_changes)
+        version = tuple(versions) if changes is not None else since_version
+    # Includes writes by other processes, which execute_query never saw
+    if changes is None:
+        query_cache.invalidate('appointments')
+    else:
+        query_cache.changed('appointments', changes)
+    return version, changes
+
+
+def _fetch_log_changes(schema, since_version):
+    # A change and its row are always in the same shard. Joining the
+    # sharded engine's UNION ALL view instead would scan every shard
+    rows = fetch_query(f'''SELECT c.version, c.appointment_id, {_qualified_columns('a')}
+                          FROM (SELECT MAX(id) AS version, appointment_id
+                                FROM {schema}.appointment_changes WHERE id > ?
+                                GROUP BY appointment_id) c
+                          LEFT JOIN {schema}.appointments a ON a.id = c.appointment_id
+                          ORDER BY c.version''', (since_version,))
+    if not rows:
+        return since_version, []
+    # Ids have no gaps, so an oldest row past since_version + 1 means the
+    # changes in between were pruned
+    oldest = fetch_query(f"SELECT MIN(id) FROM {schema}.appointment_changes")
+    if oldest and oldest[0][0] > since_version + 1:
+        return since_version, None
+    changes = [(row[1], row[2:] if row[2] is not None else None) for row in rows]
+    return rows[-1][0], changes
+
+
+def current_change_version():
+    versions = []
+    for schema in _engine.schemas:
+        rows = fetch_query(f"SELECT COALESCE(MAX(id), 0) FROM {schema}.appointment_changes")
+        versions.append(rows[0][0] if rows else 0)
+    return versions[0] if len(versions) == 1 else tuple(versions)
@@ -0,0 +1,119 @@
+import csv
+import json
+import time
+
+from db.cache import query_cache
+from db.database import shard_for_appointment, transaction
+from ds.timeslot import parse_scheduled_time
+
+# Form fields every appointment must have, in the order the appointment
+# window collects them
+APPOINTMENT_FIELDS = ('name', 'age', 'gender', 'location', 'time', 'phone')
+
+INSERT_APPOINTMENT = """INSERT INTO appointments
+                        (name, age, gender, location, scheduled_time, phone, is_emergency,
+                         scheduled_at)
+                        VALUES(?, ?, ?, ?, ?, ?, ?, ?)"""
+
+
+def validate_appointment(values):
+    """Return an error message for a list of form values, or None if valid."""
+    if any(val == '' for val in values):
+        return "Please Fill Up All Boxes"
+    try:
+        int(values[APPOINTMENT_FIELDS.index('age')])
+    except ValueError:
+        return "Age must be a number"
+    return None
+
+
+class InvalidRecord:
+    """Stands in for an input line that could not be read as a record, so
+    the import counts it as rejected and carries on."""
+
+    def __init__(self, reason):
+        self.reason = reason
+
+
+def _parse_flag(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'y')
+    return bool(value)
+
+
+def record_to_params(record):
+    """Turn an imported record into INSERT parameters.
+
+    Raises ValueError with the reason when the record is invalid.
+    """
+    if isinstance(record, InvalidRecord):
+        raise ValueError(record.reason)
+    if not isinstance(record, dict):
+        raise ValueError("Record is not a JSON object")
+    record = dict(record)
+    if 'time' not in record and 'scheduled_time' in record:
+        record['time'] = record['scheduled_time']
+    values = [record.get(field) for field in APPOINTMENT_FIELDS]
+    if any(val is None for val in values):
+        raise ValueError("Please Fill Up All Boxes")
+    values = [str(val).strip() for val in values]
+    error = validate_appointment(values)
+    if error:
+        raise ValueError(error)
+    name, age, gender, location, time_, phone = values
+    return (name, int(age), gender, location, time_, phone,
+            int(_parse_flag(record.get('is_emergency', False))), parse_scheduled_time(time_))
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        yield from csv.DictReader(f)
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield InvalidRecord(f"Invalid JSON: {e}")
+
+
+def import_appointments(records, batch_size=5000):
+    """Insert records in batches of `batch_size`, one transaction per batch.
+
+    Invalid records are skipped. Returns (imported, rejected, seconds) where
+    rejected is a list of (record number, reason) pairs. With a sharded
+    engine each shard gets its own batches.
+    """
+    imported = 0
+    rejected = []
+    batches = {}
+    start = time.perf_counter()
+
+    def flush(shard, batch):
+        with transaction(shard) as conn:
+            conn.executemany(INSERT_APPOINTMENT, batch)
+        # executemany bypasses execute_query, so tell the cache directly
+        query_cache.invalidate('appointments')
+        batch.clear()
+
+    for number, record in enumerate(records, start=1):
+        try:
+            params = record_to_params(record)
+        except ValueError as e:
+            rejected.append((number, str(e)))
+            continue
+        shard = shard_for_appointment(params[3], params[4])
+        batch = batches.setdefault(shard, [])
+        batch.append(params)
+        if len(batch) >= batch_size:
+            imported += len(batch)
+            flush(shard, batch)
+
+    for shard, batch in batches.items():
+        if batch:
+            imported += len(batch)
+            flush(shard, batch)
+    return imported, rejected, time.perf_counter() - start
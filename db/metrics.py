@@ -0,0 +1,190 @@
+"""Counters, histograms and an operation trace for the debug panel.
+
+Instrumented code checks `metrics.enabled` before doing any work, so
+with metrics off the cost is one attribute lookup per operation. Turn
+them on with enable(); read them with snapshot(), to_json() or
+to_prometheus().
+"""
+import json
+import re
+import threading
+import time
+from collections import deque
+
+enabled = False
+
+# Upper bounds of histogram buckets; the last bucket has no upper bound
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+# Most recent operations kept for the debug panel
+TRACE_LENGTH = 200
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_gauges = {}
+_trace = deque(maxlen=TRACE_LENGTH)
+
+
+class Histogram:
+    __slots__ = ('bounds', 'buckets', 'count', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.bounds) and value > self.bounds[i]:
+            i += 1
+        self.buckets[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self):
+        cumulative = []
+        total = 0
+        for bound, n in zip(self.bounds + ('+Inf',), self.buckets):
+            total += n
+            cumulative.append((bound, total))
+        return {'count': self.count, 'sum': self.sum,
+                'mean': self.sum / self.count if self.count else 0.0,
+                'buckets': cumulative}
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _trace.clear()
+
+
+def count(name, value=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+
+def gauge(name, func):
+    """Register func() to be read as gauge `name` whenever a snapshot is taken."""
+    _gauges[name] = func
+
+
+def trace(operation, detail=''):
+    """Add an entry to the operation trace shown in the debug panel."""
+    _trace.append((time.time(), threading.current_thread().name, operation, detail))
+
+
+def recent_operations():
+    return list(_trace)
+
+
+class timed:
+    """Context manager that records how long its block took in histogram `name`.
+
+    Does nothing when metrics are disabled.
+    """
+
+    __slots__ = ('name', 'labels', 'start')
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        if enabled:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+def query_label(query):
+    """Short, stable label for an SQL statement: its first 60 characters."""
+    return re.sub(r'\s+', ' ', query).strip()[:60]
+
+
+def snapshot():
+    with _lock:
+        counters = [(name, dict(labels), value)
+                    for (name, labels), value in sorted(_counters.items())]
+        histograms = [(name, dict(labels), histogram.to_dict())
+                      for (name, labels), histogram in sorted(_histograms.items())]
+    gauges = []
+    for name, func in sorted(_gauges.items()):
+        try:
+            gauges.append((name, {}, func()))
+        except Exception as e:
+            print(f"Failed to read gauge {name}: {e}")
+    return {'enabled': enabled, 'counters': counters, 'gauges': gauges,
+            'histograms': histograms}
+
+
+def to_json():
+    data = snapshot()
+    data['recent_operations'] = [
+        {'time': when, 'thread': thread, 'operation': operation, 'detail': detail}
+        for when, thread, operation, detail in recent_operations()]
+    return json.dumps(data, indent=2)
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels.items()) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def to_prometheus():
+    """The current metrics in the Prometheus text exposition format."""
+    data = snapshot()
+    lines = []
+    for kind, entries in (('counter', data['counters']), ('gauge', data['gauges'])):
+        seen = set()
+        for name, labels, value in entries:
+            if name not in seen:
+                lines.append(f"# TYPE {name} {kind}")
+                seen.add(name)
+            lines.append(f"{name}{_labels(labels)} {value}")
+    seen = set()
+    for name, labels, histogram in data['histograms']:
+        if name not in seen:
+            lines.append(f"# TYPE {name} histogram")
+            seen.add(name)
+        for bound, total in histogram['buckets']:
+            lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {total}")
+        lines.append(f"{name}_sum{_labels(labels)} {histogram['sum']}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram['count']}")
+    return '\n'.join(lines) + '\n'
+
+
+def dump(path, fmt='json'):
+    """Write the metrics to path as 'json' or 'prometheus' text."""
+    text = to_json() if fmt == 'json' else to_prometheus()
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
@@ -0,0 +1,197 @@
+import sqlite3
+
+from ds.timeslot import parse_scheduled_time
+
+# Schema changes in the order they were made. The database's
+# PRAGMA user_version is the number of migrations already applied, so
+# each one runs once per database. Never edit a released migration; add a
+# new one. Databases created before versioning start at 0, so every
+# migration also has to cope with its change already being there.
+MIGRATIONS = []
+
+
+def migration(description):
+    def register(func):
+        MIGRATIONS.append((description, func))
+        return func
+    return register
+
+
+def _columns(c, table):
+    c.execute(f"PRAGMA table_info({table})")
+    return [col[1] for col in c.fetchall()]
+
+
+def has_table(c, name):
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,))
+    return c.fetchone() is not None
+
+
+@migration("appointments table")
+def _create_appointments(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS appointments
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  name TEXT, age INTEGER, gender TEXT,
+                  location TEXT, scheduled_time TEXT,
+                  phone TEXT, is_emergency INTEGER DEFAULT 0)''')
+    # The first releases created the table without is_emergency
+    if 'is_emergency' not in _columns(c, 'appointments'):
+        c.execute("ALTER TABLE appointments ADD COLUMN is_emergency INTEGER DEFAULT 0")
+
+
+@migration("change log")
+def _create_change_log(c):
+    # Filled by triggers so readers can poll for what changed since the
+    # last version they saw instead of reloading the whole table
+    c.execute('''CREATE TABLE IF NOT EXISTS appointment_changes
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  appointment_id INTEGER NOT NULL,
+                  operation TEXT NOT NULL)''')
+    for operation, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS appointments_log_{operation.lower()}
+                     AFTER {operation} ON appointments
+                     BEGIN
+                         INSERT INTO appointment_changes (appointment_id, operation)
+                         VALUES ({row}.id, '{operation}');
+                     END''')
+
+
+@migration("indexes on name, scheduled_time and is_emergency")
+def _create_indexes(c):
+    for column in ('name', 'scheduled_time', 'is_emergency'):
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_appointments_{column} "
+                  f"ON appointments({column})")
+
+
+@migration("triage queue")
+def _create_triage_queue(c):
+    # Patients waiting to be seen, so the triage queue survives restarts
+    c.execute('''CREATE TABLE IF NOT EXISTS triage_queue
+                 (appointment_id INTEGER PRIMARY KEY,
+                  priority INTEGER NOT NULL,
+                  seq INTEGER NOT NULL,
+                  enqueued_at REAL,
+                  not_before REAL)''')
+    columns = _columns(c, 'triage_queue')
+    for column in ('enqueued_at', 'not_before'):
+        if column not in columns:
+            c.execute(f"ALTER TABLE triage_queue ADD COLUMN {column} REAL")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS appointments_dequeue_delete
+                 AFTER DELETE ON appointments
+                 BEGIN
+                     DELETE FROM triage_queue WHERE appointment_id = OLD.id;
+                 END''')
+
+
+@migration("full-text search index")
+def _create_search_index(c):
+    # Full-text index over name and location, kept in sync by triggers.
+    # SQLite builds without FTS5 skip it, and search_appointments falls
+    # back to LIKE.
+    existed = has_table(c, 'appointments_fts')
+    c.execute("SAVEPOINT search_index")
+    try:
+        c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS appointments_fts
+                     USING fts5(name, location, content='appointments', content_rowid='id')''')
+    except sqlite3.OperationalError as e:
+        c.execute("ROLLBACK TO search_index")
+        c.execute("RELEASE search_index")
+        print(f"Full-text search unavailable: {e}")
+        return
+    c.execute('''CREATE TRIGGER IF NOT EXISTS appointments_fts_insert
+                 AFTER INSERT ON appointments
+                 BEGIN
+                     INSERT INTO appointments_fts (rowid, name, location)
+                     VALUES (NEW.id, NEW.name, NEW.location);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS appointments_fts_delete
+                 AFTER DELETE ON appointments
+                 BEGIN
+                     INSERT INTO appointments_fts (appointments_fts, rowid, name, location)
+                     VALUES ('delete', OLD.id, OLD.name, OLD.location);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS appointments_fts_update
+                 AFTER UPDATE ON appointments
+                 BEGIN
+                     INSERT INTO appointments_fts (appointments_fts, rowid, name, location)
+                     VALUES ('delete', OLD.id, OLD.name, OLD.location);
+                     INSERT INTO appointments_fts (rowid, name, location)
+                     VALUES (NEW.id, NEW.name, NEW.location);
+                 END''')
+    if not existed:
+        # Index the rows that were there before the table existed
+        c.execute("INSERT INTO appointments_fts (appointments_fts) VALUES ('rebuild')")
+    c.execute("RELEASE search_index")
+
+
+@migration("scheduled_at timestamp column")
+def _add_scheduled_at(c):
+    # scheduled_time is free-form text; scheduled_at holds it parsed into a
+    # Unix timestamp (NULL if unparseable) so time ranges can be queried
+    if 'scheduled_at' not in _columns(c, 'appointments'):
+        c.execute("ALTER TABLE appointments ADD COLUMN scheduled_at REAL")
+        rows = c.execute("SELECT id, scheduled_time FROM appointments").fetchall()
+        # Existing rows that give only a time were for some day long gone;
+        # dating them today would book slots nobody holds
+        c.executemany("UPDATE appointments SET scheduled_at = ? WHERE id = ?",
+                      [(parse_scheduled_time(text, require_date=True), row_id)
+                       for row_id, text in rows])
+    c.execute("CREATE INDEX IF NOT EXISTS idx_appointments_scheduled_at "
+              "ON appointments(scheduled_at)")
+
+
+# Rows kept in appointment_changes. A reader further behind than this
+# reloads everything instead (see db.database.fetch_changes)
+CHANGE_LOG_LIMIT = 100_000
+
+
+@migration("cap the change log")
+def _cap_change_log(c):
+    # A fixed cap rather than pruning below the oldest version any reader
+    # has seen: readers in other processes never report their versions
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS appointment_changes_prune
+                 AFTER INSERT ON appointment_changes
+                 BEGIN
+                     DELETE FROM appointment_changes
+                     WHERE id <= NEW.id - {CHANGE_LOG_LIMIT};
+                 END''')
+    c.execute(f"""DELETE FROM appointment_changes WHERE id <=
+                  (SELECT MAX(id) FROM appointment_changes) - {CHANGE_LOG_LIMIT}""")
+
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply the migrations this database has not had yet.
+
+    Each migration runs in its own transaction together with the
+    user_version bump, so a failure leaves the database at the last
+    version that succeeded. Returns the schema version reached.
+    """
+    version = schema_version(conn)
+    if version > SCHEMA_VERSION:
+        print(f"Database schema version {version} is newer than this program "
+              f"({SCHEMA_VERSION}); leaving it unchanged")
+        return version
+
+    c = conn.cursor()
+    for number, (description, apply) in enumerate(MIGRATIONS[version:], start=version + 1):
+        try:
+            # IMMEDIATE takes the write lock first, so two processes starting
+            # together cannot both apply the same migration
+            c.execute("BEGIN IMMEDIATE")
+            if schema_version(conn) < number:
+                apply(c)
+                c.execute(f"PRAGMA user_version = {number}")
+            c.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                c.execute("ROLLBACK")
+            print(f"Migration {number} ({description}) failed: {e}")
+            return number - 1
+    return SCHEMA_VERSION
@@ -0,0 +1,424 @@
+import gc
+import sqlite3
+import threading
+
+from db import metrics
+from db.database import (PATIENT_COLUMNS, execute_query, fetch_query, fetch_changes,
+                         current_change_version, search_appointments, transaction,
+                         shard_for_id, shard_for_appointment, get_engine)
+from db.importer import INSERT_APPOINTMENT
+from db.snapshot import (read_snapshot, write_snapshot, pack_rows, unpack_rows,
+                         pack_name_index, unpack_name_index, pack_key_index, unpack_key_index)
+from ds.bst import PatientBST
+from ds.hash_index import PatientKeyIndex
+from ds.hash_table import PatientHashTable
+from ds.name_index import PatientNameIndex, normalize_name
+from ds.queue import PatientQueue, EMERGENCY
+from ds.record import PatientRecord, LazyPatientRecord, load_records
+from ds.scheduler import AgingScheduler
+from ds.timeslot import TimeSlotIndex, parse_scheduled_time
+
+# Triage levels in the queue (REGULAR and EMERGENCY), and how long a
+# patient waits before counting as one level more urgent
+TRIAGE_LEVELS = 2
+AGING_INTERVAL = 30 * 60
+
+UPDATE_APPOINTMENT = """UPDATE appointments SET
+                        name=?, age=?, gender=?, location=?,
+                        phone=?, scheduled_time=?, is_emergency=?, scheduled_at=?
+                        WHERE id=?"""
+
+
+class PatientRepository:
+    """Single owner of the appointments table and its in-memory indexes.
+
+    Rows are loaded once and the same record objects are shared by the
+    hash table (lookup by id), the AVL tree (ordered by id), the name
+    index, the key index (phone, name and location) and the time-slot
+    index, so every window sees each write immediately. Windows subscribe
+    with a callback that receives a list of (event, patient_id) pairs,
+    where event is 'added', 'updated' or 'deleted', or [('reloaded', None)]
+    after everything was read from the table again.
+
+    Writes may run on a worker thread while the Tk thread reads, so index
+    changes and reads of the shared structures hold `lock`. It is never
+    held across a database call, so a slow write cannot stall readers;
+    writes themselves are made one at a time (the UI runs them all on one
+    worker thread). Subscriber callbacks are called on the thread that
+    made the change.
+
+    In lazy mode the indexes are restored from the snapshot at
+    `snapshot_path` when there is one, and only the changes since it was
+    saved come from the database. Call save_snapshot() on shutdown; pass
+    snapshot_path='' to always load from the database.
+    """
+
+    def __init__(self, lazy=True, snapshot_path=None):
+        self.lazy = lazy
+        self.snapshot_path = (get_engine().snapshot_path if snapshot_path is None
+                              else snapshot_path)
+        self.patients = PatientHashTable(load=False)
+        self.tree = PatientBST(load=False)
+        self.names = PatientNameIndex()
+        self.keys = PatientKeyIndex()
+        self.slots = TimeSlotIndex()
+        self.lock = threading.RLock()
+        self.queue = PatientQueue(persistent=True, scheduler=AgingScheduler(
+            levels=TRIAGE_LEVELS, aging_interval=AGING_INTERVAL), lock=self.lock)
+        self.version = 0
+        self._subscribers = []
+        self.load()
+
+        metrics.gauge('patients', lambda: len(self.patients))
+        metrics.gauge('bst_height', lambda: self.tree.height())
+        metrics.gauge('name_index_size', lambda: len(self.names))
+        metrics.gauge('time_slots', lambda: len(self.slots))
+        metrics.gauge('phone_index_load', lambda: self.keys.indexes['phone'].load_factor())
+        metrics.gauge('queue_length', lambda: len(self.queue))
+
+    def load(self, use_snapshot=True):
+        # Creating this many objects at once sets off the cyclic garbage
+        # collector again and again, although none of them is garbage
+        was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self._load(use_snapshot)
+        finally:
+            if was_enabled:
+                gc.enable()
+
+    def _load(self, use_snapshot):
+        snapshot = self._read_snapshot() if self.lazy and use_snapshot else None
+        if snapshot is not None:
+            self.version, sections = snapshot
+            rows = unpack_rows(sections)
+        else:
+            # Read the change version first; replaying a change that the
+            # scan below already picked up is harmless
+            self.version = current_change_version()
+            columns = ("id, name, phone, location, scheduled_at" if self.lazy
+                       else PATIENT_COLUMNS)
+            rows = fetch_query(f"SELECT {columns} FROM appointments ORDER BY id") or []
+        if self.lazy:
+            records = [LazyPatientRecord(patient_id, name=name, phone=phone, location=location,
+                                         scheduled_at=scheduled_at)
+                       for patient_id, name, phone, location, scheduled_at in rows]
+        else:
+            records = [PatientRecord.from_row(row) for row in rows]
+
+        if snapshot is not None:
+            names = unpack_name_index(sections)
+            keys = unpack_key_index(sections)
+        else:
+            names = PatientNameIndex(records)
+            keys = PatientKeyIndex(records)
+        slots = TimeSlotIndex((record.id, record.scheduled_at) for record in records)
+        with self.lock:
+            self.patients.build_from_records(records)
+            self.tree.build_from_sorted(records)
+            self.names = names
+            self.keys = keys
+            self.slots = slots
+        if snapshot is not None:
+            # Catch up with the writes made since the snapshot was saved
+            self.poll_changes()
+
+    def _read_snapshot(self):
+        if not self.snapshot_path:
+            return None
+        snapshot = read_snapshot(self.snapshot_path, get_engine().schemas)
+        if snapshot is None:
+            return None
+        # A change log behind the snapshot means the database was replaced
+        # or restored since, so the snapshot cannot be trusted
+        version, current = snapshot[0], current_change_version()
+        if isinstance(version, tuple):
+            behind = any(new < old for old, new in zip(version, current))
+        else:
+            behind = current < version
+        if behind:
+            print("Index snapshot is newer than the database; reloading")
+            return None
+        return snapshot
+
+    def save_snapshot(self):
+        """Save the indexes for the next start. Returns True if it was written."""
+        if not self.snapshot_path:
+            return False
+        # Writes made here do not move self.version on, so catch up first;
+        # a snapshot tagged with an old version could not be told apart
+        # from one belonging to a database with fewer changes
+        self.poll_changes()
+        with self.lock:
+            version = self.version
+            sections = pack_rows(self.tree.inorder_traversal())
+            sections.update(pack_name_index(self.names))
+            sections.update(pack_key_index(self.keys))
+        return write_snapshot(self.snapshot_path, version, get_engine().schemas, sections)
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def _notify(self, changes):
+        if changes:
+            for callback in list(self._subscribers):
+                callback(changes)
+
+    def get(self, patient_id):
+        with self.lock:
+            return self.patients.get_patient(patient_id)
+
+    def __len__(self):
+        return len(self.patients)
+
+    def ids(self):
+        with self.lock:
+            return self.patients.get_all_ids()
+
+    def first(self):
+        with self.lock:
+            return self.tree.first()
+
+    def last(self):
+        with self.lock:
+            return self.tree.last()
+
+    def next_after(self, patient_id, wrap=True):
+        """Patient after patient_id in id order, going back to the first at the end."""
+        with self.lock:
+            patient = self.tree.successor(patient_id)
+            if patient is None and wrap:
+                patient = self.tree.first()
+            return patient
+
+    def previous_before(self, patient_id, wrap=True):
+        """Patient before patient_id in id order, going round to the last at the start."""
+        with self.lock:
+            patient = self.tree.predecessor(patient_id)
+            if patient is None and wrap:
+                patient = self.tree.last()
+            return patient
+
+    def position(self, patient_id):
+        """0-based position of patient_id in id order."""
+        with self.lock:
+            return self.tree.rank(patient_id)
+
+    def patient_at(self, index):
+        """Patient at 0-based position index in id order, or None."""
+        with self.lock:
+            return self.tree.select(index)
+
+    def queue_status(self):
+        return self.queue.get_queue_status()
+
+    def call_next_patient(self):
+        """Take the next patient off the triage queue, or None if nobody is due."""
+        return self.queue.get_next_patient()
+
+    def add(self, name, age, gender, location, time, phone, is_emergency=False):
+        """Insert an appointment and queue the patient.
+
+        Both happen in one transaction, so a crash cannot leave a booked
+        patient missing from the queue. Returns the new record, or None if
+        the database rejected it.
+        """
+        scheduled_at = parse_scheduled_time(time)
+        # Booked patients are not called before their appointment time
+        not_before = None if is_emergency else scheduled_at
+        patient_id = None
+        shard = shard_for_appointment(location, time)
+        try:
+            with transaction(shard):
+                patient_id = execute_query(INSERT_APPOINTMENT, (
+                    name, age, gender, location, time, phone, int(is_emergency),
+                    scheduled_at),
+                    shard=shard)
+                if patient_id is None or self.queue.add_patient(
+                        name, is_emergency, patient_id, not_before=not_before) is None:
+                    raise sqlite3.Error("Failed to save appointment")
+        except sqlite3.Error:
+            if patient_id is not None:
+                # Rolled back, so drop the in-memory queue entry as well
+                self.queue.discard(patient_id)
+            return None
+        record = PatientRecord(patient_id, name, int(age), gender, location, phone, time,
+                               is_emergency, scheduled_at)
+        with self.lock:
+            self._insert(record)
+        self._notify([('added', patient_id)])
+        return record
+
+    def update(self, patient_id, values):
+        """Write new field values for a patient. Returns False on failure.
+
+        Marking a waiting patient as an emergency moves them up the queue.
+        """
+        scheduled_at = parse_scheduled_time(values['time'])
+        result = execute_query(UPDATE_APPOINTMENT, (
+            values['name'], values['age'], values['gender'], values['location'],
+            values['phone'], values['time'], int(values['is_emergency']), scheduled_at,
+            patient_id),
+            shard=shard_for_id(patient_id))
+        if result is None:
+            return False
+        with self.lock:
+            self._update(patient_id, dict(values, age=int(values['age']),
+                                          scheduled_at=scheduled_at))
+        if values['is_emergency']:
+            self.queue.increase_priority(patient_id, EMERGENCY)
+        self._notify([('updated', patient_id)])
+        return True
+
+    def delete(self, patient_id):
+        # A trigger removes the patient's triage_queue row along with it
+        if execute_query("DELETE FROM appointments WHERE id=?", (patient_id,),
+                         shard=shard_for_id(patient_id)) is None:
+            return False
+        with self.lock:
+            self._remove(patient_id)
+        self._notify([('deleted', patient_id)])
+        return True
+
+    def poll_changes(self):
+        """Apply writes made outside this repository, e.g. by a bulk import.
+
+        Writes made through this repository also show up in the change log;
+        re-applying them is harmless. Returns the (event, patient_id) list
+        sent to subscribers.
+        """
+        version, rows = fetch_changes(self.version)
+        if rows is None:
+            # The change log has been pruned past our version
+            self.load(use_snapshot=False)
+            changes = [('reloaded', None)]
+            self._notify(changes)
+            return changes
+        changes = []
+        with self.lock:
+            # Set together with the changes, so a snapshot taken meanwhile
+            # never claims a version whose changes it lacks
+            self.version = version
+            for patient_id, row in rows:
+                if row is None:
+                    if self._remove(patient_id):
+                        changes.append(('deleted', patient_id))
+                elif patient_id in self.patients.table:
+                    self._update(patient_id, PatientRecord.from_row(row).to_dict())
+                    changes.append(('updated', patient_id))
+                else:
+                    self._insert(PatientRecord.from_row(row))
+                    changes.append(('added', patient_id))
+        self._notify(changes)
+        return changes
+
+    def _insert(self, record):
+        self.patients.add_patient(record)
+        self.tree.insert(record)
+        self.names.insert(record.id, record.name)
+        self.keys.insert(record)
+        self.slots.insert(record.id, record.scheduled_at)
+
+    def _update(self, patient_id, values):
+        record = self.patients.get_patient(patient_id)
+        if record is None:
+            return
+        # The tree and the hash table share this record object
+        self.keys.delete(record)
+        record.update(values)
+        self.keys.insert(record)
+        self.names.update(patient_id, record.name)
+        self.slots.update(patient_id, record.scheduled_at)
+        self.queue.rename(patient_id, record.name)
+
+    def _remove(self, patient_id):
+        record = self.patients.table.get(patient_id)
+        if not self.patients.delete_patient(patient_id):
+            return False
+        self.tree.delete(patient_id)
+        self.names.delete(patient_id)
+        self.keys.delete(record)
+        self.slots.delete(patient_id)
+        self.queue.discard(patient_id)
+        return True
+
+    def search(self, term, after_id=None, limit=None):
+        """Full-text search in the database, returning the shared records.
+
+        Pass limit (and the last id seen as after_id) to fetch one page at
+        a time in id order.
+        """
+        with metrics.timed('search_seconds'):
+            rows = search_appointments(term, after_id, limit) or []
+        results = []
+        with self.lock:
+            for row in rows:
+                record = self.patients.get_patient(row[0])
+                if record is None:
+                    record = PatientRecord.from_row(row)
+                elif isinstance(record, LazyPatientRecord):
+                    # The row is at hand, so the list never reads it again
+                    record.fill(PatientRecord.from_row(row))
+                results.append(record)
+        return results
+
+    def type_ahead(self, term, limit):
+        """Name matches from the in-memory index: prefixes first, then substrings."""
+        with self.lock, metrics.timed('type_ahead_seconds'):
+            ids = self.names.prefix(term, limit=limit)
+            if len(ids) < limit:
+                for patient_id in self.names.substring(term, limit=limit):
+                    if patient_id not in ids:
+                        ids.append(patient_id)
+                        if len(ids) >= limit:
+                            break
+            patients = [self.patients.get_patient(patient_id) for patient_id in ids]
+        # The list shows every field, so lazy records are read in one go
+        load_records(patients)
+        return patients
+
+    def find(self, field, value):
+        """Patients whose phone, name or location matches value once normalized."""
+        with self.lock:
+            patients = [self.patients.get_patient(patient_id)
+                        for patient_id in self.keys.find(field, value)]
+        load_records(patients)
+        return patients
+
+    def duplicates(self, name, phone):
+        """Patients already registered with this name and phone number."""
+        with self.lock:
+            return [self.patients.get_patient(patient_id)
+                    for patient_id in self.keys.duplicates(name, phone)]
+
+    def booked_between(self, start, end):
+        """Patients with appointments starting in [start, end), as Unix timestamps."""
+        with self.lock:
+            return [self.patients.get_patient(patient_id)
+                    for patient_id in self.slots.between(start, end)]
+
+    def _at_location(self, location, exclude=None):
+        # Each location books its own slots; compared like the key index does
+        key = normalize_name(location or '')
+
+        def counts(patient_id):
+            if patient_id == exclude:
+                return False
+            return normalize_name(self.patients.get_patient(patient_id).location or '') == key
+        return counts
+
+    def conflicts(self, scheduled_at, location, exclude=None):
+        """Patients at location whose appointment slot overlaps one starting
+        at scheduled_at, other than patient exclude."""
+        with self.lock:
+            return [self.patients.get_patient(patient_id)
+                    for patient_id in self.slots.overlapping(
+                        scheduled_at, counts=self._at_location(location, exclude))]
+
+    def next_free_slot(self, after, location, exclude=None):
+        with self.lock:
+            return self.slots.next_free(after, counts=self._at_location(location, exclude))
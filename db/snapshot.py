@@ -0,0 +1,266 @@
+"""Binary snapshot of the in-memory indexes, for a fast start.
+
+A snapshot is a set of named arrays tagged with the change version it
+is current to. Loading one maps the file and copies each array straight
+out of it, which skips the table scan and the work of building the
+indexes; the changes made since are then replayed from the change log.
+
+Layout (little-endian, every section padded to 8 bytes):
+
+    header      magic, format, schema version, layout size, section count
+    layout      the engine's schema names, comma-separated (UTF-8)
+    versions    int64 per schema: the change version
+    contents    per section: name, array typecode, offset, item count
+    sections    the arrays, one after another
+
+Strings are stored as a blob of UTF-8 plus an int32 array of byte
+lengths, where -1 stands for None.
+"""
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from db.migrations import SCHEMA_VERSION
+from ds.hash_index import KEY_FIELDS, MultiHashIndex, PatientKeyIndex
+from ds.name_index import PatientNameIndex
+
+MAGIC = b'PIDXSNAP'
+FORMAT_VERSION = 2
+
+_HEADER = struct.Struct('<8sIIII')
+_SECTION = struct.Struct('<16s4sQQ')
+
+
+def _pad(size):
+    return -size % 8
+
+
+def write_snapshot(path, version, schemas, sections):
+    """Write sections, a dict of name -> array or bytes, to path.
+
+    The file is written next to path and moved into place, so readers
+    never see half a snapshot. Returns True on success.
+    """
+    if sys.byteorder != 'little':
+        return False
+    versions = array('q', version if isinstance(version, tuple) else (version,))
+    layout = ','.join(schemas).encode()
+    offset = (_HEADER.size + len(layout) + _pad(len(layout)) + len(versions) * 8
+              + _SECTION.size * len(sections))
+    offset += _pad(offset)
+    contents = []
+    for name, data in sections.items():
+        if len(name.encode()) > 16:
+            raise ValueError(f"Section name too long: {name!r}")
+        typecode = data.typecode if isinstance(data, array) else 'B'
+        size = len(data) * (data.itemsize if isinstance(data, array) else 1)
+        contents.append((name, typecode, offset, len(data), data, size))
+        offset += size + _pad(size)
+
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, SCHEMA_VERSION, len(layout),
+                                 len(sections)))
+            f.write(layout + b'\0' * _pad(len(layout)))
+            versions.tofile(f)
+            for name, typecode, start, count, _, _ in contents:
+                f.write(_SECTION.pack(name.encode(), typecode.encode(), start, count))
+            for _, _, start, _, data, size in contents:
+                f.write(b'\0' * (start - f.tell()))
+                f.write(data)
+        os.replace(tmp_path, path)
+    except (OSError, OverflowError, TypeError, struct.error) as e:
+        print(f"Failed to write index snapshot: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def read_snapshot(path, schemas):
+    """Return (version, sections) from the snapshot at path, or None.
+
+    Arrays come back as lists and byte sections as bytes. Returns None
+    if there is no snapshot, or it was written for another schema version
+    or storage layout.
+    """
+    if sys.byteorder != 'little':
+        return None
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return _parse(mm, schemas)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, TypeError, struct.error) as e:
+        print(f"Ignoring unreadable index snapshot {path}: {e}")
+        return None
+
+
+def _parse(mm, schemas):
+    magic, fmt, schema_version, layout_size, count = _HEADER.unpack_from(mm)
+    if magic != MAGIC or fmt != FORMAT_VERSION or schema_version != SCHEMA_VERSION:
+        return None
+    offset = _HEADER.size
+    if bytes(mm[offset:offset + layout_size]).decode() != ','.join(schemas):
+        return None
+    offset += layout_size + _pad(layout_size)
+    versions = array('q', mm[offset:offset + len(schemas) * 8]).tolist()
+    if len(versions) != len(schemas):
+        raise ValueError("snapshot is truncated")
+    offset += len(schemas) * 8
+
+    sections = {}
+    view = memoryview(mm)
+    try:
+        for i in range(count):
+            name, typecode, start, items = _SECTION.unpack_from(mm, offset + i * _SECTION.size)
+            typecode = typecode.rstrip(b'\0').decode()
+            end = start + items * array(typecode).itemsize
+            if end > len(mm):
+                raise ValueError("snapshot is truncated")
+            data = view[start:end]
+            sections[name.rstrip(b'\0').decode()] = (
+                bytes(data) if typecode == 'B' else data.cast(typecode).tolist())
+            data.release()
+    finally:
+        view.release()
+    version = versions[0] if len(versions) == 1 else tuple(versions)
+    return version, sections
+
+
+def pack_strings(strings):
+    lengths = array('i')
+    parts = []
+    for text in strings:
+        if text is None:
+            lengths.append(-1)
+        else:
+            encoded = text.encode()
+            parts.append(encoded)
+            lengths.append(len(encoded))
+    return lengths, b''.join(parts)
+
+
+def unpack_strings(lengths, blob):
+    strings = []
+    offset = 0
+    for length in lengths:
+        if length < 0:
+            strings.append(None)
+        else:
+            strings.append(str(blob[offset:offset + length], 'utf-8'))
+            offset += length
+    return strings
+
+
+# Text fields of each row kept in the snapshot, besides id and scheduled_at
+ROW_FIELDS = ('name', 'phone', 'location')
+
+
+def pack_rows(records):
+    """Sections holding the id, ROW_FIELDS and scheduled_at of records, in order."""
+    sections = {
+        'ids': array('q', [record.id for record in records]),
+        'times': array('d', [math.nan if record.scheduled_at is None else record.scheduled_at
+                             for record in records]),
+    }
+    for field in ROW_FIELDS:
+        lengths, blob = pack_strings([record[field] for record in records])
+        sections[f"{field}_lengths"] = lengths
+        sections[f"{field}s"] = blob
+    return sections
+
+
+def unpack_rows(sections):
+    """(id, name, phone, location, scheduled_at) tuples from pack_rows() sections."""
+    columns = [unpack_strings(sections[f"{field}_lengths"], sections[f"{field}s"])
+               for field in ROW_FIELDS]
+    times = [None if math.isnan(at) else at for at in sections['times']]
+    return list(zip(sections['ids'], *columns, times))
+
+
+def pack_name_index(index):
+    names, keys, trigrams = index.parts()
+    lengths, blob = pack_strings(names.values())
+    # Each key is a suffix of its patient's name, so store where it starts
+    key_ids = array('q', [patient_id for _, patient_id in keys])
+    key_starts = array('i', [len(names[patient_id]) - len(key) for key, patient_id in keys])
+    gram_lengths, gram_blob = pack_strings(trigrams)
+    postings = array('q')
+    posting_counts = array('i')
+    for ids in trigrams.values():
+        postings.extend(ids)
+        posting_counts.append(len(ids))
+    return {
+        'ni_ids': array('q', names),
+        'ni_name_lengths': lengths,
+        'ni_names': blob,
+        'ni_key_ids': key_ids,
+        'ni_key_starts': key_starts,
+        'ni_gram_lengths': gram_lengths,
+        'ni_grams': gram_blob,
+        'ni_counts': posting_counts,
+        'ni_postings': postings,
+    }
+
+
+def unpack_name_index(sections):
+    names = dict(zip(sections['ni_ids'],
+                     unpack_strings(sections['ni_name_lengths'], sections['ni_names'])))
+    keys = [(names[patient_id][start:], patient_id)
+            for patient_id, start in zip(sections['ni_key_ids'], sections['ni_key_starts'])]
+    trigrams = {}
+    postings = sections['ni_postings']
+    offset = 0
+    grams = unpack_strings(sections['ni_gram_lengths'], sections['ni_grams'])
+    for gram, count in zip(grams, sections['ni_counts']):
+        trigrams[gram] = set(postings[offset:offset + count])
+        offset += count
+    return PatientNameIndex.from_parts(names, keys, trigrams)
+
+
+def pack_key_index(index):
+    sections = {}
+    for field, hash_index in index.indexes.items():
+        hashes, keys, buckets = hash_index.parts()
+        key_lengths, key_blob = pack_strings(keys)
+        counts = array('i')
+        ids = array('q')
+        for bucket in buckets:
+            if bucket is None:
+                counts.append(-1)
+            else:
+                counts.append(len(bucket))
+                ids.extend(bucket)
+        sections.update({
+            f"{field}_hashes": array('q', hashes),
+            f"{field}_keylens": key_lengths,
+            f"{field}_keys": key_blob,
+            f"{field}_counts": counts,
+            f"{field}_ids": ids,
+        })
+    return sections
+
+
+def unpack_key_index(sections):
+    indexes = {}
+    for field in KEY_FIELDS:
+        ids = sections[f"{field}_ids"]
+        buckets = []
+        offset = 0
+        for count in sections[f"{field}_counts"]:
+            if count < 0:
+                buckets.append(None)
+            else:
+                buckets.append(dict.fromkeys(ids[offset:offset + count]))
+                offset += count
+        keys = unpack_strings(sections[f"{field}_keylens"], sections[f"{field}_keys"])
+        indexes[field] = MultiHashIndex.from_parts(field, sections[f"{field}_hashes"], keys,
+                                                   buckets)
+    return PatientKeyIndex(indexes=indexes)
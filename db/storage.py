@@ -0,0 +1,179 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import date
+
+DB_PATH = 'database.db'
+
+# Each shard hands out appointment ids from its own block of this size, so
+# ids stay unique across shards and the shard holding an id is id // span
+SHARD_ID_SPAN = 2 ** 40
+
+# Tables that the read connection of a sharded engine shows as one view
+_SHARDED_TABLES = ('appointments', 'triage_queue')
+
+
+class StorageEngine:
+    """Where the appointments database lives.
+
+    db.database asks the engine for connections and for the shard that a
+    write belongs to; everything above db.database is unaware of it.
+    `schemas` names the schemas on the read connection that hold
+    appointment tables. `snapshot_path` is where the repository keeps its
+    index snapshot (see db.snapshot), or None for no snapshot.
+    """
+
+    schemas = ('main',)
+    snapshot_path = None
+
+    def connect(self, shard=None):
+        """Open a new connection: the read connection, or one shard's."""
+        raise NotImplementedError
+
+    def create_schema(self, create):
+        """Call create(conn) on a connection to every database file."""
+        conn = self.connect()
+        try:
+            create(conn)
+        finally:
+            conn.close()
+
+    def shard_for_id(self, appointment_id):
+        return None
+
+    def shard_for_appointment(self, location, scheduled_time):
+        return None
+
+    def close(self):
+        pass
+
+
+class FileEngine(StorageEngine):
+    """Everything in one SQLite file."""
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self.snapshot_path = f"{path}.idx"
+
+    def connect(self, shard=None):
+        return sqlite3.connect(self.path, isolation_level=None, cached_statements=256)
+
+
+class MemoryEngine(StorageEngine):
+    """A database held in memory, for tests and benchmarks.
+
+    Uses SQLite's memdb VFS, so every thread's connection sees the same
+    data with normal file locking. The data lives until close(), and WAL
+    is not available.
+    """
+
+    def __init__(self, name='hospital'):
+        self.uri = f"file:/{name}?vfs=memdb"
+        # The database is freed when its last connection closes
+        self._keeper = self.connect()
+
+    def connect(self, shard=None):
+        return sqlite3.connect(self.uri, uri=True, isolation_level=None,
+                               cached_statements=256)
+
+    def create_schema(self, create):
+        create(self._keeper)
+
+    def close(self):
+        self._keeper.close()
+
+
+class ShardedEngine(StorageEngine):
+    """Appointments split across several SQLite files, one per shard.
+
+    shards is a list of (name, bound) pairs. With by='date', bound is the
+    first date ('YYYY-MM-DD') that no longer belongs to the shard; with
+    by='location', it is the collection of locations kept in the shard.
+    The last shard's bound should be None: it takes everything else.
+    Each shard is a complete database (its own change log, search index
+    and triage queue), so a write only locks its own file.
+
+    Limitations:
+    - Reads go through a connection that attaches every shard and shows
+      `appointments` and `triage_queue` as UNION ALL views; it can only
+      read. Writes must name their shard through db.database.
+    - A row stays in the shard it was inserted into even if an update
+      changes its date or location.
+    - Full-text search is per file, so searches use LIKE across shards.
+    - SQLite attaches at most 10 databases by default.
+    """
+
+    schemas = ()
+
+    def __init__(self, shards, by='date', directory='.', prefix='database'):
+        if by not in ('date', 'location'):
+            raise ValueError("Shards can be split by 'date' or 'location'")
+        self.by = by
+        self.bounds = []
+        self.paths = {}
+        for name, bound in shards:
+            if not re.fullmatch(r'\w+', name):
+                raise ValueError(f"Invalid shard name: {name!r}")
+            if by == 'location' and bound is not None:
+                bound = {location.strip().lower() for location in bound}
+            self.bounds.append((name, bound))
+            self.paths[name] = os.path.join(directory, f"{prefix}.{name}.db")
+        self.names = [name for name, _ in self.bounds]
+        self.schemas = tuple(f"shard_{name}" for name in self.names)
+        self.snapshot_path = os.path.join(directory, f"{prefix}.idx")
+        self._lock = threading.Lock()
+
+    def connect(self, shard=None):
+        if shard is not None:
+            return sqlite3.connect(self.paths[shard], isolation_level=None,
+                                   cached_statements=256)
+        conn = sqlite3.connect(':memory:', isolation_level=None, cached_statements=256)
+        for name, schema in zip(self.names, self.schemas):
+            conn.execute("ATTACH DATABASE ? AS " + schema, (self.paths[name],))
+        for table in _SHARDED_TABLES:
+            union = ' UNION ALL '.join(f"SELECT * FROM {schema}.{table}"
+                                       for schema in self.schemas)
+            conn.execute(f"CREATE TEMP VIEW {table} AS {union}")
+        return conn
+
+    def create_schema(self, create):
+        with self._lock:
+            for index, name in enumerate(self.names):
+                conn = self.connect(name)
+                try:
+                    create(conn)
+                    self._reserve_ids(conn, index * SHARD_ID_SPAN)
+                finally:
+                    conn.close()
+
+    @staticmethod
+    def _reserve_ids(conn, first):
+        # AUTOINCREMENT continues from sqlite_sequence, so starting it at
+        # the shard's block keeps the shard's ids inside that block
+        conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'appointments' AND seq < ?",
+                     (first, first))
+        conn.execute("""INSERT INTO sqlite_sequence (name, seq)
+                        SELECT 'appointments', ? WHERE NOT EXISTS
+                        (SELECT 1 FROM sqlite_sequence WHERE name = 'appointments')""", (first,))
+
+    def shard_for_id(self, appointment_id):
+        index = (appointment_id - 1) // SHARD_ID_SPAN
+        if not 0 <= index < len(self.names):
+            raise ValueError(f"Appointment id {appointment_id} belongs to no shard")
+        return self.names[index]
+
+    def shard_for_appointment(self, location, scheduled_time):
+        if self.by == 'date':
+            # Times without a date are for today
+            match = re.match(r'\d{4}-\d{2}-\d{2}', (scheduled_time or '').strip())
+            key = match.group() if match else date.today().isoformat()
+            for name, bound in self.bounds:
+                if bound is None or key < bound:
+                    return name
+        else:
+            key = (location or '').strip().lower()
+            for name, bound in self.bounds:
+                if bound is None or key in bound:
+                    return name
+        return self.names[-1]
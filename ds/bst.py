@@ -1,113 +1,356 @@
-import sqlite3
+from db import metrics
+from db.database import PATIENT_COLUMNS, get_connection
+from ds.record import PatientRecord, LazyPatientRecord
 
 class PatientBSTNode:
+    __slots__ = ('patient', 'left', 'right', 'height', 'size')
+
     def __init__(self, patient):
         self.patient = patient
         self.left = None
         self.right = None
+        self.height = 1
+        # Nodes in the subtree rooted here, for positional lookups
+        self.size = 1
+
+def _height(node):
+    return node.height if node is not None else 0
+
+def _size(node):
+    return node.size if node is not None else 0
+
+def _update(node):
+    node.height = 1 + max(_height(node.left), _height(node.right))
+    node.size = 1 + _size(node.left) + _size(node.right)
+
+def _rotate_left(node):
+    pivot = node.right
+    node.right = pivot.left
+    pivot.left = node
+    _update(node)
+    _update(pivot)
+    return pivot
+
+def _rotate_right(node):
+    pivot = node.left
+    node.left = pivot.right
+    pivot.right = node
+    _update(node)
+    _update(pivot)
+    return pivot
+
+def _rebalance(node):
+    _update(node)
+    balance = _height(node.left) - _height(node.right)
+    if metrics.enabled and (balance > 1 or balance < -1):
+        metrics.count('bst_rebalances_total')
+    if balance > 1:
+        if _height(node.left.left) < _height(node.left.right):
+            node.left = _rotate_left(node.left)
+        return _rotate_right(node)
+    if balance < -1:
+        if _height(node.right.right) < _height(node.right.left):
+            node.right = _rotate_right(node.right)
+        return _rotate_left(node)
+    return node
+
+def _record(operation, patient_id, visits, found=None):
+    metrics.count('bst_operations_total', operation=operation)
+    metrics.observe('bst_visits', visits, metrics.COUNT_BUCKETS, operation=operation)
+    detail = f"id={patient_id} visits={visits}"
+    if found is not None:
+        detail += " found" if found else " missing"
+    metrics.trace(f"bst.{operation}", detail)
 
 class PatientBST:
-    def __init__(self):
+    """AVL tree of patients keyed by id.
+
+    Rows arrive from the database in ascending id order, which turns a plain
+    BST into a linked list, so the tree rebalances itself after every insert
+    and delete to keep its height at O(log n). All operations are iterative
+    so large tables do not hit Python's recursion limit.
+
+    Each node also counts the nodes below it, so the tree can find the
+    patient at a position (select) and the position of an id (rank) in
+    O(log n), and iterate from any id without listing the whole table.
+    """
+
+    def __init__(self, load=True, lazy=False):
         self.root = None
-        self.load_from_db()
+        # In lazy mode nodes hold only the id and name, and each record
+        # reads the rest of its row the first time it is used
+        self.lazy = lazy
+        if load:
+            self.load_from_db()
 
     def load_from_db(self):
-        conn = sqlite3.connect('database.db')
+        conn = get_connection()
         c = conn.cursor()
 
-        # Ensure table has all required columns
-        c.execute("PRAGMA table_info(appointments)")
-        columns = [col[1] for col in c.fetchall()]
-
-        if 'is_emergency' not in columns:
-            try:
-                c.execute("ALTER TABLE appointments ADD COLUMN is_emergency INTEGER DEFAULT 0")
-                conn.commit()
-            except sqlite3.Error as e:
-                print(f"Couldn't add is_emergency column: {e}")
-
-        c.execute("SELECT * FROM appointments")
-        for row in c.fetchall():
-            patient = {
-                'id': row[0],
-                'name': row[1],
-                'age': row[2],
-                'gender': row[3],
-                'location': row[4],
-                'phone': row[5],
-                'time': row[6],
-                'is_emergency': bool(row[7]) if len(row) > 7 else False
-            }
-            self.insert(patient)
-        conn.close()
+        if self.lazy:
+            c.execute("SELECT id, name FROM appointments ORDER BY id")
+            patients = [LazyPatientRecord(patient_id, name=name)
+                        for patient_id, name in c.fetchall()]
+        else:
+            c.execute(f"SELECT {PATIENT_COLUMNS} FROM appointments ORDER BY id")
+            patients = [PatientRecord.from_row(row) for row in c.fetchall()]
+        self.build_from_sorted(patients)
+
+    def build_from_sorted(self, patients):
+        """Replace the tree with a perfectly balanced one in O(n).
+
+        `patients` must already be sorted by id with no duplicates, e.g. rows
+        from `ORDER BY id`.
+        """
+        def build(lo, hi):
+            if lo > hi:
+                return None
+            mid = (lo + hi) // 2
+            node = PatientBSTNode(patients[mid])
+            node.left = build(lo, mid - 1)
+            node.right = build(mid + 1, hi)
+            # A perfectly balanced tree of k nodes is k.bit_length() high
+            node.size = hi - lo + 1
+            node.height = node.size.bit_length()
+            return node
+
+        # Recursion depth is only log2(n) here because the halves are equal
+        self.root = build(0, len(patients) - 1)
+
+    def _path_to(self, patient_id):
+        # Returns the nodes visited from the root down to where patient_id
+        # lives (or would be attached).
+        path = []
+        node = self.root
+        while node is not None:
+            path.append(node)
+            if patient_id < node.patient['id']:
+                node = node.left
+            elif patient_id > node.patient['id']:
+                node = node.right
+            else:
+                break
+        return path
+
+    def _retrace(self, path):
+        # Walk back up a search path, rebalancing each node and re-linking
+        # it to its (possibly rotated) parent.
+        for i in range(len(path) - 1, -1, -1):
+            node = path[i]
+            old_height = node.height
+            balanced = _rebalance(node)
+            if balanced is node and node.height == old_height:
+                # No rotations above this node, but their sizes still change
+                for ancestor in reversed(path[:i]):
+                    ancestor.size = 1 + _size(ancestor.left) + _size(ancestor.right)
+                break
+            if i == 0:
+                self.root = balanced
+            else:
+                parent = path[i - 1]
+                if parent.left is node:
+                    parent.left = balanced
+                else:
+                    parent.right = balanced
 
     def insert(self, patient):
         if self.root is None:
             self.root = PatientBSTNode(patient)
+            return
+
+        patient_id = patient['id']
+        path = self._path_to(patient_id)
+        if metrics.enabled:
+            _record('insert', patient_id, len(path))
+        parent = path[-1]
+        if patient_id < parent.patient['id']:
+            parent.left = PatientBSTNode(patient)
+        elif patient_id > parent.patient['id']:
+            parent.right = PatientBSTNode(patient)
         else:
-            self._insert(patient, self.root)
+            # Duplicate ids are ignored, as before
+            return
+        self._retrace(path)
+
+    def search(self, patient_id):
+        if metrics.enabled:
+            return self._search_traced(patient_id)
+        node = self.root
+        while node is not None:
+            node_id = node.patient['id']
+            if patient_id == node_id:
+                return node.patient
+            node = node.left if patient_id < node_id else node.right
+        return None
+
+    def _search_traced(self, patient_id):
+        # search() with a count of the nodes visited on the way down
+        visits = 0
+        node = self.root
+        while node is not None:
+            visits += 1
+            node_id = node.patient['id']
+            if patient_id == node_id:
+                break
+            node = node.left if patient_id < node_id else node.right
+        _record('search', patient_id, visits, found=node is not None)
+        return node.patient if node is not None else None
+
+    def update(self, patient_id, updated_data):
+        patient = self.search(patient_id)
+        if patient is None:
+            return False
+        patient.update(updated_data)
+        return True
 
-    def _insert(self, patient, current_node):
-        if patient['id'] < current_node.patient['id']:
-            if current_node.left is None:
-                current_node.left = PatientBSTNode(patient)
+    def first(self):
+        """Patient with the smallest id, or None if the tree is empty."""
+        node = self.root
+        if node is None:
+            return None
+        while node.left is not None:
+            node = node.left
+        return node.patient
+
+    def last(self):
+        """Patient with the largest id, or None if the tree is empty."""
+        node = self.root
+        if node is None:
+            return None
+        while node.right is not None:
+            node = node.right
+        return node.patient
+
+    def successor(self, patient_id):
+        """Patient with the smallest id greater than patient_id, or None.
+
+        patient_id does not have to be in the tree, so a cursor survives
+        the deletion of the patient it points at.
+        """
+        best = None
+        node = self.root
+        while node is not None:
+            if node.patient['id'] > patient_id:
+                best = node.patient
+                node = node.left
             else:
-                self._insert(patient, current_node.left)
-        elif patient['id'] > current_node.patient['id']:
-            if current_node.right is None:
-                current_node.right = PatientBSTNode(patient)
+                node = node.right
+        return best
+
+    def predecessor(self, patient_id):
+        """Patient with the largest id less than patient_id, or None."""
+        best = None
+        node = self.root
+        while node is not None:
+            if node.patient['id'] < patient_id:
+                best = node.patient
+                node = node.right
             else:
-                self._insert(patient, current_node.right)
+                node = node.left
+        return best
 
-    def search(self, patient_id):
-        return self._search(patient_id, self.root)
+    def inorder_traversal(self):
+        return list(self.iter_from())
+
+    def __iter__(self):
+        return self.iter_from()
+
+    def __len__(self):
+        return _size(self.root)
+
+    def iter_from(self, patient_id=None):
+        """Yield patients in id order, starting at the first id >= patient_id.
 
-    def _search(self, patient_id, current_node):
-        if current_node is None:
+        Lazy: reaching the first patient is O(log n), and each one after
+        it O(1) on average.
+        """
+        stack = []
+        node = self.root
+        # Stack the nodes from the root down to the start whose own
+        # patient and right subtree still lie ahead
+        while node is not None:
+            if patient_id is None or node.patient['id'] >= patient_id:
+                stack.append(node)
+                node = node.left
+            else:
+                node = node.right
+        while stack:
+            node = stack.pop()
+            yield node.patient
+            node = node.right
+            while node is not None:
+                stack.append(node)
+                node = node.left
+
+    def range(self, low, high):
+        """Yield patients with low <= id <= high, in id order."""
+        for patient in self.iter_from(low):
+            if patient['id'] > high:
+                return
+            yield patient
+
+    def select(self, index):
+        """Patient at position index (0-based) in id order, or None."""
+        if not 0 <= index < _size(self.root):
             return None
-        elif current_node.patient['id'] == patient_id:
-            return current_node.patient
-        elif patient_id < current_node.patient['id']:
-            return self._search(patient_id, current_node.left)
-        else:
-            return self._search(patient_id, current_node.right)
+        node = self.root
+        while True:
+            left = _size(node.left)
+            if index < left:
+                node = node.left
+            elif index > left:
+                index -= left + 1
+                node = node.right
+            else:
+                return node.patient
 
-    def inorder_traversal(self):
-        patients = []
-        self._inorder_traversal(self.root, patients)
-        return patients
+    def rank(self, patient_id):
+        """Number of patients with an id below patient_id.
 
-    def _inorder_traversal(self, node, patients):
-        if node is not None:
-            self._inorder_traversal(node.left, patients)
-            patients.append(node.patient)
-            self._inorder_traversal(node.right, patients)
+        That is patient_id's 0-based position when it is in the tree.
+        """
+        position = 0
+        node = self.root
+        while node is not None:
+            if patient_id <= node.patient['id']:
+                node = node.left
+            else:
+                position += _size(node.left) + 1
+                node = node.right
+        return position
 
     def delete(self, patient_id):
-        self.root = self._delete(self.root, patient_id)
+        path = self._path_to(patient_id)
+        if metrics.enabled:
+            _record('delete', patient_id, len(path))
+        if not path or path[-1].patient['id'] != patient_id:
+            return
 
-    def _delete(self, node, patient_id):
-        if node is None:
-            return node
+        target = path[-1]
+        if target.left is not None and target.right is not None:
+            # Copy the in-order successor into target, then unlink the
+            # successor, which has at most one (right) child.
+            path.append(target.right)
+            while path[-1].left is not None:
+                path.append(path[-1].left)
+            successor = path[-1]
+            target.patient = successor.patient
+            removed, child = successor, successor.right
+        else:
+            removed = target
+            child = target.left if target.left is not None else target.right
 
-        if patient_id < node.patient['id']:
-            node.left = self._delete(node.left, patient_id)
-        elif patient_id > node.patient['id']:
-            node.right = self._delete(node.right, patient_id)
+        path.pop()
+        if not path:
+            self.root = child
+            return
+        parent = path[-1]
+        if parent.left is removed:
+            parent.left = child
         else:
-            if node.left is None:
-                return node.right
-            elif node.right is None:
-                return node.left
-
-            temp = self._min_value_node(node.right)
-            node.patient = temp.patient
-            node.right = self._delete(node.right, temp.patient['id'])
-
-        return node
-
-    def _min_value_node(self, node):
-        current = node
-        while current.left is not None:
-            current = current.left
-        return current
\ No newline at end of file
+            parent.right = child
+        self._retrace(path)
+
+    def height(self):
+        return _height(self.root)
+
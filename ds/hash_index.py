@@ -0,0 +1,301 @@
+import re
+import zlib
+
+from db import metrics
+from ds.name_index import normalize_name
+
+# Share of slots (live or deleted) in use before the table grows
+MAX_LOAD = 0.6
+MIN_CAPACITY = 8
+# Slots moved out of the old table on every write while growing. With
+# MAX_LOAD at 0.6 the move ends well before the new table fills up.
+RESIZE_STEP = 4
+
+_EMPTY = -1
+_DELETED = -2
+
+# Trailing digits compared in phone numbers, i.e. the subscriber number,
+# so 0712 345 678 and +254 712 345 678 are the same phone
+PHONE_DIGITS = 9
+
+KEY_FIELDS = ('phone', 'name', 'location')
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+def _hash(key):
+    # crc32 rather than hash(): str hashes change from run to run, and the
+    # slot layout is saved in the index snapshot
+    return zlib.crc32(key.encode())
+
+
+def _record_probes(index, probes):
+    metrics.observe('hash_probes', probes, metrics.COUNT_BUCKETS, index=index)
+
+
+class _Slots:
+    """One table of slots: parallel lists of hash, key and value."""
+
+    __slots__ = ('hashes', 'keys', 'values', 'used', 'mask')
+
+    def __init__(self, capacity):
+        self.hashes = [_EMPTY] * capacity
+        self.keys = [None] * capacity
+        self.values = [None] * capacity
+        self.used = 0           # live and deleted slots
+        self.mask = capacity - 1
+
+    def find(self, key, key_hash):
+        """Return (slot of key or -1, slots probed)."""
+        hashes = self.hashes
+        i = key_hash & self.mask
+        probes = 1
+        while True:
+            slot_hash = hashes[i]
+            if slot_hash == _EMPTY:
+                return -1, probes
+            if slot_hash == key_hash and self.keys[i] == key:
+                return i, probes
+            i = (i + 1) & self.mask
+            probes += 1
+
+    def add(self, key, key_hash, value):
+        # The key must not be in the table; the first deleted slot on its
+        # probe path is reused
+        hashes = self.hashes
+        i = key_hash & self.mask
+        while hashes[i] >= 0:
+            i = (i + 1) & self.mask
+        if hashes[i] == _EMPTY:
+            self.used += 1
+        hashes[i] = key_hash
+        self.keys[i] = key
+        self.values[i] = value
+
+    def remove(self, i):
+        # Deleted slots keep probe paths through them intact
+        self.hashes[i] = _DELETED
+        self.keys[i] = None
+        self.values[i] = None
+
+    def __len__(self):
+        return self.mask + 1
+
+
+class HashIndex:
+    """Hash table from string keys to values, using open addressing.
+
+    Slots live in parallel lists and are probed linearly. When more than
+    MAX_LOAD of them are in use, a larger table is started and each later
+    write moves a few slots of the old one across, so no single write
+    pays for rehashing everything. Lookups check both tables meanwhile.
+    """
+
+    def __init__(self, name='hash', capacity=MIN_CAPACITY):
+        self.name = name
+        self._table = _Slots(capacity)
+        self._old = None
+        self._moved = 0
+        self._count = 0
+
+    def _find(self, key, key_hash):
+        # Returns (table holding key or None, slot)
+        i, probes = self._table.find(key, key_hash)
+        table = self._table
+        if i < 0 and self._old is not None:
+            i, more = self._old.find(key, key_hash)
+            probes += more
+            table = self._old
+        if metrics.enabled:
+            _record_probes(self.name, probes)
+        return (table, i) if i >= 0 else (None, -1)
+
+    def get(self, key, default=None):
+        table, i = self._find(key, _hash(key))
+        return default if table is None else table.values[i]
+
+    def __contains__(self, key):
+        return self._find(key, _hash(key))[0] is not None
+
+    def __len__(self):
+        return self._count
+
+    def put(self, key, value):
+        self._move_some()
+        key_hash = _hash(key)
+        table, i = self._find(key, key_hash)
+        if table is self._table:
+            table.values[i] = value
+            return
+        if table is not None:
+            # Still in the old table: move it across now
+            table.remove(i)
+        else:
+            self._count += 1
+        if self._table.used + 1 > len(self._table) * MAX_LOAD:
+            self._grow()
+        self._table.add(key, key_hash, value)
+
+    def pop(self, key, default=None):
+        self._move_some()
+        table, i = self._find(key, _hash(key))
+        if table is None:
+            return default
+        value = table.values[i]
+        table.remove(i)
+        self._count -= 1
+        return value
+
+    def items(self):
+        for table in (self._table, self._old):
+            if table is not None:
+                for key_hash, key, value in zip(table.hashes, table.keys, table.values):
+                    if key_hash >= 0:
+                        yield key, value
+
+    def load_factor(self):
+        return self._table.used / len(self._table)
+
+    def _grow(self):
+        self._finish_move()
+        capacity = len(self._table)
+        # Room for twice the live keys, so the next resize is a while off;
+        # a table full of deleted slots is rebuilt at the same size
+        while self._count * 2 > capacity * MAX_LOAD:
+            capacity *= 2
+        self._old = self._table
+        self._table = _Slots(capacity)
+        self._moved = 0
+        if metrics.enabled:
+            metrics.count('hash_resizes_total', index=self.name)
+            metrics.trace('hash.resize', f"{self.name} {len(self._old)} -> {capacity} slots")
+
+    def _move_some(self, steps=RESIZE_STEP):
+        old = self._old
+        if old is None:
+            return
+        end = min(self._moved + steps, len(old))
+        for i in range(self._moved, end):
+            key_hash = old.hashes[i]
+            if key_hash >= 0:
+                self._table.add(old.keys[i], key_hash, old.values[i])
+                old.remove(i)
+        self._moved = end
+        if end == len(old):
+            self._old = None
+
+    def _finish_move(self):
+        if self._old is not None:
+            self._move_some(len(self._old))
+
+    @classmethod
+    def from_items(cls, name, mapping):
+        """Build an index holding a dict's items, sized for them up front."""
+        capacity = MIN_CAPACITY
+        while len(mapping) * 2 > capacity * MAX_LOAD:
+            capacity *= 2
+        index = cls(name, capacity)
+        add = index._table.add
+        for key, value in mapping.items():
+            add(key, _hash(key), value)
+        index._count = len(mapping)
+        return index
+
+    def parts(self):
+        """The slot lists (hashes, keys, values), for saving in a snapshot."""
+        self._finish_move()
+        return self._table.hashes, self._table.keys, self._table.values
+
+    @classmethod
+    def from_parts(cls, name, hashes, keys, values):
+        """Rebuild an index from the lists returned by parts()."""
+        index = cls(name, capacity=len(hashes))
+        table = index._table
+        table.hashes = hashes
+        table.keys = keys
+        table.values = values
+        table.used = sum(1 for key_hash in hashes if key_hash != _EMPTY)
+        index._count = sum(1 for key_hash in hashes if key_hash >= 0)
+        return index
+
+
+class MultiHashIndex(HashIndex):
+    """HashIndex where each key holds several values, in insertion order.
+
+    A bucket is a dict used as an ordered set, so adding and removing a
+    value is O(1) however many values share the key.
+    """
+
+    def add(self, key, value):
+        bucket = self.get(key)
+        if bucket is None:
+            self.put(key, {value: None})
+        else:
+            bucket[value] = None
+
+    def discard(self, key, value):
+        bucket = self.get(key)
+        if bucket is not None:
+            bucket.pop(value, None)
+            if not bucket:
+                self.pop(key)
+
+    def find(self, key):
+        bucket = self.get(key)
+        return list(bucket) if bucket else []
+
+
+def normalize_phone(phone):
+    return _NON_DIGITS.sub('', str(phone or ''))[-PHONE_DIGITS:]
+
+
+def normalize_key(field, value):
+    return normalize_phone(value) if field == 'phone' else normalize_name(value or '')
+
+
+class PatientKeyIndex:
+    """Patient ids by normalized phone number, name and location.
+
+    Pass a patient's record to delete() before changing it, and to
+    insert() afterwards, so its old keys can be found.
+    """
+
+    def __init__(self, patients=(), indexes=None):
+        if indexes is None:
+            # Group first, so each index is built once at its final size
+            groups = {field: {} for field in KEY_FIELDS}
+            for patient in patients:
+                for field, group in groups.items():
+                    key = normalize_key(field, patient[field])
+                    if key:
+                        group.setdefault(key, {})[patient['id']] = None
+            indexes = {field: MultiHashIndex.from_items(field, group)
+                       for field, group in groups.items()}
+        self.indexes = indexes
+
+    def insert(self, patient):
+        for field, index in self.indexes.items():
+            key = normalize_key(field, patient[field])
+            if key:
+                index.add(key, patient['id'])
+
+    def delete(self, patient):
+        for field, index in self.indexes.items():
+            key = normalize_key(field, patient[field])
+            if key:
+                index.discard(key, patient['id'])
+
+    def find(self, field, value):
+        """Ids of patients whose field matches value once normalized."""
+        key = normalize_key(field, value)
+        return self.indexes[field].find(key) if key else []
+
+    def duplicates(self, name, phone):
+        """Ids of patients with both this name and this phone number."""
+        by_phone = self.indexes['phone'].get(normalize_phone(phone))
+        by_name = self.indexes['name'].get(normalize_name(name or ''))
+        if not by_phone or not by_name:
+            return []
+        if len(by_name) < len(by_phone):
+            by_phone, by_name = by_name, by_phone
+        return [patient_id for patient_id in by_phone if patient_id in by_name]
@@ -1,46 +1,44 @@
-import sqlite3
+from db import metrics
+from db.database import PATIENT_COLUMNS, get_connection
+from ds.record import PatientRecord
+
+
+def _record(patient_id, result):
+    metrics.count('hash_lookups_total', result=result)
+    metrics.trace('hash.get', f"id={patient_id} {result}")
+
 
 class PatientHashTable:
-    def __init__(self):
+    def __init__(self, load=True):
         self.table = {}
-        self.load_from_db()
+        if load:
+            self.load_from_db()
 
     def load_from_db(self):
-        conn = sqlite3.connect('database.db')
+        conn = get_connection()
         c = conn.cursor()
-
-        # Check and fix table structure if needed
-        c.execute("PRAGMA table_info(appointments)")
-        columns = [col[1] for col in c.fetchall()]
-
-        if 'is_emergency' not in columns:
-            try:
-                c.execute("ALTER TABLE appointments ADD COLUMN is_emergency INTEGER DEFAULT 0")
-                conn.commit()
-            except sqlite3.Error as e:
-                print(f"Couldn't add is_emergency column: {e}")
-
-        c.execute("SELECT * FROM appointments")
+        c.execute(f"SELECT {PATIENT_COLUMNS} FROM appointments ORDER BY id")
         for row in c.fetchall():
-            patient_id = row[0]
-            self.table[patient_id] = {
-                'id': row[0],
-                'name': row[1],
-                'age': row[2],
-                'gender': row[3],
-                'location': row[4],
-                'phone': row[5],
-                'time': row[6],
-                'is_emergency': bool(row[7]) if len(row) > 7 else False
-            }
-        conn.close()
+            self.table[row[0]] = PatientRecord.from_row(row)
+
+    def build_from_records(self, patients):
+        self.table = {patient['id']: patient for patient in patients}
 
     def get_patient(self, patient_id):
-        return self.table.get(patient_id)
+        patient = self.table.get(patient_id)
+        if metrics.enabled:
+            _record(patient_id, 'hit' if patient is not None else 'miss')
+        return patient
 
     def get_all_patients(self):
         return list(self.table.values())
 
+    def get_all_ids(self):
+        return list(self.table)
+
+    def add_patient(self, patient):
+        self.table[patient['id']] = patient
+
     def update_patient(self, patient_id, updated_data):
         if patient_id in self.table:
             self.table[patient_id].update(updated_data)
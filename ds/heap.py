@@ -0,0 +1,104 @@
+class IndexedHeap:
+    """Binary min-heap whose entries can be found, re-keyed and removed by key.
+
+    `_pos` maps each key to its slot in `_heap`, so update and remove are
+    O(log n) instead of needing a linear search.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._pos = {}
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, key):
+        return key in self._pos
+
+    def push(self, key, rank, value):
+        if key in self._pos:
+            raise KeyError(f"{key!r} is already in the heap")
+        self._heap.append([rank, key, value])
+        self._pos[key] = len(self._heap) - 1
+        self._sift_up(len(self._heap) - 1)
+
+    def peek(self):
+        """Return (key, rank, value) of the smallest entry, or None."""
+        if not self._heap:
+            return None
+        rank, key, value = self._heap[0]
+        return key, rank, value
+
+    def pop(self):
+        if not self._heap:
+            return None
+        top = self.peek()
+        self._remove_at(0)
+        return top
+
+    def get(self, key):
+        i = self._pos.get(key)
+        if i is None:
+            return None
+        rank, _, value = self._heap[i]
+        return key, rank, value
+
+    def update(self, key, rank):
+        i = self._pos[key]
+        old = self._heap[i][0]
+        self._heap[i][0] = rank
+        if rank < old:
+            self._sift_up(i)
+        else:
+            self._sift_down(i)
+
+    def remove(self, key):
+        i = self._pos.get(key)
+        if i is None:
+            return None
+        entry = self.get(key)
+        self._remove_at(i)
+        return entry
+
+    def items(self):
+        """All (key, rank, value) entries in pop order."""
+        return [(key, rank, value) for rank, key, value in sorted(self._heap, key=lambda e: e[0])]
+
+    def _remove_at(self, i):
+        del self._pos[self._heap[i][1]]
+        last = self._heap.pop()
+        if i == len(self._heap):
+            # The removed entry was the last slot
+            return
+        self._heap[i] = last
+        self._pos[last[1]] = i
+        self._sift_up(i)
+        self._sift_down(self._pos[last[1]])
+
+    def _swap(self, i, j):
+        heap = self._heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self._pos[heap[i][1]] = i
+        self._pos[heap[j][1]] = j
+
+    def _sift_up(self, i):
+        heap = self._heap
+        while i > 0:
+            parent = (i - 1) // 2
+            if heap[i][0] >= heap[parent][0]:
+                break
+            self._swap(i, parent)
+            i = parent
+
+    def _sift_down(self, i):
+        heap = self._heap
+        size = len(heap)
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < size and heap[child][0] < heap[smallest][0]:
+                    smallest = child
+            if smallest == i:
+                break
+            self._swap(i, smallest)
+            i = smallest
@@ -0,0 +1,133 @@
+from bisect import bisect_left, insort
+
+
+def normalize_name(name):
+    """Lower-case a name and collapse runs of whitespace to single spaces."""
+    return ' '.join(str(name).casefold().split())
+
+
+def _word_keys(name):
+    # The name from the start of each word on, so "mary wanjiku" can be
+    # found by "mary wa" as well as by "wanj"
+    keys = [name]
+    for i, ch in enumerate(name):
+        if ch == ' ':
+            keys.append(name[i + 1:])
+    return keys
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class PatientNameIndex:
+    """In-memory index of patient names for type-ahead search.
+
+    Prefix queries use a sorted list of (key, id) pairs searched with
+    bisect, where each name contributes one key per word. Substring queries
+    look up the names sharing the query's rarest trigram and check those.
+    """
+
+    def __init__(self, patients=()):
+        self._names = {}
+        self._keys = []
+        self._trigrams = {}
+        entries = []
+        for patient in patients:
+            name = normalize_name(patient['name'] or '')
+            self._names[patient['id']] = name
+            entries.extend((key, patient['id']) for key in _word_keys(name))
+            self._add_trigrams(patient['id'], name)
+        entries.sort()
+        self._keys = entries
+
+    def parts(self):
+        """The index's internal structures, for saving in a snapshot."""
+        return self._names, self._keys, self._trigrams
+
+    @classmethod
+    def from_parts(cls, names, keys, trigrams):
+        """Rebuild an index from the structures returned by parts()."""
+        index = cls()
+        index._names = names
+        index._keys = keys
+        index._trigrams = trigrams
+        return index
+
+    def _add_trigrams(self, patient_id, name):
+        for gram in _trigrams(name):
+            self._trigrams.setdefault(gram, set()).add(patient_id)
+
+    def insert(self, patient_id, name):
+        if patient_id in self._names:
+            self.delete(patient_id)
+        name = normalize_name(name or '')
+        self._names[patient_id] = name
+        for key in _word_keys(name):
+            insort(self._keys, (key, patient_id))
+        self._add_trigrams(patient_id, name)
+
+    def delete(self, patient_id):
+        name = self._names.pop(patient_id, None)
+        if name is None:
+            return False
+        for key in _word_keys(name):
+            i = bisect_left(self._keys, (key, patient_id))
+            if i < len(self._keys) and self._keys[i] == (key, patient_id):
+                del self._keys[i]
+        for gram in _trigrams(name):
+            ids = self._trigrams.get(gram)
+            if ids is not None:
+                ids.discard(patient_id)
+                if not ids:
+                    del self._trigrams[gram]
+        return True
+
+    def update(self, patient_id, name):
+        self.insert(patient_id, name)
+
+    def prefix(self, query, limit=None):
+        """Ids of patients with a word starting with query, in name order."""
+        query = normalize_name(query)
+        if not query:
+            return []
+        results = []
+        seen = set()
+        i = bisect_left(self._keys, (query,))
+        while i < len(self._keys) and self._keys[i][0].startswith(query):
+            patient_id = self._keys[i][1]
+            if patient_id not in seen:
+                seen.add(patient_id)
+                results.append(patient_id)
+                if limit is not None and len(results) >= limit:
+                    break
+            i += 1
+        return results
+
+    def substring(self, query, limit=None):
+        """Ids of patients whose name contains query anywhere."""
+        query = normalize_name(query)
+        if not query:
+            return []
+        if len(query) < 3:
+            # Too short for trigrams; such queries match so many names that
+            # a scan reaches the limit almost immediately
+            candidates = self._names
+        else:
+            postings = [self._trigrams.get(gram) for gram in _trigrams(query)]
+            if not all(postings):
+                return []
+            # Checking the rarest trigram's names directly is cheaper than
+            # intersecting every posting set, and can stop at the limit
+            candidates = min(postings, key=len)
+
+        results = []
+        for patient_id in candidates:
+            if query in self._names[patient_id]:
+                results.append(patient_id)
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
+
+    def __len__(self):
+        return len(self._names)
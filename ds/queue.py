@@ -1,34 +1,177 @@
-from collections import deque
-import heapq
+import threading
+import time
+
+from db import metrics
+from db.database import execute_query, fetch_query, shard_for_id
+from ds.scheduler import StrictPriorityScheduler
+
+# Queue priorities; higher numbers are seen first
+REGULAR = 0
+EMERGENCY = 1
+
+
+def _record(operation, detail):
+    metrics.count('queue_operations_total', operation=operation)
+    metrics.trace(f"queue.{operation}", detail)
+
 
 class PatientQueue:
-    def __init__(self):
-        self.regular_queue = deque()
-        self.priority_queue = []
+    """Triage queue of waiting patients.
+
+    The order is decided by a pluggable scheduler from ds.scheduler; the
+    default, StrictPriorityScheduler, sees emergencies first and everyone
+    else first come first served. Appointments with a `not_before` time
+    (their parsed scheduled_time) are not called before it.
+
+    With persistent=True every change is written through to the
+    `triage_queue` table, and the queue is rebuilt from it in one query on
+    start-up, so waiting patients survive a restart or crash.
+
+    `lock` guards the in-memory scheduler only; database writes are made
+    outside it, so readers never wait on SQLite. Changes are expected to
+    come from one thread at a time.
+    """
+
+    def __init__(self, persistent=False, scheduler=None, clock=time.time, lock=None):
+        self.scheduler = scheduler if scheduler is not None else StrictPriorityScheduler()
+        self.clock = clock
+        self.lock = lock if lock is not None else threading.RLock()
         self.patient_counter = 0
+        self.persistent = persistent
+        if persistent:
+            self.load_from_db()
+
+    def load_from_db(self):
+        rows = fetch_query("""SELECT q.appointment_id, q.priority, q.seq, q.enqueued_at,
+                                     q.not_before, a.name
+                              FROM triage_queue q
+                              JOIN appointments a ON a.id = q.appointment_id
+                              ORDER BY q.seq""") or []
+        now = self.clock()
+        with self.lock:
+            for patient_id, priority, seq, enqueued_at, not_before, name in rows:
+                self.scheduler.remove(patient_id)
+                self.scheduler.push(patient_id, priority, enqueued_at or now,
+                                    {'id': patient_id, 'name': name}, not_before)
+                self.patient_counter = max(self.patient_counter, seq)
 
-    def add_patient(self, name, is_emergency=False):
+    def add_patient(self, name, is_emergency=False, patient_id=None, level=None,
+                    not_before=None):
+        """Queue a patient at `level` (EMERGENCY or REGULAR by default).
+
+        Returns the queued patient, or None if it could not be saved.
+        """
         self.patient_counter += 1
-        patient = {'id': self.patient_counter, 'name': name}
-        if is_emergency:
-            heapq.heappush(self.priority_queue, (-self.patient_counter, patient))
-        else:
-            self.regular_queue.append(patient)
+        if patient_id is None:
+            patient_id = self.patient_counter
+        if level is None:
+            level = EMERGENCY if is_emergency else REGULAR
+        now = self.clock()
+        if self.persistent and execute_query(
+                """INSERT OR REPLACE INTO triage_queue
+                   (appointment_id, priority, seq, enqueued_at, not_before)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (patient_id, level, self.patient_counter, now, not_before),
+                shard=shard_for_id(patient_id)) is None:
+            return None
+        patient = {'id': patient_id, 'name': name}
+        with self.lock:
+            self.scheduler.remove(patient_id)
+            self.scheduler.push(patient_id, level, now, patient, not_before)
+        if metrics.enabled:
+            _record('push', f"id={patient_id} level={level}")
         return patient
 
+    def peek(self):
+        with self.lock:
+            top = self.scheduler.peek(self.clock())
+        return top[2] if top else None
+
     def get_next_patient(self):
-        if self.priority_queue:
-            return heapq.heappop(self.priority_queue)[1]
-        elif self.regular_queue:
-            return self.regular_queue.popleft()
-        return None
+        with self.lock:
+            top = self.scheduler.peek(self.clock())
+        if top is None:
+            return None
+        if self.persistent and execute_query(
+                "DELETE FROM triage_queue WHERE appointment_id = ?", (top[0],),
+                shard=shard_for_id(top[0])) is None:
+            return None
+        with self.lock:
+            self.scheduler.remove(top[0])
+        if metrics.enabled:
+            _record('pop', f"id={top[0]} waiting={len(self.scheduler)}")
+        return top[2]
+
+    def cancel(self, patient_id):
+        """Take a patient out of the queue without serving them."""
+        if patient_id not in self:
+            return False
+        if self.persistent and execute_query(
+                "DELETE FROM triage_queue WHERE appointment_id = ?", (patient_id,),
+                shard=shard_for_id(patient_id)) is None:
+            return False
+        with self.lock:
+            self.scheduler.remove(patient_id)
+        return True
+
+    def discard(self, patient_id):
+        """Drop a patient from memory only, when their row is already gone."""
+        with self.lock:
+            return self.scheduler.remove(patient_id) is not None
+
+    def rename(self, patient_id, name):
+        """Show a waiting patient under a new name.
+
+        Queue entries hold their own copy of the name, so the repository
+        calls this when a patient's record changes.
+        """
+        with self.lock:
+            entry = self.scheduler.get(patient_id)
+            if entry is not None:
+                entry[2]['name'] = name
+
+    def increase_priority(self, patient_id, priority=EMERGENCY):
+        """Move a waiting patient up to level `priority`, keeping their place
+        in arrival order.
+
+        Emergencies are seen at once, so escalating to EMERGENCY or above
+        drops the patient's not_before time, as add_patient's callers do
+        for new emergencies.
+
+        Returns False if they are not waiting or already at that level or above.
+        """
+        with self.lock:
+            entry = self.scheduler.get(patient_id)
+        if entry is None or priority <= entry[0]:
+            return False
+        release = priority >= EMERGENCY
+        if self.persistent and execute_query(
+                "UPDATE triage_queue SET priority = ?"
+                + (", not_before = NULL" if release else "")
+                + " WHERE appointment_id = ?",
+                (priority, patient_id), shard=shard_for_id(patient_id)) is None:
+            return False
+        with self.lock:
+            if patient_id not in self.scheduler:
+                return False
+            self.scheduler.change_level(patient_id, priority)
+            if release:
+                self.scheduler.release(patient_id, self.clock())
+        if metrics.enabled:
+            _record('escalate', f"id={patient_id} level={priority}")
+        return True
 
     def __len__(self):
-        return len(self.regular_queue) + len(self.priority_queue)
+        return len(self.scheduler)
+
+    def __contains__(self, patient_id):
+        with self.lock:
+            return patient_id in self.scheduler
 
     def get_queue_status(self):
-        status = {
-            'regular': list(self.regular_queue),
-            'priority': [item[1] for item in self.priority_queue]
-        }
-        return status
\ No newline at end of file
+        status = {'regular': [], 'priority': []}
+        with self.lock:
+            items = self.scheduler.items(self.clock())
+        for _, level, patient in items:
+            status['priority' if level > REGULAR else 'regular'].append(patient)
+        return status
@@ -0,0 +1,143 @@
+from db.database import PATIENT_COLUMNS, fetch_query
+
+# Record fields, in the same order as the PATIENT_COLUMNS select list.
+# scheduled_at is the parsed form of time, as a Unix timestamp or None.
+PATIENT_FIELDS = ('id', 'name', 'age', 'gender', 'location', 'phone', 'time', 'is_emergency',
+                  'scheduled_at')
+
+class PatientRecord:
+    """One appointment row.
+
+    Uses __slots__ instead of a per-row dict, which takes a fraction of the
+    memory, while still supporting the dict-style access the windows use
+    (patient['name'], patient.get('age'), patient.update({...})).
+    """
+
+    __slots__ = PATIENT_FIELDS
+
+    def __init__(self, id, name=None, age=None, gender=None, location=None,
+                 phone=None, time=None, is_emergency=False, scheduled_at=None):
+        self.id = id
+        self.name = name
+        self.age = age
+        self.gender = gender
+        self.location = location
+        self.phone = phone
+        self.time = time
+        self.is_emergency = bool(is_emergency)
+        self.scheduled_at = scheduled_at
+
+    @classmethod
+    def from_row(cls, row):
+        """Build a record from a row selected with PATIENT_COLUMNS."""
+        return cls(*row)
+
+    def __getitem__(self, key):
+        if key not in PATIENT_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in PATIENT_FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in PATIENT_FIELDS
+
+    def get(self, key, default=None):
+        if key not in PATIENT_FIELDS:
+            return default
+        return getattr(self, key)
+
+    def update(self, values):
+        for key, value in values.items():
+            self[key] = value
+
+    def keys(self):
+        return PATIENT_FIELDS
+
+    def items(self):
+        return [(key, self[key]) for key in PATIENT_FIELDS]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if not isinstance(other, PatientRecord):
+            return NotImplemented
+        return self.items() == other.items()
+
+    def __repr__(self):
+        return f"PatientRecord({self.to_dict()!r})"
+
+
+class LazyPatientRecord(PatientRecord):
+    """A record that starts with only its id and sort keys set.
+
+    The rest of the row is read from the database the first time any
+    other field is accessed, and kept from then on.
+    """
+
+    __slots__ = ('_loaded',)
+
+    def __init__(self, id, **keys):
+        self.id = id
+        self._loaded = False
+        for key, value in keys.items():
+            setattr(self, key, value)
+
+    def __getattr__(self, name):
+        # Only called for fields whose slot has not been filled in yet
+        if name not in PATIENT_FIELDS or self._loaded:
+            raise AttributeError(name)
+        self._load()
+        return object.__getattribute__(self, name)
+
+    def _load(self):
+        self.fill(load_record(self.id) or PatientRecord(self.id))
+
+    def fill(self, record):
+        """Take the fields not loaded yet from record, a full copy of the row."""
+        self._loaded = True
+        for key in PATIENT_FIELDS:
+            # Keep values that were set locally before the row was loaded
+            try:
+                object.__getattribute__(self, key)
+            except AttributeError:
+                setattr(self, key, getattr(record, key))
+
+
+# Most ids bound in one IN (...) list, below SQLite's variable limit
+LOAD_BATCH = 500
+
+
+def load_record(patient_id):
+    """Read one patient from the database, or return None if it is gone."""
+    rows = fetch_query(f"SELECT {PATIENT_COLUMNS} FROM appointments WHERE id = ?",
+                       (patient_id,))
+    return PatientRecord.from_row(rows[0]) if rows else None
+
+
+def is_loaded(record):
+    """Whether every field of record can be read without a query."""
+    return not isinstance(record, LazyPatientRecord) or record._loaded
+
+
+def load_records(records):
+    """Load every lazy record in records that is not loaded yet.
+
+    Reads the rows in one query per LOAD_BATCH ids rather than one each,
+    so a list about to be shown costs a single read.
+    """
+    pending = {record.id: record for record in records if not is_loaded(record)}
+    ids = list(pending)
+    for start in range(0, len(ids), LOAD_BATCH):
+        batch = ids[start:start + LOAD_BATCH]
+        rows = fetch_query(f"SELECT {PATIENT_COLUMNS} FROM appointments "
+                           f"WHERE id IN ({', '.join('?' * len(batch))})", batch) or []
+        for row in rows:
+            pending.pop(row[0]).fill(PatientRecord.from_row(row))
+    # Rows deleted meanwhile, or a failed read
+    for patient_id, record in pending.items():
+        record.fill(PatientRecord(patient_id))
@@ -0,0 +1,213 @@
+import heapq
+
+from ds.heap import IndexedHeap
+
+# Seconds a patient waits before being treated as one level more urgent
+DEFAULT_AGING_INTERVAL = 30 * 60
+
+
+class Scheduler:
+    """Decides which waiting patient is seen next.
+
+    Patients are pushed with a triage level (higher is more urgent, from 0
+    to levels - 1), an arrival time and optionally a `not_before` time
+    taken from their appointment. A patient is not eligible before that
+    time; until then they wait in a separate heap ordered by it. Subclasses
+    decide the order among eligible patients. All times are in seconds.
+    """
+
+    def __init__(self, levels=2):
+        if levels < 1:
+            raise ValueError("A scheduler needs at least one level")
+        self.levels = levels
+        self._entries = {}      # key -> [level, ready_time, seq, value, eligible]
+        self._pending = []      # (not_before, seq, key) for entries not eligible yet
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """Return (level, ready_time, value) for a waiting key, or None."""
+        entry = self._entries.get(key)
+        return None if entry is None else (entry[0], entry[1], entry[3])
+
+    def push(self, key, level, arrival, value, not_before=None):
+        if key in self._entries:
+            raise KeyError(f"{key!r} is already waiting")
+        level = self._clamp(level)
+        self._seq += 1
+        if not_before is not None and not_before > arrival:
+            self._entries[key] = [level, not_before, self._seq, value, False]
+            heapq.heappush(self._pending, (not_before, self._seq, key))
+        else:
+            self._entries[key] = [level, arrival, self._seq, value, True]
+            self._make_ready(key)
+
+    def peek(self, now):
+        """Return (key, level, value) of the next patient, or None."""
+        self._release(now)
+        key = self._choose(now)
+        if key is None:
+            return None
+        entry = self._entries[key]
+        return key, entry[0], entry[3]
+
+    def pop(self, now):
+        top = self.peek(now)
+        if top is not None:
+            self.remove(top[0])
+        return top
+
+    def remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        if entry[4]:
+            self._forget(key)
+        return key, entry[0], entry[3]
+
+    def change_level(self, key, level):
+        entry = self._entries[key]
+        level = self._clamp(level)
+        if level == entry[0]:
+            return
+        if entry[4]:
+            self._forget(key)
+        entry[0] = level
+        if entry[4]:
+            self._make_ready(key)
+
+    def release(self, key, now):
+        """Make a waiting key eligible at `now`, dropping its not_before time."""
+        entry = self._entries[key]
+        if entry[4]:
+            return
+        # A new seq leaves the key's entry in the pending heap stale
+        self._seq += 1
+        entry[1] = now
+        entry[2] = self._seq
+        entry[4] = True
+        self._make_ready(key)
+
+    def items(self, now):
+        """All (key, level, value) in the order they would be seen at `now`,
+        followed by patients who are not eligible yet, soonest first."""
+        self._release(now)
+        ready = sorted((self._order_key(key, now), key)
+                       for key, entry in self._entries.items() if entry[4])
+        pending = sorted((entry[1], entry[2], key)
+                         for key, entry in self._entries.items() if not entry[4])
+        keys = [key for _, key in ready] + [key for _, _, key in pending]
+        return [(key, self._entries[key][0], self._entries[key][3]) for key in keys]
+
+    def _clamp(self, level):
+        return max(0, min(self.levels - 1, level))
+
+    def _release(self, now):
+        while self._pending and self._pending[0][0] <= now:
+            _, seq, key = heapq.heappop(self._pending)
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] == seq:
+                entry[4] = True
+                self._make_ready(key)
+
+    # Subclass hooks
+    def _make_ready(self, key):
+        raise NotImplementedError
+
+    def _forget(self, key):
+        raise NotImplementedError
+
+    def _choose(self, now):
+        raise NotImplementedError
+
+    def _order_key(self, key, now):
+        raise NotImplementedError
+
+
+class StrictPriorityScheduler(Scheduler):
+    """Most urgent level first, first come first served within a level.
+
+    Low levels can wait forever while more urgent patients keep arriving.
+    """
+
+    def __init__(self, levels=2):
+        super().__init__(levels)
+        self._heap = IndexedHeap()
+
+    def _make_ready(self, key):
+        level, _, seq, _, _ = self._entries[key]
+        self._heap.push(key, (-level, seq), None)
+
+    def _forget(self, key):
+        self._heap.remove(key)
+
+    def _choose(self, now):
+        top = self._heap.peek()
+        return top[0] if top else None
+
+    def _order_key(self, key, now):
+        level, _, seq, _, _ = self._entries[key]
+        return (-level, seq)
+
+
+class AgingScheduler(Scheduler):
+    """Multi-level queue where waiting raises a patient's effective level.
+
+    Every `aging_interval` seconds spent waiting counts as one more level,
+    up to the most urgent one, so a steady stream of emergencies cannot
+    starve regular patients. Each level is a FIFO (a heap on ready time);
+    picking the next patient compares only the head of each level, so
+    push, pop and remove are O(log n + levels).
+    """
+
+    def __init__(self, levels=2, aging_interval=DEFAULT_AGING_INTERVAL):
+        super().__init__(levels)
+        if aging_interval <= 0:
+            raise ValueError("aging_interval must be positive")
+        self.aging_interval = aging_interval
+        # Removed or moved entries are left in these heaps and skipped
+        # when they reach the front
+        self._queues = [[] for _ in range(levels)]
+
+    def _make_ready(self, key):
+        level, ready_time, seq, _, _ = self._entries[key]
+        heapq.heappush(self._queues[level], (ready_time, seq, key))
+
+    def _forget(self, key):
+        pass
+
+    def _head(self, level):
+        queue = self._queues[level]
+        while queue:
+            ready_time, seq, key = queue[0]
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == level and entry[2] == seq:
+                return queue[0]
+            heapq.heappop(queue)
+        return None
+
+    def _effective_level(self, level, ready_time, now):
+        boost = int(max(0.0, now - ready_time) // self.aging_interval)
+        return min(self.levels - 1, level + boost)
+
+    def _choose(self, now):
+        best = None
+        best_key = None
+        for level in range(self.levels):
+            head = self._head(level)
+            if head is None:
+                continue
+            ready_time, seq, key = head
+            order = (-self._effective_level(level, ready_time, now), ready_time, seq)
+            if best is None or order < best:
+                best, best_key = order, key
+        return best_key
+
+    def _order_key(self, key, now):
+        level, ready_time, seq, _, _ = self._entries[key]
+        return (-self._effective_level(level, ready_time, now), ready_time, seq)
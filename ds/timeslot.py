@@ -0,0 +1,115 @@
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+
+# Appointment time formats accepted from the form, with and without a date
+DATETIME_FORMATS = ('%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M',
+                    '%Y-%m-%dT%H:%M:%S', '%d/%m/%Y %H:%M')
+TIME_FORMATS = ('%H:%M', '%H:%M:%S', '%I:%M %p', '%I:%M%p', '%I %p', '%I%p')
+
+# Seconds an appointment takes up in the schedule
+SLOT_LENGTH = 15 * 60
+
+
+def parse_scheduled_time(text, today=None, require_date=False):
+    """Parse a free-form appointment time into a Unix timestamp.
+
+    A time without a date is taken to be on `today` (default: the current
+    date), or gives None with require_date. Returns None if the text is
+    not in a recognised format.
+    """
+    text = ' '.join(str(text or '').split()).upper()
+    for fmt in DATETIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).timestamp()
+        except ValueError:
+            pass
+    if require_date:
+        return None
+    for fmt in TIME_FORMATS:
+        try:
+            parsed = datetime.strptime(text, fmt).time()
+        except ValueError:
+            continue
+        return datetime.combine(today or date.today(), parsed).timestamp()
+    return None
+
+
+class TimeSlotIndex:
+    """Appointments ordered by start time, each taking `length` seconds.
+
+    Start times and ids are kept in two parallel sorted lists, so every
+    query is a bisect followed by a walk over the k matches: O(log n + k).
+    Inserting or deleting shifts the lists, which is a fast memmove even
+    for a few hundred thousand appointments.
+    """
+
+    def __init__(self, slots=(), length=SLOT_LENGTH):
+        self.length = length
+        slots = sorted((start, patient_id) for patient_id, start in slots
+                       if start is not None)
+        self._starts = [start for start, _ in slots]
+        self._ids = [patient_id for _, patient_id in slots]
+        self._start_of = {patient_id: start for start, patient_id in slots}
+
+    def insert(self, patient_id, start):
+        if patient_id in self._start_of:
+            self.delete(patient_id)
+        if start is None:
+            return
+        i = bisect_right(self._starts, start)
+        self._starts.insert(i, start)
+        self._ids.insert(i, patient_id)
+        self._start_of[patient_id] = start
+
+    def delete(self, patient_id):
+        start = self._start_of.pop(patient_id, None)
+        if start is None:
+            return False
+        i = bisect_left(self._starts, start)
+        while self._ids[i] != patient_id:
+            i += 1
+        del self._starts[i]
+        del self._ids[i]
+        return True
+
+    def update(self, patient_id, start):
+        self.insert(patient_id, start)
+
+    def get(self, patient_id):
+        return self._start_of.get(patient_id)
+
+    def between(self, start, end):
+        """Ids of appointments starting in [start, end), earliest first."""
+        return self._ids[bisect_left(self._starts, start):bisect_left(self._starts, end)]
+
+    def overlapping(self, start, end=None, counts=None):
+        """Ids of appointments whose slot overlaps [start, end).
+
+        end defaults to one slot after start, i.e. the bookings a new
+        appointment at `start` would clash with. counts, if given, is
+        called with each id and picks the bookings that matter, e.g. those
+        at the same location.
+        """
+        if end is None:
+            end = start + self.length
+        # A slot overlaps if it starts before end and ends after start
+        first = bisect_right(self._starts, start - self.length)
+        ids = self._ids[first:bisect_left(self._starts, end)]
+        return ids if counts is None else [patient_id for patient_id in ids if counts(patient_id)]
+
+    def next_free(self, after, counts=None):
+        """Earliest start time at or after `after` that overlaps no booking
+        (of those picked by counts, as in overlapping())."""
+        candidate = after
+        i = bisect_right(self._starts, after - self.length)
+        while i < len(self._starts) and self._starts[i] < candidate + self.length:
+            if counts is None or counts(self._ids[i]):
+                candidate = max(candidate, self._starts[i] + self.length)
+            i += 1
+        return candidate
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __contains__(self, patient_id):
+        return patient_id in self._start_of
@@ -1,27 +1,50 @@
-from tkinter import Tk
+import sqlite3
+import sys
+from tkinter import Tk, Toplevel
 from ui.appointment import AppointmentWindow
 from ui.display import DisplayWindow
 from ui.management import ManagementWindow
-from db.database import init_db
-
-
-def main():
-    init_db()
+from db.database import init_db, close_connection
+from db.repository import PatientRepository
+from db import metrics
+from ui.debug_panel import DebugPanel
+
+
+def main(debug=False):
+    # --debug collects metrics and opens the debug panel
+    metrics.enable(debug)
+    try:
+        init_db()
+    except sqlite3.Error as e:
+        # The windows would fail on missing tables or columns
+        print(f"Cannot start: {e}")
+        close_connection()
+        return 1
+
+    # One repository shared by all windows, so each row is loaded once
+    repository = PatientRepository()
 
     # Create main windows
     root1 = Tk()
-    app1 = AppointmentWindow(root1)
+    app1 = AppointmentWindow(root1, repository)
 
     root2 = Tk()
-    app2 = DisplayWindow(root2)
+    app2 = DisplayWindow(root2, repository)
 
     root3 = Tk()
-    app3 = ManagementWindow(root3)
+    app3 = ManagementWindow(root3, repository)
+
+    if debug:
+        DebugPanel(Toplevel(root1))
 
     root1.mainloop()
     root2.mainloop()
     root3.mainloop()
 
+    # Lets the next start skip the full table scan
+    repository.save_snapshot()
+    close_connection()
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main(debug='--debug' in sys.argv[1:]))
\ No newline at end of file
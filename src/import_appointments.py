@@ -0,0 +1,42 @@
+import argparse
+import sqlite3
+import sys
+
+from db.database import init_db, close_connection
+from db.importer import import_appointments, read_csv, read_jsonl
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import appointments from CSV or JSONL")
+    parser.add_argument('path', help="file with one appointment per row/line")
+    parser.add_argument('--format', choices=('csv', 'jsonl'),
+                        help="input format (default: guessed from the file extension)")
+    parser.add_argument('--batch-size', type=int, default=5000,
+                        help="rows per transaction (default: 5000)")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ('jsonl' if args.path.endswith(('.jsonl', '.json')) else 'csv')
+    reader = read_jsonl if fmt == 'jsonl' else read_csv
+
+    try:
+        init_db()
+        imported, rejected, seconds = import_appointments(reader(args.path), args.batch_size)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Import failed: {e}")
+        return 1
+    finally:
+        close_connection()
+
+    for number, reason in rejected[:20]:
+        print(f"Skipped record {number}: {reason}")
+    if len(rejected) > 20:
+        print(f"... and {len(rejected) - 20} more skipped records")
+
+    rate = imported / seconds if seconds else 0
+    print(f"Imported {imported} appointments in {seconds:.2f}s ({rate:,.0f} rows/sec), "
+          f"skipped {len(rejected)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import random
+import unittest
+
+from ds.bst import PatientBST
+from ds.record import PatientRecord
+
+
+def record(patient_id):
+    return PatientRecord(patient_id, f"Patient {patient_id}", 30, 'F', 'Nairobi',
+                         '0712345678', '10:00', False, None)
+
+
+class PatientBSTTest(unittest.TestCase):
+    def check_invariants(self, tree, expected):
+        # Returns (height, size) of node after checking its subtree
+        def check(node, low, high):
+            if node is None:
+                return 0, 0
+            patient_id = node.patient['id']
+            self.assertTrue(low is None or patient_id > low)
+            self.assertTrue(high is None or patient_id < high)
+            left_height, left_size = check(node.left, low, patient_id)
+            right_height, right_size = check(node.right, patient_id, high)
+            self.assertLessEqual(abs(left_height - right_height), 1)
+            self.assertEqual(node.height, 1 + max(left_height, right_height))
+            self.assertEqual(node.size, 1 + left_size + right_size)
+            return node.height, node.size
+
+        check(tree.root, None, None)
+        self.assertEqual(len(tree), len(expected))
+        self.assertEqual([patient['id'] for patient in tree], sorted(expected))
+
+    def test_random_inserts_and_deletes_stay_balanced(self):
+        rng = random.Random(3)
+        tree = PatientBST(load=False)
+        expected = set()
+        for step in range(3000):
+            patient_id = rng.randrange(500)
+            if rng.random() < 0.4:
+                tree.delete(patient_id)
+                expected.discard(patient_id)
+            else:
+                tree.insert(record(patient_id))
+                expected.add(patient_id)
+            if step % 100 == 0:
+                self.check_invariants(tree, expected)
+        self.check_invariants(tree, expected)
+
+    def test_sequential_inserts_stay_balanced(self):
+        tree = PatientBST(load=False)
+        for patient_id in range(1, 1025):
+            tree.insert(record(patient_id))
+        self.check_invariants(tree, set(range(1, 1025)))
+        # The AVL bound is about 1.44 log2(n)
+        self.assertLessEqual(tree.height(), 15)
+
+    def test_delete_every_other_id(self):
+        tree = PatientBST(load=False)
+        tree.build_from_sorted([record(patient_id) for patient_id in range(200)])
+        for patient_id in range(0, 200, 2):
+            tree.delete(patient_id)
+        tree.delete(1000)
+        self.check_invariants(tree, set(range(1, 200, 2)))
+        self.assertIsNone(tree.search(10))
+        self.assertEqual(tree.search(11)['id'], 11)
+
+    def test_select_and_rank(self):
+        ids = sorted(random.Random(5).sample(range(10_000), 300))
+        tree = PatientBST(load=False)
+        for patient_id in random.Random(6).sample(ids, len(ids)):
+            tree.insert(record(patient_id))
+        for position, patient_id in enumerate(ids):
+            self.assertEqual(tree.select(position)['id'], patient_id)
+            self.assertEqual(tree.rank(patient_id), position)
+            # Ids not in the tree rank where they would be inserted
+            self.assertEqual(tree.rank(patient_id + 0.5), position + 1)
+        self.assertIsNone(tree.select(-1))
+        self.assertIsNone(tree.select(len(ids)))
+
+    def test_iter_from_and_range(self):
+        tree = PatientBST(load=False)
+        tree.build_from_sorted([record(patient_id) for patient_id in range(0, 100, 5)])
+        self.assertEqual([p['id'] for p in tree.iter_from(42)], list(range(45, 100, 5)))
+        self.assertEqual([p['id'] for p in tree.iter_from(45)], list(range(45, 100, 5)))
+        self.assertEqual(list(tree.iter_from(100)), [])
+        self.assertEqual([p['id'] for p in tree.range(10, 30)], [10, 15, 20, 25, 30])
+        self.assertEqual(tree.successor(42)['id'], 45)
+        self.assertEqual(tree.predecessor(45)['id'], 40)
+        self.assertIsNone(tree.successor(95))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import itertools
+import unittest
+
+from db import database
+from db.cache import QueryCache, query_cache
+from db.storage import MemoryEngine
+
+INSERT = """INSERT INTO appointments (name, age, gender, location, phone, scheduled_time,
+            is_emergency) VALUES (?, 30, 'F', 'Nairobi', '0712345678', '10:00', 0)"""
+BY_ID = "SELECT name FROM appointments WHERE id = ?"
+
+_names = itertools.count()
+
+
+class QueryCacheTest(unittest.TestCase):
+    def test_hit_returns_a_copy(self):
+        cache = QueryCache()
+        cache.put("SELECT id FROM appointments", (), [(1,)], cache.generation)
+        rows = cache.get("SELECT  id\n FROM appointments", ())
+        self.assertEqual(rows, [(1,)])
+        rows.append((2,))
+        self.assertEqual(cache.get("SELECT id FROM appointments", ()), [(1,)])
+        self.assertEqual((cache.hits, cache.misses), (2, 0))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = QueryCache(max_entries=2)
+        for query in ("SELECT 1 FROM a", "SELECT 2 FROM a"):
+            cache.put(query, (), [()], cache.generation)
+        cache.get("SELECT 1 FROM a", ())
+        cache.put("SELECT 3 FROM a", (), [()], cache.generation)
+        self.assertIsNotNone(cache.get("SELECT 1 FROM a", ()))
+        self.assertIsNone(cache.get("SELECT 2 FROM a", ()))
+        self.assertEqual(cache.evictions, 1)
+
+    def test_expired_entries_are_dropped(self):
+        cache = QueryCache(ttl=0)
+        cache.put("SELECT 1 FROM a", (), [()], cache.generation)
+        self.assertIsNone(cache.get("SELECT 1 FROM a", ()))
+        self.assertEqual(len(cache), 0)
+
+    def test_result_read_during_a_write_is_not_stored(self):
+        cache = QueryCache()
+        generation = cache.generation
+        cache.written("UPDATE appointments SET age = 1 WHERE id = ?", (1,))
+        cache.put("SELECT id FROM appointments", (), [(1,)], generation)
+        self.assertEqual(len(cache), 0)
+
+    def test_unknown_write_clears_everything(self):
+        cache = QueryCache()
+        cache.put("SELECT id FROM other", (), [(1,)], cache.generation)
+        cache.written("WITH x AS (SELECT 1) DELETE FROM other")
+        self.assertEqual(len(cache), 0)
+
+
+class CachedQueryTest(unittest.TestCase):
+    """Invalidation of fetch_query(..., cache=True) results by real writes."""
+
+    def setUp(self):
+        self.engine = MemoryEngine(f"cache_test_{next(_names)}")
+        database.set_engine(self.engine)
+        database.init_db()
+        query_cache.clear()
+        self.ids = [database.execute_query(INSERT.replace("?", f"'John {i}'", 1))
+                    for i in range(3)]
+
+    def tearDown(self):
+        database.close_connection()
+        query_cache.clear()
+
+    def search(self):
+        return database.search_appointments('john')
+
+    def lookup(self, patient_id):
+        return database.fetch_query(BY_ID, (patient_id,), cache=True)
+
+    def test_repeated_search_is_served_from_cache(self):
+        first = self.search()
+        hits = query_cache.hits
+        self.assertEqual(self.search(), first)
+        self.assertEqual(query_cache.hits, hits + 1)
+
+    def test_insert_drops_searches_but_keeps_id_lookups(self):
+        self.search()
+        before = self.lookup(self.ids[0])
+        new_id = database.execute_query(INSERT.replace("?", "'John New'", 1))
+        self.assertEqual(len(query_cache), 1)
+        self.assertEqual(self.lookup(self.ids[0]), before)
+        self.assertIn(new_id, [row[0] for row in self.search()])
+
+    def test_update_drops_lookups_of_that_id(self):
+        self.lookup(self.ids[0])
+        self.lookup(self.ids[1])
+        database.execute_query("UPDATE appointments SET name = 'Jane' WHERE id = ?",
+                               (self.ids[0],))
+        hits = query_cache.hits
+        self.assertEqual(self.lookup(self.ids[0]), [('Jane',)])
+        self.lookup(self.ids[1])
+        self.assertEqual(query_cache.hits, hits + 1)
+
+    def test_delete_drops_only_results_holding_the_row(self):
+        self.search()
+        database.search_appointments('nobody')
+        database.execute_query("DELETE FROM appointments WHERE id = ?", (self.ids[0],))
+        self.assertEqual(len(query_cache), 1)
+        self.assertEqual(database.search_appointments('nobody'), [])
+        self.assertNotIn(self.ids[0], [row[0] for row in self.search()])
+
+    def test_triage_writes_keep_searches(self):
+        self.search()
+        database.execute_query("DELETE FROM triage_queue WHERE appointment_id = ?", (0,))
+        self.assertEqual(len(query_cache), 1)
+
+    def test_transaction_invalidates_on_commit(self):
+        self.search()
+        with database.transaction():
+            database.execute_query("DELETE FROM appointments WHERE id = ?", (self.ids[0],))
+            # Other connections still see the old rows until the commit
+            self.assertEqual(len(query_cache), 1)
+        self.assertEqual(len(query_cache), 0)
+        self.assertEqual(len(self.search()), 2)
+
+    def test_rollback_keeps_entries(self):
+        self.search()
+        with self.assertRaises(KeyError):
+            with database.transaction():
+                database.execute_query("DELETE FROM appointments WHERE id = ?",
+                                       (self.ids[0],))
+                raise KeyError
+        self.assertEqual(len(query_cache), 1)
+        self.assertEqual(len(self.search()), 3)
+
+    def test_writes_from_other_connections_are_seen_in_the_change_log(self):
+        version = database.current_change_version()
+        self.search()
+        conn = self.engine.connect()
+        try:
+            conn.execute(INSERT.replace("?", "'John Elsewhere'", 1))
+        finally:
+            conn.close()
+        database.fetch_changes(version)
+        self.assertEqual(len(self.search()), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import itertools
+import unittest
+from unittest import mock
+
+from db import database, migrations
+from db.repository import PatientRepository
+from db.storage import MemoryEngine
+
+LIMIT = 5
+
+_names = itertools.count()
+
+
+class ChangeLogTest(unittest.TestCase):
+    def setUp(self):
+        database.set_engine(MemoryEngine(f"change_log_test_{next(_names)}"))
+        with mock.patch.object(migrations, 'CHANGE_LOG_LIMIT', LIMIT):
+            database.init_db()
+        self.writer = PatientRepository(snapshot_path='')
+        self.reader = PatientRepository(snapshot_path='')
+
+    def tearDown(self):
+        database.close_connection()
+
+    def add(self, count):
+        return [self.writer.add(f"Patient {i}", 30, 'F', 'Nairobi', '10:00', '0712345678')
+                for i in range(count)]
+
+    def log_size(self):
+        return database.fetch_query("SELECT COUNT(*) FROM appointment_changes")[0][0]
+
+    def test_log_is_capped(self):
+        self.add(3 * LIMIT)
+        self.assertEqual(self.log_size(), LIMIT)
+
+    def test_reader_within_the_log_gets_changes(self):
+        added = self.add(LIMIT - 1)
+        changes = self.reader.poll_changes()
+        self.assertEqual(changes, [('added', patient.id) for patient in added])
+
+    def test_reader_behind_the_log_reloads(self):
+        self.add(2 * LIMIT)
+        self.assertEqual(self.reader.poll_changes(), [('reloaded', None)])
+        self.assertEqual(self.reader.ids(), self.writer.ids())
+        # Polling carries on from the reloaded version
+        self.assertEqual(self.reader.poll_changes(), [])
+        added = self.add(1)
+        self.assertEqual(self.reader.poll_changes(), [('added', added[0].id)])
+
+
+if __name__ == '__main__':
+    unittest.main()
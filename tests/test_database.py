@@ -0,0 +1,103 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from db import database
+from db.migrations import SCHEMA_VERSION
+from db.storage import FileEngine
+
+INSERT = """INSERT INTO appointments (name, age, gender, location, phone, scheduled_time,
+            is_emergency) VALUES (?, 30, 'F', 'Nairobi', '0712345678', '10:00', 0)"""
+
+
+class TransactionTest(unittest.TestCase):
+    def setUp(self):
+        self.settings = dict(database.DB_SETTINGS)
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'test.db')
+        # Without WAL a reader's lock blocks a commit
+        database.configure_db(journal_mode='delete', busy_timeout=100)
+        database.set_engine(FileEngine(self.path))
+        database.init_db()
+
+    def tearDown(self):
+        database.close_connection()
+        database.DB_SETTINGS.clear()
+        database.DB_SETTINGS.update(self.settings)
+        self.directory.cleanup()
+
+    def count(self):
+        return database.fetch_query("SELECT COUNT(*) FROM appointments")[0][0]
+
+    def test_commit_and_rollback(self):
+        with database.transaction():
+            database.execute_query(INSERT, ('Ann',))
+        with self.assertRaises(KeyError):
+            with database.transaction():
+                database.execute_query(INSERT, ('Ben',))
+                raise KeyError
+        self.assertEqual(self.count(), 1)
+
+    def test_failed_commit_is_rolled_back(self):
+        reader = sqlite3.connect(self.path, isolation_level=None)
+        try:
+            reader.execute("BEGIN")
+            reader.execute("SELECT * FROM appointments").fetchall()
+            with self.assertRaises(sqlite3.OperationalError):
+                with database.transaction():
+                    database.execute_query(INSERT, ('Ann',))
+            self.assertFalse(database.get_connection().in_transaction)
+        finally:
+            reader.execute("ROLLBACK")
+            reader.close()
+
+        # The connection is usable again, and its writes are committed
+        with database.transaction():
+            database.execute_query(INSERT, ('Ben',))
+        database.execute_query(INSERT, ('Cat',))
+        other = sqlite3.connect(self.path)
+        try:
+            names = [name for (name,) in other.execute("SELECT name FROM appointments")]
+        finally:
+            other.close()
+        self.assertEqual(names, ['Ben', 'Cat'])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class InitDbTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'test.db')
+
+    def tearDown(self):
+        database.close_connection()
+        self.directory.cleanup()
+
+    def start_at(self, version):
+        conn = sqlite3.connect(self.path)
+        conn.execute(f"PRAGMA user_version = {version}")
+        conn.close()
+        database.set_engine(FileEngine(self.path))
+
+    def test_failed_migration_raises(self):
+        # The last migration needs tables this database does not have
+        self.start_at(SCHEMA_VERSION - 1)
+        with self.assertRaises(sqlite3.DatabaseError):
+            database.init_db()
+        # Not marked ready, so the next call migrates again
+        with self.assertRaises(sqlite3.DatabaseError):
+            database.init_db()
+
+    def test_newer_schema_raises(self):
+        self.start_at(SCHEMA_VERSION + 1)
+        with self.assertRaises(sqlite3.DatabaseError):
+            database.init_db()
+
+    def test_migrated_schema(self):
+        database.set_engine(FileEngine(self.path))
+        database.init_db()
+        self.assertEqual(database.fetch_query("PRAGMA user_version")[0][0], SCHEMA_VERSION)
@@ -0,0 +1,120 @@
+import random
+import unittest
+
+from ds.hash_index import (HashIndex, MultiHashIndex, PatientKeyIndex, MAX_LOAD, MIN_CAPACITY,
+                           normalize_phone)
+from ds.record import PatientRecord
+
+
+class HashIndexTest(unittest.TestCase):
+    def check_same(self, index, expected):
+        self.assertEqual(len(index), len(expected))
+        self.assertEqual(dict(index.items()), expected)
+        for key, value in expected.items():
+            self.assertEqual(index.get(key), value)
+            self.assertIn(key, index)
+
+    def test_matches_dict_under_churn(self):
+        rng = random.Random(7)
+        index = HashIndex()
+        expected = {}
+        resizing = 0
+        for step in range(20_000):
+            # A small key space, so keys are deleted and reinserted often
+            key = f"k{rng.randrange(600)}"
+            if rng.random() < 0.45:
+                self.assertEqual(index.pop(key), expected.pop(key, None))
+            else:
+                index.put(key, step)
+                expected[key] = step
+            if index._old is not None:
+                resizing += 1
+                # Keys in either table are found during the move
+                self.assertEqual(index.get(key), expected.get(key))
+            if step % 997 == 0:
+                self.check_same(index, expected)
+        self.check_same(index, expected)
+        self.assertGreater(resizing, 0)
+        self.assertEqual(index.get('missing', 'default'), 'default')
+
+    def test_growth_keeps_every_key(self):
+        index = HashIndex()
+        for i in range(5_000):
+            index.put(str(i), i)
+        self.check_same(index, {str(i): i for i in range(5_000)})
+        self.assertLessEqual(index.load_factor(), MAX_LOAD)
+
+    def test_deleted_slots_are_reused(self):
+        index = HashIndex()
+
+        def churn(rounds):
+            for _ in range(rounds):
+                for i in range(20):
+                    index.put(f"a{i}", i)
+                for i in range(20):
+                    index.pop(f"a{i}")
+
+        churn(5)
+        capacity = len(index._table)
+        churn(200)
+        # Tombstones are reused or dropped by same-size rebuilds, so churn
+        # over a fixed number of keys does not keep growing the table
+        self.assertEqual(len(index), 0)
+        self.assertEqual(len(index._table), capacity)
+        self.assertLessEqual(index._table.used, len(index._table) * MAX_LOAD)
+
+    def test_from_items_and_parts(self):
+        mapping = {f"key{i}": i for i in range(1_000)}
+        index = HashIndex.from_items('test', mapping)
+        self.check_same(index, mapping)
+        restored = HashIndex.from_parts('test', *[list(part) for part in index.parts()])
+        self.check_same(restored, mapping)
+        restored.put('new', -1)
+        self.assertEqual(restored.pop('key0'), 0)
+        self.assertEqual(restored.get('new'), -1)
+
+    def test_empty(self):
+        index = HashIndex()
+        self.assertEqual(len(index._table), MIN_CAPACITY)
+        self.assertIsNone(index.pop('x'))
+        self.assertEqual(list(index.items()), [])
+
+
+class MultiHashIndexTest(unittest.TestCase):
+    def test_buckets(self):
+        index = MultiHashIndex()
+        for value in (3, 1, 2):
+            index.add('k', value)
+        self.assertEqual(index.find('k'), [3, 1, 2])
+        index.discard('k', 1)
+        self.assertEqual(index.find('k'), [3, 2])
+        index.discard('k', 3)
+        index.discard('k', 2)
+        self.assertEqual(index.find('k'), [])
+        self.assertNotIn('k', index)
+
+
+def patient(patient_id, name, phone, location='Nairobi'):
+    return PatientRecord(patient_id, name, 30, 'F', location, phone, '10:00')
+
+
+class PatientKeyIndexTest(unittest.TestCase):
+    def test_phone_formats_match(self):
+        self.assertEqual(normalize_phone('+254 712 345 678'), normalize_phone('0712-345-678'))
+        index = PatientKeyIndex([patient(1, 'Ann', '0712345678')])
+        self.assertEqual(index.find('phone', '+254712345678'), [1])
+        self.assertEqual(index.find('name', '  ann '), [1])
+
+    def test_duplicates_follow_changes(self):
+        ann = patient(1, 'Ann', '0712345678')
+        index = PatientKeyIndex([ann, patient(2, 'Ann', '0700000000')])
+        self.assertEqual(index.duplicates('ANN', '712 345 678'), [1])
+        index.delete(ann)
+        ann.update({'phone': '0799999999'})
+        index.insert(ann)
+        self.assertEqual(index.duplicates('Ann', '0712345678'), [])
+        self.assertEqual(index.duplicates('Ann', '0799999999'), [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import itertools
+import json
+import os
+import tempfile
+import unittest
+
+from db import database
+from db.importer import import_appointments, read_csv, read_jsonl, record_to_params
+from db.storage import MemoryEngine
+
+VALID = {'name': 'Ann', 'age': '30', 'gender': 'F', 'location': 'Nairobi',
+         'time': '2026-10-18 10:00', 'phone': '0712345678'}
+
+_names = itertools.count()
+
+
+class RecordToParamsTest(unittest.TestCase):
+    def rejects(self, record, reason):
+        with self.assertRaises(ValueError) as caught:
+            record_to_params(record)
+        self.assertEqual(str(caught.exception), reason)
+
+    def test_valid_record(self):
+        params = record_to_params(dict(VALID, is_emergency='yes'))
+        self.assertEqual(params[:7], ('Ann', 30, 'F', 'Nairobi', '2026-10-18 10:00',
+                                      '0712345678', 1))
+        self.assertIsNotNone(params[7])
+
+    def test_scheduled_time_is_accepted_for_time(self):
+        record = dict(VALID)
+        record['scheduled_time'] = record.pop('time')
+        self.assertEqual(record_to_params(record)[4], '2026-10-18 10:00')
+
+    def test_rejections(self):
+        record = dict(VALID)
+        del record['phone']
+        self.rejects(record, "Please Fill Up All Boxes")
+        self.rejects(dict(VALID, name='  '), "Please Fill Up All Boxes")
+        self.rejects(dict(VALID, age='thirty'), "Age must be a number")
+        self.rejects(['Ann', 30], "Record is not a JSON object")
+        self.rejects(None, "Record is not a JSON object")
+
+
+class ImportTest(unittest.TestCase):
+    def setUp(self):
+        database.set_engine(MemoryEngine(f"importer_test_{next(_names)}"))
+        database.init_db()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        database.close_connection()
+        self.directory.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def test_jsonl_rejects_bad_lines_and_keeps_going(self):
+        lines = [json.dumps(VALID), '{not json', json.dumps([1, 2]), '',
+                 json.dumps(dict(VALID, age='x')), json.dumps(dict(VALID, name='Ben'))]
+        path = self.write('in.jsonl', '\n'.join(lines) + '\n')
+        imported, rejected, _ = import_appointments(read_jsonl(path), batch_size=2)
+        self.assertEqual(imported, 2)
+        # Blank lines are skipped without counting as records
+        self.assertEqual([number for number, _ in rejected], [2, 3, 4])
+        self.assertTrue(rejected[0][1].startswith("Invalid JSON"))
+        self.assertEqual(rejected[1][1], "Record is not a JSON object")
+        self.assertEqual(rejected[2][1], "Age must be a number")
+        names = database.fetch_query("SELECT name FROM appointments ORDER BY id")
+        self.assertEqual([name for (name,) in names], ['Ann', 'Ben'])
+
+    def test_csv_rejects_missing_fields(self):
+        path = self.write('in.csv', "name,age,gender,location,time,phone\n"
+                                    "Ann,30,F,Nairobi,10:00,0712345678\n"
+                                    "Ben,,M,Mombasa,11:00,0798765432\n"
+                                    "Cy,40,F,Kisumu\n")
+        imported, rejected, _ = import_appointments(read_csv(path))
+        self.assertEqual(imported, 1)
+        self.assertEqual(rejected, [(2, "Please Fill Up All Boxes"), (3, "Please Fill Up All Boxes")])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import random
+import unittest
+
+from ds.heap import IndexedHeap
+from ds.scheduler import AgingScheduler, StrictPriorityScheduler
+
+HOUR = 3600
+
+
+class IndexedHeapTest(unittest.TestCase):
+    def test_pops_in_rank_order_under_churn(self):
+        rng = random.Random(11)
+        heap = IndexedHeap()
+        expected = {}
+        for step in range(3000):
+            key = rng.randrange(200)
+            action = rng.random()
+            if key in expected and action < 0.3:
+                self.assertEqual(heap.remove(key), (key, expected.pop(key), None))
+            elif key in expected:
+                expected[key] = rng.random()
+                heap.update(key, expected[key])
+            else:
+                expected[key] = rng.random()
+                heap.push(key, expected[key], None)
+            self.assertEqual(len(heap), len(expected))
+            if expected:
+                smallest = min(expected, key=expected.get)
+                self.assertEqual(heap.peek(), (smallest, expected[smallest], None))
+        order = []
+        while heap:
+            order.append(heap.pop()[0])
+        self.assertEqual(order, sorted(expected, key=expected.get))
+        self.assertIsNone(heap.pop())
+
+    def test_push_twice_and_missing_keys(self):
+        heap = IndexedHeap()
+        heap.push('a', 1, 'value')
+        with self.assertRaises(KeyError):
+            heap.push('a', 2, 'value')
+        self.assertEqual(heap.get('a'), ('a', 1, 'value'))
+        self.assertIsNone(heap.get('b'))
+        self.assertIsNone(heap.remove('b'))
+
+
+class StrictPrioritySchedulerTest(unittest.TestCase):
+    def test_emergencies_first_then_arrival_order(self):
+        scheduler = StrictPriorityScheduler(levels=2)
+        scheduler.push('a', 0, 0, 'A')
+        scheduler.push('b', 1, 10, 'B')
+        scheduler.push('c', 0, 20, 'C')
+        scheduler.push('d', 1, 30, 'D')
+        order = [scheduler.pop(100)[0] for _ in range(4)]
+        self.assertEqual(order, ['b', 'd', 'a', 'c'])
+        self.assertIsNone(scheduler.pop(100))
+
+    def test_change_level_and_remove(self):
+        scheduler = StrictPriorityScheduler(levels=2)
+        scheduler.push('a', 0, 0, 'A')
+        scheduler.push('b', 0, 10, 'B')
+        scheduler.change_level('b', 1)
+        self.assertEqual(scheduler.peek(20), ('b', 1, 'B'))
+        self.assertEqual(scheduler.remove('b'), ('b', 1, 'B'))
+        self.assertEqual(scheduler.peek(20), ('a', 0, 'A'))
+
+
+class AgingSchedulerTest(unittest.TestCase):
+    def test_waiting_patients_are_promoted(self):
+        scheduler = AgingScheduler(levels=2, aging_interval=HOUR)
+        scheduler.push('regular', 0, 0, None)
+        scheduler.push('emergency', 1, HOUR / 2, None)
+        # Before an hour has passed the emergency goes first...
+        self.assertEqual(scheduler.peek(HOUR / 2)[0], 'emergency')
+        # ...after it, both are at the top level and the regular patient
+        # has waited longer
+        self.assertEqual(scheduler.peek(HOUR)[0], 'regular')
+        self.assertEqual([key for key, _, _ in scheduler.items(HOUR)], ['regular', 'emergency'])
+
+    def test_not_before_and_release(self):
+        scheduler = AgingScheduler(levels=2, aging_interval=HOUR)
+        scheduler.push('later', 0, 0, None, not_before=2 * HOUR)
+        scheduler.push('now', 0, 10, None)
+        self.assertEqual(scheduler.pop(HOUR)[0], 'now')
+        self.assertIsNone(scheduler.peek(HOUR))
+        # Pending patients are listed after the eligible ones
+        self.assertEqual(scheduler.items(HOUR), [('later', 0, None)])
+        scheduler.release('later', HOUR)
+        self.assertEqual(scheduler.peek(HOUR)[0], 'later')
+
+    def test_removed_and_moved_entries_are_skipped(self):
+        scheduler = AgingScheduler(levels=3, aging_interval=HOUR)
+        for n, key in enumerate('abcd'):
+            scheduler.push(key, 0, n, None)
+        scheduler.remove('a')
+        scheduler.change_level('c', 2)
+        scheduler.change_level('c', 1)
+        order = [scheduler.pop(10)[0] for _ in range(3)]
+        self.assertEqual(order, ['c', 'b', 'd'])
+        self.assertEqual(len(scheduler), 0)
+
+    def test_stale_entries_do_not_keep_old_places(self):
+        scheduler = AgingScheduler(levels=2, aging_interval=HOUR)
+        scheduler.push('a', 0, 0, None)
+        scheduler.push('b', 0, 10, None)
+        scheduler.push('c', 0, 20, None)
+        # Re-queued at the back, and promoted then demoted again
+        scheduler.remove('a')
+        scheduler.push('a', 0, 30, None)
+        scheduler.change_level('c', 1)
+        scheduler.change_level('c', 0)
+        self.assertEqual([scheduler.pop(40)[0] for _ in range(3)], ['b', 'c', 'a'])
+
+    def test_matches_items_order_under_churn(self):
+        rng = random.Random(13)
+        scheduler = AgingScheduler(levels=3, aging_interval=HOUR)
+        now = 0
+        for key in range(300):
+            now += rng.randrange(600)
+            scheduler.push(key, rng.randrange(3), now, None,
+                           not_before=now + HOUR if rng.random() < 0.2 else None)
+            if rng.random() < 0.2 and key > 0:
+                scheduler.remove(rng.randrange(key))
+            if rng.random() < 0.4:
+                expected = scheduler.items(now)
+                eligible = [key for key, _, _ in expected if scheduler._entries[key][4]]
+                top = scheduler.pop(now)
+                self.assertEqual(top is None, not eligible)
+                if top is not None:
+                    self.assertEqual(top[0], eligible[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import itertools
+import os
+import struct
+import tempfile
+import unittest
+from array import array
+
+from db import database, snapshot
+from db.repository import PatientRepository
+from db.snapshot import (read_snapshot, write_snapshot, pack_rows, unpack_rows, pack_name_index,
+                         unpack_name_index, pack_key_index, unpack_key_index)
+from db.storage import MemoryEngine
+from ds.hash_index import PatientKeyIndex
+from ds.name_index import PatientNameIndex
+from ds.record import PatientRecord
+
+SCHEMAS = ('main',)
+
+_names = itertools.count()
+
+
+def records():
+    return [PatientRecord(1, 'Ann Wanjiru', 30, 'F', 'Nairobi', '0712345678', '10:00', False,
+                          1_700_000_000.5),
+            PatientRecord(2, 'Otieno', 41, 'M', None, '+254 700 000 000', '11:00', True, None),
+            PatientRecord(5, 'Zoë Ämbe', 9, 'F', 'Kisumu', None, '', False, 0.0)]
+
+
+class SnapshotFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'test.idx')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        sections = {'ints': array('q', [1, -2, 2 ** 40]), 'floats': array('d', [0.5]),
+                    'blob': b'abc', 'empty': array('i')}
+        self.assertTrue(write_snapshot(self.path, 42, SCHEMAS, sections))
+        version, loaded = read_snapshot(self.path, SCHEMAS)
+        self.assertEqual(version, 42)
+        self.assertEqual(loaded, {'ints': [1, -2, 2 ** 40], 'floats': [0.5], 'blob': b'abc',
+                                  'empty': []})
+        self.assertFalse(os.path.exists(f"{self.path}.tmp"))
+
+    def test_versions_of_several_shards(self):
+        schemas = ('shard_a', 'shard_b')
+        write_snapshot(self.path, (3, 7), schemas, {'ids': array('q', [1])})
+        self.assertEqual(read_snapshot(self.path, schemas)[0], (3, 7))
+        # Another storage layout cannot use it
+        self.assertIsNone(read_snapshot(self.path, ('shard_a',)))
+
+    def test_rows_and_indexes_round_trip(self):
+        patients = records()
+        names = PatientNameIndex(patients)
+        keys = PatientKeyIndex(patients)
+        sections = pack_rows(patients)
+        sections.update(pack_name_index(names))
+        sections.update(pack_key_index(keys))
+        write_snapshot(self.path, 1, SCHEMAS, sections)
+        _, loaded = read_snapshot(self.path, SCHEMAS)
+
+        self.assertEqual(unpack_rows(loaded),
+                         [(p.id, p.name, p.phone, p.location, p.scheduled_at) for p in patients])
+        restored = unpack_name_index(loaded)
+        for query in ('ann', 'wanj', 'zo', 'tien', 'x'):
+            self.assertEqual(restored.prefix(query), names.prefix(query))
+            self.assertEqual(restored.substring(query), names.substring(query))
+        restored_keys = unpack_key_index(loaded)
+        self.assertEqual(restored_keys.find('phone', '0700 000 000'), [2])
+        self.assertEqual(restored_keys.duplicates('ann wanjiru', '712345678'), [1])
+        # The restored indexes keep working after changes
+        restored.insert(9, 'Annette')
+        restored_keys.insert(PatientRecord(9, 'Annette', phone='0712345678', location='Nairobi'))
+        self.assertIn(9, restored.prefix('ann'))
+        self.assertEqual(sorted(restored_keys.find('phone', '0712345678')), [1, 9])
+
+    def test_missing_file(self):
+        self.assertIsNone(read_snapshot(self.path, SCHEMAS))
+
+    def test_corrupted_files_are_ignored(self):
+        write_snapshot(self.path, 1, SCHEMAS, {'ids': array('q', range(100))})
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        for damaged in (data[:len(data) // 2], data[:10], b'', b'\xff' * len(data)):
+            with open(self.path, 'wb') as f:
+                f.write(damaged)
+            self.assertIsNone(read_snapshot(self.path, SCHEMAS))
+
+    def test_other_format_or_schema_version_is_ignored(self):
+        write_snapshot(self.path, 1, SCHEMAS, {'ids': array('q', [1])})
+        with open(self.path, 'rb') as f:
+            data = bytearray(f.read())
+        for field in (1, 2):
+            changed = bytearray(data)
+            header = list(snapshot._HEADER.unpack_from(changed))
+            header[field] += 1
+            struct.pack_into(snapshot._HEADER.format, changed, 0, *header)
+            with open(self.path, 'wb') as f:
+                f.write(changed)
+            self.assertIsNone(read_snapshot(self.path, SCHEMAS))
+
+    def test_long_section_name_is_refused(self):
+        with self.assertRaises(ValueError):
+            write_snapshot(self.path, 1, SCHEMAS, {'x' * 17: b''})
+
+
+class RepositorySnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'repository.idx')
+        self.use_new_database()
+
+    def tearDown(self):
+        database.close_connection()
+        self.directory.cleanup()
+
+    def use_new_database(self):
+        database.set_engine(MemoryEngine(f"snapshot_test_{next(_names)}"))
+        database.init_db()
+
+    def add(self, repository, name):
+        return repository.add(name, 30, 'F', 'Nairobi', '2030-01-01 10:00', '0712345678')
+
+    def test_changes_after_the_snapshot_are_replayed(self):
+        repository = PatientRepository(snapshot_path=self.path)
+        kept = self.add(repository, 'Ann')
+        removed = self.add(repository, 'Ben')
+        self.assertTrue(repository.save_snapshot())
+        renamed = dict(kept.to_dict(), name='Annie')
+        repository.update(kept.id, renamed)
+        repository.delete(removed.id)
+        added = self.add(repository, 'Cat')
+
+        restored = PatientRepository(snapshot_path=self.path)
+        self.assertEqual(restored.ids(), [kept.id, added.id])
+        self.assertEqual(restored.get(kept.id)['name'], 'Annie')
+        self.assertEqual(restored.get(kept.id)['age'], 30)
+        self.assertEqual([p.id for p in restored.type_ahead('ann', 10)], [kept.id])
+
+    def test_snapshot_ahead_of_the_database_is_rejected(self):
+        repository = PatientRepository(snapshot_path=self.path)
+        for name in ('Ann', 'Ben', 'Cat'):
+            self.add(repository, name)
+        repository.save_snapshot()
+
+        # As if the database had been restored from an older backup
+        self.use_new_database()
+        only = self.add(PatientRepository(snapshot_path=''), 'Dan')
+        restored = PatientRepository(snapshot_path=self.path)
+        self.assertEqual(restored.ids(), [only.id])
+        self.assertEqual(restored.get(only.id)['name'], 'Dan')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+from datetime import date, datetime
+
+from ds.timeslot import SLOT_LENGTH, TimeSlotIndex, parse_scheduled_time
+
+SLOT = SLOT_LENGTH
+
+
+class TimeSlotIndexTest(unittest.TestCase):
+    def setUp(self):
+        # Bookings at 0, 15 and 30 minutes, then a gap, then 90 minutes
+        self.slots = TimeSlotIndex([(1, 0), (2, SLOT), (3, 2 * SLOT), (4, 6 * SLOT),
+                                    (5, None)])
+
+    def test_overlapping(self):
+        self.assertEqual(self.slots.overlapping(0), [1])
+        self.assertEqual(self.slots.overlapping(SLOT / 2), [1, 2])
+        self.assertEqual(self.slots.overlapping(3 * SLOT), [])
+        self.assertEqual(self.slots.overlapping(0, 7 * SLOT), [1, 2, 3, 4])
+        self.assertEqual(self.slots.overlapping(0, counts=lambda patient_id: patient_id != 1), [])
+
+    def test_next_free_skips_back_to_back_bookings(self):
+        self.assertEqual(self.slots.next_free(0), 3 * SLOT)
+        self.assertEqual(self.slots.next_free(SLOT / 2), 3 * SLOT)
+        self.assertEqual(self.slots.next_free(3 * SLOT), 3 * SLOT)
+        # Not enough room before the 90 minute booking
+        self.assertEqual(self.slots.next_free(5.5 * SLOT), 7 * SLOT)
+        self.assertEqual(self.slots.next_free(100 * SLOT), 100 * SLOT)
+
+    def test_next_free_only_counts_picked_bookings(self):
+        # Patient 2 is elsewhere, so the 15 minute slot is free
+        self.assertEqual(self.slots.next_free(SLOT, counts=lambda patient_id: patient_id != 2), SLOT)
+
+    def test_next_free_is_not_overlapping(self):
+        for after in range(0, 8 * SLOT, SLOT // 5):
+            start = self.slots.next_free(after)
+            self.assertGreaterEqual(start, after)
+            self.assertEqual(self.slots.overlapping(start), [])
+
+    def test_insert_update_delete(self):
+        self.slots.update(1, 10 * SLOT)
+        self.assertEqual(self.slots.next_free(0), 0)
+        self.assertTrue(self.slots.delete(4))
+        self.assertFalse(self.slots.delete(4))
+        self.assertEqual(self.slots.between(0, 20 * SLOT), [2, 3, 1])
+        self.assertNotIn(5, self.slots)
+
+
+class ParseScheduledTimeTest(unittest.TestCase):
+    def test_formats(self):
+        expected = datetime(2026, 10, 18, 14, 30).timestamp()
+        for text in ('2026-10-18 14:30', '2026-10-18T14:30', '18/10/2026 14:30'):
+            self.assertEqual(parse_scheduled_time(text), expected)
+        today = date(2026, 10, 18)
+        self.assertEqual(parse_scheduled_time('2:30 pm', today=today), expected)
+        self.assertEqual(parse_scheduled_time(' 14:30 ', today=today), expected)
+
+    def test_rejected(self):
+        self.assertIsNone(parse_scheduled_time('soon'))
+        self.assertIsNone(parse_scheduled_time(''))
+        self.assertIsNone(parse_scheduled_time('14:30', require_date=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,16 +1,42 @@
 from tkinter import *
 import tkinter.messagebox
-from ds.queue import PatientQueue
-from db.database import init_db, execute_query
-import sqlite3
+from db.importer import validate_appointment
+from db.repository import PatientRepository
+from ds.timeslot import parse_scheduled_time
+from datetime import datetime
+from ui.worker import BackgroundExecutor
+
+def confirm_time_slot(repository, time, location, exclude=None):
+    """Warn if another patient at location is booked at time.
+
+    The check is against the in-memory slot index, so it is instant.
+    Returns False if the user chose not to go ahead.
+    """
+    scheduled_at = parse_scheduled_time(time)
+    if scheduled_at is None:
+        return True
+    taken = repository.conflicts(scheduled_at, location, exclude)
+    if not taken:
+        return True
+    free = datetime.fromtimestamp(repository.next_free_slot(scheduled_at, location, exclude))
+    return tkinter.messagebox.askyesno(
+        "Time Taken",
+        f"{taken[0]['name']} (ID: {taken[0]['id']}) is already booked at {location} "
+        f"at that time.\n"
+        f"Next free slot: {free:%Y-%m-%d %H:%M}\n"
+        f"Book this time anyway?")
+
 
 class AppointmentWindow:
-    def __init__(self, master):
+    def __init__(self, master, repository=None):
         self.master = master
-        self.patient_queue = PatientQueue()
+        self.repository = repository or PatientRepository()
+        self.patient_queue = self.repository.queue
+        self.executor = BackgroundExecutor(master)
+        # Changes are announced on the worker thread; redraw on the Tk thread
+        self.repository.subscribe(self.executor.ui_callback(self.on_patients_changed))
         self.create_widgets()
         self.update_logs()
-        init_db()
 
     def create_widgets(self):
         self.master.title("Hospital Appointment System")
@@ -40,6 +66,10 @@ class AppointmentWindow:
                           fg='white', bg='steelblue')
         self.logs.pack(pady=10)
 
+        self.next_btn = Button(self.right, text="Call Next Patient", width=20, height=2,
+                               bg='white', command=self.call_next_patient)
+        self.next_btn.pack(pady=10)
+
         self.box = Text(self.right, width=50, height=30, font=('arial 12'))
         scrollbar = Scrollbar(self.right, command=self.box.yview)
         self.box.config(yscrollcommand=scrollbar.set)
@@ -73,36 +103,54 @@ class AppointmentWindow:
 
     def add_appointment(self, is_emergency=False):
         values = [entry.get() for entry in self.entries]
-        if any(val == '' for val in values):
-            tkinter.messagebox.showinfo("Warning", "Please Fill Up All Boxes")
+        error = validate_appointment(values)
+        if error:
+            tkinter.messagebox.showinfo("Warning", error)
             return
 
         name, age, gender, location, time, phone = values
 
-        try:
-            int(age)
-        except ValueError:
-            tkinter.messagebox.showinfo("Error", "Age must be a number")
+        # Looked up in the in-memory key index, so it costs nothing to ask
+        existing = self.repository.duplicates(name, phone)
+        if existing and not tkinter.messagebox.askyesno(
+                "Possible Duplicate",
+                f"{existing[0]['name']} (ID: {existing[0]['id']}) is already registered "
+                f"with phone {existing[0]['phone']}.\n"
+                f"Book another appointment anyway?"):
             return
 
-        patient = self.patient_queue.add_patient(name, is_emergency)
+        # Emergencies are seen on arrival, so only bookings need a free slot
+        if not is_emergency and not confirm_time_slot(self.repository, time, location):
+            return
 
-        try:
-            sql = """INSERT INTO appointments 
-                     (name, age, gender, location, scheduled_time, phone, is_emergency) 
-                     VALUES(?, ?, ?, ?, ?, ?, ?)"""
-            execute_query(sql, (name, age, gender, location, time, phone, int(is_emergency)))
+        def saved(patient):
+            if patient is None:
+                tkinter.messagebox.showerror("Database Error", "Failed to save appointment")
+                return
 
             msg = f"Appointment for {name} has been created"
             if is_emergency:
                 msg += " (EMERGENCY CASE)"
             tkinter.messagebox.showinfo("Success", msg)
 
-            self.update_logs()
             self.clear_entries()
-        except sqlite3.Error as e:
+
+        def failed(e):
             tkinter.messagebox.showerror("Database Error", f"Failed to save appointment: {e}")
 
+        self.executor.submit(self.repository.add, name, age, gender, location, time, phone,
+                             is_emergency, on_done=saved, on_error=failed)
+
+    def call_next_patient(self):
+        self.executor.submit(self.repository.call_next_patient, on_done=self.show_next_patient)
+
+    def show_next_patient(self, patient):
+        if patient is None:
+            tkinter.messagebox.showinfo("Queue", "No patients are waiting")
+            return
+        tkinter.messagebox.showinfo("Next Patient", f"Please call {patient['name']} (ID: {patient['id']})")
+        self.update_logs()
+
     def clear_entries(self):
         for entry in self.entries:
             entry.delete(0, END)
@@ -111,22 +159,23 @@ class AppointmentWindow:
         self.box.delete(1.0, END)
 
         try:
-            from db.database import fetch_query
-            appointments = fetch_query("SELECT COUNT(*) FROM appointments")
-            total = appointments[0][0] if appointments else 0
-            self.box.insert(END, f"Total Appointments: {total}\n\n")
+            self.box.insert(END, f"Total Appointments: {len(self.repository)}\n\n")
 
             self.box.insert(END, "Current Queue Status:\n")
             self.box.insert(END, "=" * 30 + "\n\n")
 
+            status = self.repository.queue_status()
             self.box.insert(END, "Emergency Cases:\n")
             self.box.insert(END, "-" * 30 + "\n")
-            for priority, patient in self.patient_queue.priority_queue:
+            for patient in status['priority']:
                 self.box.insert(END, f"ID: {patient['id']} - {patient['name']}\n")
 
             self.box.insert(END, "\nRegular Cases:\n")
             self.box.insert(END, "-" * 30 + "\n")
-            for patient in self.patient_queue.regular_queue:
+            for patient in status['regular']:
                 self.box.insert(END, f"ID: {patient['id']} - {patient['name']}\n")
         except Exception as e:
-            self.box.insert(END, f"Error loading appointments: {e}")
\ No newline at end of file
+            self.box.insert(END, f"Error loading appointments: {e}")
+
+    def on_patients_changed(self, changes):
+        self.update_logs()
@@ -0,0 +1,96 @@
+from tkinter import *
+from tkinter import filedialog
+import tkinter.messagebox
+from datetime import datetime
+from db import metrics
+
+# Milliseconds between redraws of the panel
+REFRESH_INTERVAL = 1000
+
+
+class DebugPanel:
+    """Live view of the metrics and the most recent data structure operations."""
+
+    def __init__(self, master):
+        self.master = master
+        self.master.title("Debug Panel")
+        self.master.geometry("1000x700")
+        self.master.resizable(True, True)
+
+        self.create_widgets()
+        self.refresh()
+
+    def create_widgets(self):
+        controls = Frame(self.master, padx=10, pady=10)
+        controls.pack(fill=X)
+
+        self.enabled = IntVar(value=1 if metrics.enabled else 0)
+        Checkbutton(controls, text="Collect metrics", variable=self.enabled,
+                    command=lambda: metrics.enable(bool(self.enabled.get()))).pack(side=LEFT)
+
+        Button(controls, text="Reset", width=12,
+               command=self.reset).pack(side=LEFT, padx=10)
+        Button(controls, text="Export JSON", width=15,
+               command=lambda: self.export('json')).pack(side=LEFT, padx=10)
+        Button(controls, text="Export Prometheus", width=18,
+               command=lambda: self.export('prometheus')).pack(side=LEFT, padx=10)
+
+        panes = PanedWindow(self.master, orient=VERTICAL)
+        panes.pack(fill=BOTH, expand=True, padx=10, pady=10)
+
+        self.stats = Text(panes, height=18, font=('courier 10'))
+        self.operations = Text(panes, font=('courier 10'))
+        panes.add(self.stats)
+        panes.add(self.operations)
+
+    def refresh(self):
+        self.show_stats(metrics.snapshot())
+        self.show_operations(metrics.recent_operations())
+        self.master.after(REFRESH_INTERVAL, self.refresh)
+
+    def show_stats(self, data):
+        self.stats.delete(1.0, END)
+        if not data['enabled']:
+            self.stats.insert(END, "Metrics are off; tick 'Collect metrics' to start.\n\n")
+
+        for title, entries in (("Gauges", data['gauges']), ("Counters", data['counters'])):
+            self.stats.insert(END, f"{title}:\n")
+            for name, labels, value in entries:
+                self.stats.insert(END, f"  {_name(name, labels):<60}{value:>12}\n")
+            self.stats.insert(END, "\n")
+
+        self.stats.insert(END, "Histograms:" + " " * 52 + "count        mean\n")
+        for name, labels, histogram in data['histograms']:
+            mean = histogram['mean']
+            mean = f"{mean * 1000:.3f} ms" if name.endswith('_seconds') else f"{mean:.2f}"
+            self.stats.insert(END, f"  {_name(name, labels):<60}{histogram['count']:>7}"
+                                   f"{mean:>13}\n")
+
+    def show_operations(self, operations):
+        self.operations.delete(1.0, END)
+        self.operations.insert(END, "Recent operations (newest first):\n")
+        for when, thread, operation, detail in reversed(operations):
+            stamp = datetime.fromtimestamp(when).strftime('%H:%M:%S.%f')[:-3]
+            self.operations.insert(END, f"{stamp}  {thread:<14}{operation:<16}{detail}\n")
+
+    def reset(self):
+        metrics.reset()
+        self.show_stats(metrics.snapshot())
+        self.show_operations([])
+
+    def export(self, fmt):
+        extension = '.json' if fmt == 'json' else '.prom'
+        path = filedialog.asksaveasfilename(parent=self.master, defaultextension=extension,
+                                            initialfile=f"metrics{extension}")
+        if not path:
+            return
+        try:
+            metrics.dump(path, fmt)
+        except OSError as e:
+            tkinter.messagebox.showerror("Error", f"Failed to export metrics: {e}")
+
+
+def _name(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ', '.join(f"{key}={value}" for key, value in labels.items()) + '}'
@@ -1,14 +1,23 @@
 from tkinter import *
 import tkinter.messagebox
-from ds.hash_table import PatientHashTable
+from db.repository import PatientRepository
+from ds.record import is_loaded, load_records
+from ui.worker import BackgroundExecutor
 
 
 class DisplayWindow:
-    def __init__(self, master):
+    def __init__(self, master, repository=None):
         self.master = master
-        self.patient_hash = PatientHashTable()
-        self.refresh_data()
-        self.current_index = 0
+        self.repository = repository or PatientRepository()
+        self.executor = BackgroundExecutor(master)
+        self.repository.subscribe(self.executor.ui_callback(self.on_patients_changed))
+        # Id of the patient on screen. Neighbours are found through the
+        # ordered tree, so no list of all ids is kept
+        patient = self.repository.first()
+        self.current_id = patient['id'] if patient else None
+        # Bumped on every show_patient, so a record loaded after the user
+        # has moved on is not drawn
+        self._showing = 0
 
         self.master.title("Patient Display System")
         self.master.geometry("1366x768")
@@ -20,19 +29,26 @@ class DisplayWindow:
         # Set up periodic refresh
         self.master.after(1000, self.periodic_refresh)
 
-    def refresh_data(self):
-        """Refresh patient data from the database"""
-        self.patient_hash = PatientHashTable()
-        self.patients = self.patient_hash.get_all_patients()
+    def refresh_data(self, on_done=None, on_error=None):
+        """Apply database changes made outside this process, on the worker thread"""
+        self.executor.submit(self.repository.poll_changes, on_done=on_done, on_error=on_error)
 
     def periodic_refresh(self):
         """Check for updates every second"""
-        self.refresh_data()
-        # Only update display if current index would be out of bounds
-        if self.current_index >= len(self.patients) and len(self.patients) > 0:
-            self.current_index = len(self.patients) - 1
-            self.show_patient()
-        self.master.after(1000, self.periodic_refresh)
+        # Schedule the next check once this one is done, so a slow poll
+        # never piles up behind itself. A failed poll is retried on the
+        # next tick rather than stopping the refresh
+        def schedule(result):
+            self.master.after(1000, self.periodic_refresh)
+
+        def failed(error):
+            print(f"Failed to refresh patients: {error}")
+            schedule(None)
+
+        self.refresh_data(on_done=schedule, on_error=failed)
+
+    def on_patients_changed(self, changes):
+        self.show_patient()
 
     def create_widgets(self):
         self.main_frame = Frame(self.master, padx=20, pady=20)
@@ -42,6 +58,9 @@ class DisplayWindow:
                              font=('arial 36 bold'), fg='green')
         self.heading.pack(pady=20)
 
+        self.position_label = Label(self.main_frame, text="", font=('arial 16'))
+        self.position_label.pack()
+
         self.info_frame = Frame(self.main_frame)
         self.info_frame.pack(fill=BOTH, expand=True, pady=20)
 
@@ -74,6 +93,10 @@ class DisplayWindow:
                                  bg='orange', command=self.search_patient)
         self.search_btn.pack(side=LEFT, padx=20)
 
+        self.goto_btn = Button(self.button_frame, text="Go to Position", width=20, height=2,
+                               bg='orange', command=self.go_to_position)
+        self.goto_btn.pack(side=LEFT, padx=20)
+
         # Add refresh button
         self.refresh_btn = Button(self.button_frame, text="Refresh", width=15, height=2,
                                   bg='lightgreen', command=self.manual_refresh)
@@ -81,26 +104,51 @@ class DisplayWindow:
 
     def manual_refresh(self):
         """Manual refresh triggered by button"""
-        self.refresh_data()
-        if len(self.patients) > 0:
-            if self.current_index >= len(self.patients):
-                self.current_index = len(self.patients) - 1
-            self.show_patient()
-        else:
-            self.current_index = 0
+        def refreshed(changes):
             self.show_patient()
-        tkinter.messagebox.showinfo("Refreshed", "Patient data has been refreshed")
+            tkinter.messagebox.showinfo("Refreshed", "Patient data has been refreshed")
+
+        self.refresh_data(on_done=refreshed)
+
+    def current_patient(self):
+        """The patient on screen; if they were deleted, the next one along."""
+        patient = None
+        if self.current_id is not None:
+            patient = self.repository.get(self.current_id)
+            if patient is None:
+                patient = (self.repository.next_after(self.current_id, wrap=False)
+                           or self.repository.previous_before(self.current_id))
+        if patient is None:
+            patient = self.repository.first()
+        self.current_id = patient['id'] if patient else None
+        return patient
 
     def show_patient(self):
-        if not self.patients:
+        self._showing += 1
+        patient = self.current_patient()
+        if patient is None:
             for label in self.labels.values():
                 label.config(text="No patients found")
+            self.position_label.config(text="")
             return
+        if is_loaded(patient):
+            self.draw_patient(patient)
+            return
+
+        # A lazy record reads its row on first use; do that on the worker
+        showing = self._showing
+
+        def loaded(result):
+            if showing == self._showing:
+                self.draw_patient(patient)
 
-        if self.current_index >= len(self.patients):
-            self.current_index = 0
+        self.executor.submit(load_records, [patient], on_done=loaded)
 
-        patient = self.patients[self.current_index]
+    def draw_patient(self, patient):
+        # Both come from subtree sizes in the tree, so no list is built
+        self.position_label.config(
+            text=f"Patient {self.repository.position(patient['id']) + 1:,} "
+                 f"of {len(self.repository):,}")
 
         self.labels['id'].config(text=patient.get('id', 'N/A'))
         self.labels['name'].config(text=patient.get('name', 'N/A'))
@@ -116,23 +164,19 @@ class DisplayWindow:
         self.labels['emergency'].config(text=status, fg=color)
 
     def next_patient(self):
-        if not self.patients:
+        if self.current_id is None:
             return
-
-        if self.current_index < len(self.patients) - 1:
-            self.current_index += 1
-        else:
-            self.current_index = 0
+        patient = self.repository.next_after(self.current_id)
+        if patient is not None:
+            self.current_id = patient['id']
         self.show_patient()
 
     def prev_patient(self):
-        if not self.patients:
+        if self.current_id is None:
             return
-
-        if self.current_index > 0:
-            self.current_index -= 1
-        else:
-            self.current_index = len(self.patients) - 1
+        patient = self.repository.previous_before(self.current_id)
+        if patient is not None:
+            self.current_id = patient['id']
         self.show_patient()
 
     def search_patient(self):
@@ -147,17 +191,46 @@ class DisplayWindow:
         def search():
             try:
                 patient_id = int(id_entry.get())
-                self.refresh_data()  # Refresh before search
-                patient = self.patient_hash.get_patient(patient_id)
-                if patient:
-                    for i, p in enumerate(self.patients):
-                        if p.get('id') == patient_id:
-                            self.current_index = i
-                            self.show_patient()
-                            search_window.destroy()
-                            return
-                tkinter.messagebox.showerror("Error", "Patient ID not found")
             except ValueError:
                 tkinter.messagebox.showerror("Error", "Please enter a valid numeric ID")
+                return
+
+            def refreshed(changes):
+                # Hash lookup, so jumping to an id costs the same at any table size
+                if self.repository.get(patient_id):
+                    self.current_id = patient_id
+                    self.show_patient()
+                    search_window.destroy()
+                    return
+                tkinter.messagebox.showerror("Error", "Patient ID not found")
+
+            self.refresh_data(on_done=refreshed)  # Refresh before search
+
+        Button(search_window, text="Search", command=search).pack(pady=20)
+
+    def go_to_position(self):
+        goto_window = Toplevel(self.master)
+        goto_window.title("Go to Position")
+        goto_window.geometry("400x200")
+
+        Label(goto_window, text=f"Enter position (1 to {len(self.repository):,}):",
+              font=('arial 14')).pack(pady=20)
+        position_entry = Entry(goto_window, font=('arial 14'))
+        position_entry.pack()
+
+        def go():
+            try:
+                position = int(position_entry.get().replace(',', ''))
+            except ValueError:
+                tkinter.messagebox.showerror("Error", "Please enter a valid number")
+                return
+
+            patient = self.repository.patient_at(position - 1)
+            if patient is None:
+                tkinter.messagebox.showerror("Error", "No patient at that position")
+                return
+            self.current_id = patient['id']
+            self.show_patient()
+            goto_window.destroy()
 
-        Button(search_window, text="Search", command=search).pack(pady=20)
\ No newline at end of file
+        Button(goto_window, text="Go", command=go).pack(pady=20)
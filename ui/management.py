@@ -1,12 +1,26 @@
 from tkinter import *
 import tkinter.messagebox
-from ds.bst import PatientBST
-from db.database import execute_query, fetch_query
+from db.repository import PatientRepository
+from ds.hash_index import normalize_phone, PHONE_DIGITS
+from ds.record import load_records
+from ui.appointment import confirm_time_slot
+from ui.paged_list import PagedList, PAGE_SIZE
+from ui.worker import BackgroundExecutor
+
+# Most matches listed while typing in the search box
+TYPE_AHEAD_LIMIT = 25
 
 class ManagementWindow:
-    def __init__(self, master):
+    def __init__(self, master, repository=None):
         self.master = master
-        self.patient_bst = PatientBST()
+        self.repository = repository or PatientRepository()
+        self.patient_bst = self.repository.tree
+        self.executor = BackgroundExecutor(master)
+        # Bumped by every search and type-ahead, so results that arrive
+        # after a newer request are dropped
+        self._request = 0
+        # Text the last type-ahead ran for
+        self._typed = ''
 
         self.master.title("Patient Management System")
         self.master.geometry("1200x800")
@@ -30,6 +44,8 @@ class ManagementWindow:
 
         self.search_entry = Entry(search_frame, width=30, font=('arial 14'))
         self.search_entry.pack(side=LEFT, padx=10)
+        self.search_entry.bind('<KeyRelease>', self.type_ahead)
+        self.search_entry.bind('<Return>', lambda e: self.search_db())
 
         self.search = Button(search_frame, text="Search", width=12, height=1,
                              bg='steelblue', command=self.search_db)
@@ -38,8 +54,14 @@ class ManagementWindow:
         result_container = Frame(self.main_frame)
         result_container.pack(fill=BOTH, expand=True)
 
-        self.canvas = Canvas(result_container)
-        scrollbar = Scrollbar(result_container, orient="vertical", command=self.canvas.yview)
+        # Search results; the canvas below holds the edit form for one patient
+        self.results = PagedList(result_container, self.executor, on_select=self.show_patient)
+
+        self.form_container = Frame(result_container)
+        self.form_container.pack(fill=BOTH, expand=True)
+
+        self.canvas = Canvas(self.form_container)
+        scrollbar = Scrollbar(self.form_container, orient="vertical", command=self.canvas.yview)
         self.scrollable_frame = Frame(self.canvas)
 
         self.scrollable_frame.bind(
@@ -55,74 +77,109 @@ class ManagementWindow:
         self.canvas.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
 
-    def search_db(self):
+    def clear_results(self):
         for widget in self.scrollable_frame.winfo_children():
             widget.destroy()
+        self.results.clear()
+        self.results.pack_forget()
+        self.form_container.pack(fill=BOTH, expand=True)
+
+    def search_db(self):
+        self.clear_results()
 
         search_term = self.search_entry.get().strip()
         if not search_term:
             tkinter.messagebox.showinfo("Error", "Please enter a search term")
             return
 
-        try:
-            patient_id = int(search_term)
-            patient = self.patient_bst.search(patient_id)
-            if patient:
-                self.show_patient(patient)
-                return
-        except ValueError:
-            pass
+        # Full-text search fetches one page at a time
+        def fetch_page(after_id, limit):
+            return self.repository.search(search_term, after_id, limit)
 
-        patients = fetch_query("SELECT * FROM appointments WHERE name LIKE ?", (f"%{search_term}%",))
+        def lookup():
+            # Runs on the worker thread, as lazy records may need a read
+            try:
+                patient_id = int(search_term)
+            except ValueError:
+                pass
+            else:
+                with self.repository.lock:
+                    patient = self.patient_bst.search(patient_id)
+                if patient:
+                    load_records([patient])
+                    return None, [patient]
 
-        if not patients:
+            # Anything that reads as a phone number is looked up in memory
+            if len(normalize_phone(search_term)) == PHONE_DIGITS:
+                patients = self.repository.find('phone', search_term)
+                if patients:
+                    return None, patients
+
+            return fetch_page, fetch_page(0, PAGE_SIZE)
+
+        self._request += 1
+        request = self._request
+
+        def found(result):
+            if request == self._request:
+                self.show_search_results(*result)
+
+        self.executor.submit(lookup, on_done=found)
+
+    def show_search_results(self, fetch_page, first_page):
+        if not first_page:
             tkinter.messagebox.showinfo("Not Found", "No matching patients found")
             return
 
-        if len(patients) == 1:
-            patient = {
-                'id': patients[0][0],
-                'name': patients[0][1],
-                'age': patients[0][2],
-                'gender': patients[0][3],
-                'location': patients[0][4],
-                'phone': patients[0][5],
-                'time': patients[0][6],
-                'is_emergency': bool(patients[0][7]) if len(patients[0]) > 7 else False
-            }
-            self.show_patient(patient)
+        if len(first_page) == 1:
+            self.show_patient(first_page[0])
         else:
-            self.show_multiple_results(patients)
-
-    def show_multiple_results(self, patients):
-        Label(self.scrollable_frame, text="Multiple matches found. Select one:",
-              font=('arial 16 bold')).pack(pady=10)
-
-        for patient in patients:
-            frame = Frame(self.scrollable_frame, bd=2, relief=GROOVE)
-            frame.pack(fill=X, padx=10, pady=5)
-
-            text = f"ID: {patient[0]} - {patient[1]} (Age: {patient[2]}, {patient[3]})"
-            text += f" - Appointment: {patient[6]}"
-            if len(patient) > 7 and patient[7]:
-                text += " (EMERGENCY)"
-
-            btn = Button(frame, text=text, width=100, anchor='w',
-                         command=lambda p=patient: self.show_patient({
-                             'id': p[0],
-                             'name': p[1],
-                             'age': p[2],
-                             'gender': p[3],
-                             'location': p[4],
-                             'phone': p[5],
-                             'time': p[6],
-                             'is_emergency': bool(p[7]) if len(p) > 7 else False
-                         }))
-            btn.pack()
+            self.show_multiple_results(first_page, fetch_page=fetch_page)
+
+    def type_ahead(self, event=None):
+        """List name matches from the in-memory index as the user types"""
+        # Return runs search_db, and arrows, Shift and the like change
+        # nothing; updating the list then would clear the search results
+        if event is not None and event.keysym in ('Return', 'KP_Enter'):
+            return
+        search_term = self.search_entry.get().strip()
+        if search_term == self._typed:
+            return
+        self._typed = search_term
+        if search_term.isdigit():
+            return
+
+        self._request += 1
+        request = self._request
+        self.clear_results()
+        if not search_term:
+            return
+
+        def matched(patients):
+            if request != self._request:
+                return
+            if patients:
+                self.show_multiple_results(patients, "Matching patients:")
+            else:
+                Label(self.scrollable_frame, text="No matching patients",
+                      font=('arial 16 bold')).pack(pady=10)
+
+        # On the worker, where the matches' rows are read in one query
+        self.executor.submit(self.repository.type_ahead, search_term, TYPE_AHEAD_LIMIT,
+                             on_done=matched)
+
+    def show_multiple_results(self, patients, heading="Multiple matches found. Select one:",
+                              fetch_page=None):
+        """List patients; with fetch_page, more pages load as the list is scrolled"""
+        self.form_container.pack_forget()
+        self.results.pack(fill=BOTH, expand=True)
+        if fetch_page is None:
+            self.results.show(patients, heading)
+        else:
+            self.results.load(fetch_page, patients, heading)
 
     def show_patient(self, patient):
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
+        self.clear_results()
 
         fields = [
             ("Patient ID", 'id', False),
@@ -186,36 +243,37 @@ class ManagementWindow:
             tkinter.messagebox.showinfo("Error", "Age must be a number")
             return
 
-        try:
-            query = """UPDATE appointments SET 
-                       name=?, age=?, gender=?, location=?, 
-                       phone=?, scheduled_time=?, is_emergency=?
-                       WHERE id=?"""
-            execute_query(query, (
-                updated_values['name'],
-                updated_values['age'],
-                updated_values['gender'],
-                updated_values['location'],
-                updated_values['phone'],
-                updated_values['time'],
-                int(updated_values['is_emergency']),
-                patient_id
-            ))
+        # Only a new time or location can clash with another booking
+        patient = self.repository.get(patient_id)
+        moved = patient is None or (updated_values['time'] != patient['time']
+                                    or updated_values['location'] != patient['location'])
+        if moved and not updated_values['is_emergency'] and not confirm_time_slot(
+                self.repository, updated_values['time'], updated_values['location'],
+                exclude=patient_id):
+            return
 
+        def updated(ok):
+            if not ok:
+                tkinter.messagebox.showerror("Error", "Failed to update patient record")
+                return
             tkinter.messagebox.showinfo("Updated", "Successfully Updated.")
-            self.patient_bst = PatientBST()
-        except Exception as e:
-            tkinter.messagebox.showerror("Error", f"Failed to update: {str(e)}")
+
+        self.executor.submit(
+            self.repository.update, patient_id, updated_values, on_done=updated,
+            on_error=lambda e: tkinter.messagebox.showerror("Error", f"Failed to update: {str(e)}"))
 
     def delete_db(self, patient_id):
         if not tkinter.messagebox.askyesno("Confirm", "Delete this patient record?"):
             return
 
-        try:
-            execute_query("DELETE FROM appointments WHERE id=?", (patient_id,))
+        def deleted(ok):
+            if not ok:
+                tkinter.messagebox.showerror("Error", "Failed to delete patient record")
+                return
+
             tkinter.messagebox.showinfo("Success", "Deleted Successfully")
-            self.patient_bst = PatientBST()
-            for widget in self.scrollable_frame.winfo_children():
-                widget.destroy()
-        except Exception as e:
-            tkinter.messagebox.showerror("Error", f"Failed to delete: {str(e)}")
\ No newline at end of file
+            self.clear_results()
+
+        self.executor.submit(
+            self.repository.delete, patient_id, on_done=deleted,
+            on_error=lambda e: tkinter.messagebox.showerror("Error", f"Failed to delete: {str(e)}"))
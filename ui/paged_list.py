@@ -0,0 +1,112 @@
+from tkinter import *
+
+# Rows fetched per query, and how far down the list (as a fraction of
+# what is loaded) the user scrolls before the next page is requested
+PAGE_SIZE = 100
+LOAD_AHEAD = 0.8
+
+
+def describe_patient(patient):
+    text = f"ID: {patient['id']} - {patient['name']} (Age: {patient['age']}, {patient['gender']})"
+    text += f" - Appointment: {patient['time']}"
+    if patient['is_emergency']:
+        text += " (EMERGENCY)"
+    return text
+
+
+class PagedList(Frame):
+    """Scrolling list of patients that loads its rows a page at a time.
+
+    A Listbox only draws the rows that are on screen, so one widget holds
+    the whole result instead of a Frame and Button per row. Pages come
+    from fetch_page(after_id, limit), which should return up to limit
+    records with ids greater than after_id in id order; the next page is
+    fetched on the worker thread when the user scrolls near the end of
+    what is loaded. Double-clicking or pressing Return on a row calls
+    on_select with its record.
+    """
+
+    def __init__(self, master, executor, on_select, page_size=PAGE_SIZE):
+        super().__init__(master)
+        self.executor = executor
+        self.on_select = on_select
+        self.page_size = page_size
+        self.records = []
+        self._fetch_page = None
+        self._more = False
+        self._loading = False
+        # Bumped on every new result set so late pages of an old search are dropped
+        self._generation = 0
+
+        self.heading = Label(self, text="", font=('arial 16 bold'))
+        self.heading.pack(pady=10)
+
+        self.listbox = Listbox(self, font=('arial 12'), activestyle='none')
+        scrollbar = Scrollbar(self, orient="vertical", command=self.listbox.yview)
+        self.scrollbar = scrollbar
+        self.listbox.config(yscrollcommand=self._on_scroll)
+
+        self.listbox.pack(side=LEFT, fill=BOTH, expand=True)
+        scrollbar.pack(side=RIGHT, fill=Y)
+
+        self.listbox.bind('<Double-Button-1>', self._select)
+        self.listbox.bind('<Return>', self._select)
+
+    def load(self, fetch_page, first_page, heading=""):
+        """Show first_page and fetch the rest on demand with fetch_page."""
+        self._reset(heading)
+        self._fetch_page = fetch_page
+        self._append(first_page)
+        self._more = len(first_page) >= self.page_size
+
+    def show(self, records, heading=""):
+        """Show a fixed, already complete list of records."""
+        self._reset(heading)
+        self._append(records)
+
+    def clear(self):
+        self._reset("")
+
+    def _reset(self, heading):
+        self._generation += 1
+        self._fetch_page = None
+        self._more = False
+        self._loading = False
+        self.records = []
+        self.listbox.delete(0, END)
+        self.heading.config(text=heading)
+
+    def _append(self, records):
+        self.records.extend(records)
+        self.listbox.insert(END, *[describe_patient(patient) for patient in records])
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self._more and not self._loading and float(last) >= LOAD_AHEAD:
+            self._load_next()
+
+    def _load_next(self):
+        self._loading = True
+        generation = self._generation
+        after_id = self.records[-1]['id'] if self.records else 0
+
+        def loaded(page):
+            if generation != self._generation:
+                return
+            self._loading = False
+            self._more = len(page) >= self.page_size
+            self._append(page)
+
+        def failed(error):
+            if generation == self._generation:
+                self._loading = False
+                self._more = False
+            print(f"Failed to load more results: {error}")
+
+        self.executor.submit(self._fetch_page, after_id, self.page_size,
+                             on_done=loaded, on_error=failed)
+
+    def _select(self, event=None):
+        selection = self.listbox.curselection()
+        if selection:
+            self.on_select(self.records[selection[0]])
@@ -0,0 +1,66 @@
+import queue
+import threading
+import tkinter.messagebox
+from concurrent.futures import ThreadPoolExecutor
+
+# Milliseconds between checks for results waiting to be handed to Tk
+POLL_INTERVAL = 30
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _shared_pool():
+    # One worker thread for every window, so database writes and index
+    # updates are never run concurrently with each other
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-worker')
+        return _pool
+
+
+class BackgroundExecutor:
+    """Runs database and index work off the Tk event thread.
+
+    submit() runs a job on the shared worker thread; when it finishes,
+    on_done (or on_error) is called on the Tk thread. Results are passed
+    through a queue that the Tk thread drains every POLL_INTERVAL ms with
+    master.after, because Tk widgets must never be touched from another
+    thread.
+    """
+
+    def __init__(self, master):
+        self.master = master
+        self._results = queue.SimpleQueue()
+        self.master.after(POLL_INTERVAL, self._poll)
+
+    def submit(self, func, *args, on_done=None, on_error=None):
+        future = _shared_pool().submit(func, *args)
+        future.add_done_callback(
+            lambda f: self._results.put(lambda: self._finish(f, on_done, on_error)))
+
+    def ui_callback(self, func):
+        """Wrap func so that calling it from any thread runs it on the Tk thread."""
+        def callback(*args):
+            self._results.put(lambda: func(*args))
+        return callback
+
+    def _finish(self, future, on_done, on_error):
+        error = future.exception()
+        if error is not None:
+            if on_error is not None:
+                on_error(error)
+            else:
+                tkinter.messagebox.showerror("Error", str(error))
+        elif on_done is not None:
+            on_done(future.result())
+
+    def _poll(self):
+        while True:
+            try:
+                callback = self._results.get_nowait()
+            except queue.Empty:
+                break
+            callback()
+        self.master.after(POLL_INTERVAL, self._poll)